@@ -0,0 +1,64 @@
+"""
+Compare per-instruction pulse command encoding (cg.pulse_cmd, concatenating bytes
+as SingleCoreAssembler used to) with the batch encoder (cg.pulse_cmds) on a long
+(default 10k instruction) program:
+
+    python benchmarks/cmd_encoding.py --n-cmds 10000
+"""
+import time
+import argparse
+import numpy as np
+import distproc.command_gen as cg
+
+
+def get_pulse_args(n_cmds, rng):
+    pulse_args = []
+    for i in range(n_cmds):
+        pulseargs = {'freq_word': int(rng.integers(2**9)), 'phase_word': int(rng.integers(2**17)), 
+                     'amp_word': int(rng.integers(2**16)), 'env_word': int(rng.integers(2**24)), 
+                     'cfg_word': int(rng.integers(3)), 'cmd_time': 10*i}
+        if i % 10 == 0:
+            del pulseargs['phase_word']
+            pulseargs['phase_regaddr'] = int(rng.integers(16))
+        pulse_args.append(pulseargs)
+    return pulse_args
+
+
+def encode_loop(pulse_args):
+    cmd_buf = bytes()
+    for pulseargs in pulse_args:
+        cmd_buf += cg.pulse_cmd(**pulseargs).to_bytes(16, 'little')
+    return cmd_buf
+
+
+def encode_batch(pulse_args):
+    args = np.array([tuple(pulseargs.get(name, -1) for name in cg.pulse_cmd_dtype.names) 
+                     for pulseargs in pulse_args], dtype=cg.pulse_cmd_dtype)
+    return cg.pulse_cmds(args).tobytes()
+
+
+def timeit(fn, n_iters):
+    times = []
+    for i in range(n_iters):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-cmds', type=int, default=10000)
+    parser.add_argument('--n-iters', type=int, default=3)
+    args = parser.parse_args()
+
+    pulse_args = get_pulse_args(args.n_cmds, np.random.default_rng(0))
+
+    t_loop, loop_buf = timeit(lambda: encode_loop(pulse_args), args.n_iters)
+    t_batch, batch_buf = timeit(lambda: encode_batch(pulse_args), args.n_iters)
+    assert loop_buf == batch_buf
+
+    print('{} pulse commands (best of {}):'.format(args.n_cmds, args.n_iters))
+    print('pulse_cmd + bytes concat:      {:8.1f} ms'.format(1.e3*t_loop))
+    print('pulse_cmds (incl. arg array):  {:8.1f} ms'.format(1.e3*t_batch))
+    print('speedup:                       {:8.1f}x'.format(t_loop/t_batch))
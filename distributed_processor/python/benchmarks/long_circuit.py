@@ -0,0 +1,98 @@
+"""
+Time each compiler/assembler stage on a long (default 10k gate) circuit, 
+using the qchip/channel configs from the distproc tests:
+
+    python benchmarks/long_circuit.py --n-gates 10000
+"""
+import os
+import time
+import argparse
+import numpy as np
+import distproc.compiler as cm
+import distproc.assembler as am
+import distproc.hwconfig as hw
+import qubitconfig.qchip as qc
+
+TEST_DIR = os.path.join(os.path.dirname(__file__), '..', 'test')
+FPGA_CONFIG = {'alu_instr_clks': 2,
+               'fpga_clk_period': 2.e-9,
+               'jump_cond_clks': 3,
+               'jump_fproc_clks': 4,
+               'pulse_regwrite_clks': 1}
+
+
+class ElementConfigBench(hw.ElementConfig):
+    def __init__(self, samples_per_clk, interp_ratio):
+        super().__init__(2.e-9, samples_per_clk)
+
+    def get_phase_word(self, phase):
+        return int(((phase % (2*np.pi))/(2*np.pi) * 2**17))
+
+    def get_env_word(self, env_start_ind, env_length):
+        return env_start_ind
+
+    def get_env_buffer(self, env):
+        return np.arange(16)
+
+    def get_freq_buffer(self, freqs):
+        return np.asarray([[int(freq/1.e3), 1] for freq in freqs]).flatten()
+
+    def get_freq_addr(self, freq_ind):
+        return freq_ind
+
+    def get_amp_word(self, amplitude):
+        return int(amplitude*(2**15 - 1))
+
+    def length_nclks(self, tlength):
+        return int(np.ceil(tlength/self.fpga_clk_period))
+
+    def get_cfg_word(self, elem_ind, mode_bits):
+        return elem_ind
+
+
+def get_program(n_gates):
+    gates = [{'name': 'X90', 'qubit': ['Q0']},
+             {'name': 'virtualz', 'qubit': ['Q0'], 'phase': 0.1},
+             {'name': 'X90', 'qubit': ['Q1']},
+             {'name': 'Y-90', 'qubit': ['Q1']},
+             {'name': 'X90Z90', 'qubit': ['Q0']}]
+    program = [dict(gates[i % len(gates)]) for i in range(n_gates)]
+    program.extend([{'name': 'read', 'qubit': ['Q0']}, {'name': 'read', 'qubit': ['Q1']}])
+    return program
+
+
+def timeit(fn, n_iters):
+    times = []
+    for i in range(n_iters):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-gates', type=int, default=10000)
+    parser.add_argument('--n-iters', type=int, default=3)
+    args = parser.parse_args()
+
+    qchip = qc.QChip(os.path.join(TEST_DIR, 'qubitcfg.json'))
+    channel_configs = hw.load_channel_configs(os.path.join(TEST_DIR, 'channel_config.json'))
+    fpga_config = hw.FPGAConfig(**FPGA_CONFIG)
+    program = get_program(args.n_gates)
+
+    t_ir, _ = timeit(lambda: cm.generate_ir_program(program), args.n_iters)
+    t_init, _ = timeit(lambda: cm.Compiler(program, 'by_qubit', fpga_config, qchip), args.n_iters)
+    t_compile, compiled_prog = timeit(lambda: cm.Compiler(program, 'by_qubit', fpga_config, qchip).compile(), 
+                                      args.n_iters)
+    t_asm_init, globalasm = timeit(lambda: am.GlobalAssembler(compiled_prog, channel_configs, ElementConfigBench), 
+                                   args.n_iters)
+    t_asm, _ = timeit(globalasm.get_assembled_program, args.n_iters)
+
+    print('{} gate circuit (best of {}):'.format(args.n_gates, args.n_iters))
+    print('generate_ir_program:           {:8.1f} ms'.format(1.e3*t_ir))
+    print('Compiler.__init__:             {:8.1f} ms'.format(1.e3*t_init))
+    print('Compiler (init + compile):     {:8.1f} ms'.format(1.e3*t_compile))
+    print('GlobalAssembler.__init__:      {:8.1f} ms'.format(1.e3*t_asm_init))
+    print('get_assembled_program:         {:8.1f} ms'.format(1.e3*t_asm))
+    print('total:                         {:8.1f} ms'.format(1.e3*(t_compile + t_asm_init + t_asm)))
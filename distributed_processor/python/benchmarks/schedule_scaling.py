@@ -0,0 +1,57 @@
+"""
+Measure how Compiler.schedule scales with the number of basic blocks, using
+circuits made of many branches (and loops) on two qubits. Uses the qchip
+config from the distproc tests:
+
+    python benchmarks/schedule_scaling.py --n-branches 250 500 1000 2000
+"""
+import os
+import time
+import argparse
+import distproc.compiler as cm
+import distproc.hwconfig as hw
+import qubitconfig.qchip as qc
+
+TEST_DIR = os.path.join(os.path.dirname(__file__), '..', 'test')
+FPGA_CONFIG = {'alu_instr_clks': 2,
+               'fpga_clk_period': 2.e-9,
+               'jump_cond_clks': 3,
+               'jump_fproc_clks': 4,
+               'pulse_regwrite_clks': 1}
+
+
+def get_program(n_branches, loop_every=10):
+    """
+    Circuit with n_branches branch_fproc statements (alternating between single qubit 
+    and two qubit scope), with a loop every loop_every branches
+    """
+    program = [{'name': 'declare', 'var': 'loopind', 'dtype': 'int', 'scope': ['Q0']}]
+    for i in range(n_branches):
+        scope = [['Q0'], ['Q1'], ['Q0', 'Q1']][i % 3]
+        program.append({'name': 'branch_fproc', 'alu_cond': 'eq', 'cond_lhs': 1, 'func_id': i % 2, 'scope': scope,
+                        'true': [{'name': 'X90', 'qubit': [scope[0]]}],
+                        'false': [{'name': 'X90', 'qubit': [scope[-1]]}]})
+        if i % loop_every == loop_every - 1:
+            program.append({'name': 'loop', 'cond_lhs': 10, 'cond_rhs': 'loopind', 'alu_cond': 'ge', 
+                            'scope': ['Q0'], 'body': [{'name': 'X90', 'qubit': ['Q0']}]})
+        program.append({'name': 'X90', 'qubit': ['Q1']})
+    program.extend([{'name': 'read', 'qubit': ['Q0']}, {'name': 'read', 'qubit': ['Q1']}])
+    return program
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-branches', type=int, nargs='+', default=[250, 500, 1000, 2000])
+    args = parser.parse_args()
+
+    qchip = qc.QChip(os.path.join(TEST_DIR, 'qubitcfg.json'))
+    fpga_config = hw.FPGAConfig(**FPGA_CONFIG)
+
+    print('{:>10} {:>14} {:>14} {:>16}'.format('branches', 'basic blocks', 'schedule (s)', 'us/basic block'))
+    for n_branches in args.n_branches:
+        compiler = cm.Compiler(get_program(n_branches), 'by_qubit', fpga_config, qchip)
+        t0 = time.perf_counter()
+        compiler.schedule()
+        t_schedule = time.perf_counter() - t0
+        n_blocks = len(compiler._basic_blocks)
+        print('{:>10} {:>14} {:>14.3f} {:>16.1f}'.format(n_branches, n_blocks, t_schedule, 1.e6*t_schedule/n_blocks))
@@ -69,6 +69,9 @@ class SingleCoreAssembler:
 
     Attributes
     ----------
+        pack_envs : bool
+            if True, envelope buffers are packed to reuse runs of identical samples
+            (see _get_env_buffer); exact duplicates are always merged
         _regs : dict
             key: user-declared register name
             value: dictionary containing:
@@ -78,8 +81,9 @@ class SingleCoreAssembler:
                     ('phase', elemind)
                     ('amp', elemind)
     """
-    def __init__(self, elem_cfgs):
+    def __init__(self, elem_cfgs, pack_envs=False):
         self.n_element = len(elem_cfgs)
+        self.pack_envs = pack_envs
         self._env_dicts = [OrderedDict() for i in range(self.n_element)] #map names to envelope
         self._freq_lists = [[] for i in range(self.n_element)] #map inds to freq
         self._program = []
@@ -87,16 +91,23 @@ class SingleCoreAssembler:
         self._elem_cfgs = elem_cfgs
 
     def from_list(self, cmd_list):
-        for i, cmd in enumerate(cmd_list):
+        label = None # label from the preceding jump_label, applied to the next command
+        for cmd in cmd_list:
+            if cmd['op'] == 'jump_label':
+                label = cmd['dest_label']
+                continue
             cmdargs = cmd.copy()
             del cmdargs['op']
+            if label is not None:
+                cmdargs['label'] = label
+                label = None
             if cmd['op'] == 'pulse':
                 nreg_params = np.sum([isinstance(cmd[key], str) for key in ['freq', 'amp', 'phase']])
                 if nreg_params > 1:
                     warnings.warn('{} will be split into multiple instructions, which may cause timing problems'.format(cmd))
                 self.add_pulse(**cmdargs)
             elif cmd['op'] in ['reg_alu', 'jump_cond', 'alu_fproc', 'jump_fproc']:
-                self.add_alu_cmd(**cmd)
+                self.add_alu_cmd(cmd['op'], **cmdargs)
             elif cmd['op'] == 'reg_write':
                 self.add_reg_write(**cmdargs)
             elif cmd['op'] == 'phase_reset':
@@ -109,8 +120,6 @@ class SingleCoreAssembler:
                 self.declare_reg(**cmdargs)
             elif cmd['op'] == 'inc_qclk':
                 self.add_inc_qclk(**cmdargs)
-            elif cmd['op'] == 'jump_label':
-                cmd_list[i + 1]['label'] = cmdargs['dest_label']
             elif cmd['op'] == 'jump_i':
                 self.add_jump_i(**cmdargs)
             else:
@@ -324,50 +333,120 @@ class SingleCoreAssembler:
             cmd['label'] = label
         self._program.append(cmd)
 
-    def get_compiled_program(self):
-        # consider splitting this into a few different functions
-        # at top case level
-        cmd_buf = bytes()
-        freq_list = []
-        env_raw, env_word_map = self._get_env_buffers()
-        cmd_label_addrmap = self._get_cmd_labelmap()
+    def get_compiled_program(self, env_memoryview=False):
+        """
+        Parameters
+        ----------
+            env_memoryview : bool
+                if True, env buffers are returned as (byte-format) memoryviews 
+                of the underlying uint32 arrays instead of bytes, which avoids
+                a copy. These can be passed directly to PLInterface/CircuitRunner,
+                but can't be pickled (e.g. sent to a worker process or over xmlrpc).
+
+        Returns
+        -------
+            tuple:
+                (cmd_buf, env_raw, freq_raw)
+        """
+        env_raw, env_word_map = self._get_env_buffers(env_memoryview)
         freq_raw, freq_ind_map = self._get_freq_buffers()
-        for cmd in self._program:
-            cmd = copy.deepcopy(cmd)  # we are modifying cmd so don't overwrite anything in self._program
+        cmd_buf = self._get_cmd_buf(env_word_map, freq_ind_map)
+        return cmd_buf, env_raw, freq_raw
+
+    def get_pulse_layout(self, env_memoryview=False):
+        """
+        Assemble the program (see get_compiled_program), also returning the location 
+        and arguments of each timed pulse command. This allows pulse commands and 
+        freq buffer entries to be patched in the assembled program without 
+        reassembling it (see distproc.template).
+
+        Parameters
+        ----------
+            env_memoryview : bool
+                see get_compiled_program
+
+        Returns
+        -------
+            tuple:
+                (cmd_buf, env_raw, freq_raw, pulses). pulses is a list with one dict 
+                per pulse command with a start_time, in program order, containing:
+                    'cmd_ind' : index of the command in cmd_buf
+                    'elem' : element index
+                    'elem_cfg' : element config of elem
+                    'pulse_args' : keyword args to cg.pulse_cmd
+                    'freq_ind' : index of the pulse freq in the element's freq buffer
+                        (None if the freq is read from a register or not set)
+        """
+        env_raw, env_word_map = self._get_env_buffers(env_memoryview)
+        freq_raw, freq_ind_map = self._get_freq_buffers()
+        cmd_buf = self._get_cmd_buf(env_word_map, freq_ind_map)
+
+        pulses = []
+        for cmd_ind, cmd in enumerate(self._program):
+            if cmd['op'] != 'pulse' or 'start_time' not in cmd:
+                continue
+            freq = cmd.get('freq')
+            pulses.append({'cmd_ind': cmd_ind, 'elem': cmd['elem'], 'elem_cfg': self._elem_cfgs[cmd['elem']],
+                           'pulse_args': self._get_pulse_args(cmd, env_word_map, freq_ind_map),
+                           'freq_ind': freq_ind_map[cmd['elem']][freq] 
+                                if freq is not None and not isinstance(freq, str) else None})
+        return cmd_buf, env_raw, freq_raw, pulses
+
+    def _get_pulse_args(self, cmd, env_word_map, freq_ind_map):
+        """
+        Get the keyword args to cg.pulse_cmd for a pulse command in self._program
+        """
+        pulseargs = {}
+
+        if 'freq' in cmd.keys():
+            if isinstance(cmd['freq'], str):
+                pulseargs['freq_regaddr'] = self._regs[cmd['freq']]['index']
+            else:
+                pulseargs['freq_word'] = self._elem_cfgs[cmd['elem']].get_freq_addr(freq_ind_map[cmd['elem']][cmd['freq']])
+
+        if 'phase' in cmd.keys():
+            if isinstance(cmd['phase'], str):
+                pulseargs['phase_regaddr'] = self._regs[cmd['phase']]['index']
+            else:
+                pulseargs['phase_word'] = self._elem_cfgs[cmd['elem']].get_phase_word(cmd['phase'])
 
+        if 'amp' in cmd.keys():
+            if isinstance(cmd['amp'], str):
+                pulseargs['amp_regaddr'] = self._regs[cmd['amp']]['index']
+            else:
+                pulseargs['amp_word'] = self._elem_cfgs[cmd['elem']].get_amp_word(cmd['amp'])
+
+        if 'env' in cmd.keys():
+            pulseargs['env_word'] = env_word_map[cmd['elem']][cmd['env']] 
+
+        if 'start_time' in cmd.keys():
+            pulseargs['cmd_time'] = cmd['start_time']
+
+        if 'elem' in cmd.keys():
+            pulseargs['cfg_word'] = self._elem_cfgs[cmd['elem']].get_cfg_word(cmd['elem'], None)
+
+        return pulseargs
+
+    def _get_cmd_buf(self, env_word_map, freq_ind_map):
+        """
+        Encode self._program into machine code, using the env/freq index maps
+        returned by _get_env_buffers and _get_freq_buffers. Pulse commands are 
+        encoded together using cg.pulse_cmds; other commands are encoded individually.
+        """
+        cmd_words = np.zeros((len(self._program), 4), dtype='<u4')
+        pulse_inds = []
+        pulse_args = []
+        other_inds = []
+        other_cmds = []
+        cmd_label_addrmap = self._get_cmd_labelmap()
+        for cmd_ind, cmd in enumerate(self._program):
             if cmd['op'] == 'pulse':
-                pulseargs = {}
-
-                if 'freq' in cmd.keys():
-                    if isinstance(cmd['freq'], str):
-                        pulseargs['freq_regaddr'] = self._regs[cmd['freq']]['index']
-                    else:
-                        pulseargs['freq_word'] = self._elem_cfgs[cmd['elem']].get_freq_addr(freq_ind_map[cmd['elem']][cmd['freq']])
-
-                if 'phase' in cmd.keys():
-                    if isinstance(cmd['phase'], str):
-                        pulseargs['phase_regaddr'] = self._regs[cmd['phase']]['index']
-                    else:
-                        pulseargs['phase_word'] = self._elem_cfgs[cmd['elem']].get_phase_word(cmd['phase'])
-
-                if 'amp' in cmd.keys():
-                    if isinstance(cmd['amp'], str):
-                        pulseargs['amp_regaddr'] = self._regs[cmd['amp']]['index']
-                    else:
-                        pulseargs['amp_word'] = self._elem_cfgs[cmd['elem']].get_amp_word(cmd['amp'])
-
-                if 'env' in cmd.keys():
-                    pulseargs['env_word'] = env_word_map[cmd['elem']][cmd['env']] 
-
-                if 'start_time' in cmd.keys():
-                    pulseargs['cmd_time'] = cmd['start_time']
-
-                if 'elem' in cmd.keys():
-                    pulseargs['cfg_word'] = self._elem_cfgs[cmd['elem']].get_cfg_word(cmd['elem'], None)
-                    
-                cmd_buf += cg.pulse_cmd(**pulseargs).to_bytes(16, 'little')
-
-            elif cmd['op'] in ['reg_alu', 'jump_cond', 'alu_fproc', 'jump_fproc', 'inc_qclk']:
+                pulseargs = self._get_pulse_args(cmd, env_word_map, freq_ind_map)
+                pulse_inds.append(cmd_ind)
+                pulse_args.append(tuple(pulseargs.get(name, -1) for name in cg.pulse_cmd_dtype.names))
+                continue
+
+            if cmd['op'] in ['reg_alu', 'jump_cond', 'alu_fproc', 'jump_fproc', 'inc_qclk']:
                 if isinstance(cmd['in0'], str):
                     in0 = self._regs[cmd['in0']]['index']
                     im_or_reg = 'r'
@@ -383,33 +462,34 @@ class SingleCoreAssembler:
                         elif dtype[0] == 'amp':
                             in0 = self._elem_cfgs[dtype[1]].get_amp_word(cmd['in0'])
 
-                if 'out_reg' in cmd.keys():
-                    cmd['out_reg'] = self._regs[cmd['out_reg']]['index']
-
-                if 'jump_label' in cmd.keys():
-                    cmd['jump_addr'] = cmd_label_addrmap[cmd['jump_label']]
-
-                if 'in1_reg' in cmd.keys():
-                    cmd['in1_reg'] = self._regs[cmd['in1_reg']]['index']
+                out_reg = self._regs[cmd['out_reg']]['index'] if 'out_reg' in cmd.keys() else None
+                jump_addr = cmd_label_addrmap[cmd['jump_label']] if 'jump_label' in cmd.keys() else None
+                in1_reg = self._regs[cmd['in1_reg']]['index'] if 'in1_reg' in cmd.keys() else None
 
                 cmd_raw = cg.alu_cmd(cmd['op'], im_or_reg, in0, cmd.get('alu_op'),
-                        cmd.get('in1_reg'), cmd.get('out_reg'), cmd.get('jump_addr'), cmd.get('func_id'))
-                cmd_buf += cmd_raw.to_bytes(16, 'little')
+                        in1_reg, out_reg, jump_addr, cmd.get('func_id'))
 
             elif cmd['op'] == 'jump_i':
-                cmd['jump_addr'] = cmd_label_addrmap[cmd['jump_label']]
-                cmd_buf += cg.jump_i(cmd['jump_addr']).to_bytes(16, 'little')
+                cmd_raw = cg.jump_i(cmd_label_addrmap[cmd['jump_label']])
 
             elif cmd['op'] == 'pulse_reset':
-                cmd_buf += cg.pulse_reset().to_bytes(16, 'little')
+                cmd_raw = cg.pulse_reset()
 
             elif cmd['op'] == 'done_stb':
-                cmd_buf += cg.done_cmd().to_bytes(16, 'little')
+                cmd_raw = cg.done_cmd()
 
             else:
                 raise Exception('{} not supported'.format(cmd['op']))
 
-        return cmd_buf, env_raw, freq_raw
+            other_inds.append(cmd_ind)
+            other_cmds.append(cmd_raw)
+
+        if len(pulse_inds) > 0:
+            cmd_words[pulse_inds] = cg.pulse_cmds(np.array(pulse_args, dtype=cg.pulse_cmd_dtype))
+        if len(other_inds) > 0:
+            cmd_words[other_inds] = cg.cmd_words(other_cmds)
+
+        return cmd_words.tobytes()
 
     def get_sim_program(self):
         """
@@ -441,12 +521,16 @@ class SingleCoreAssembler:
     def _get_env_buffer(self, elem_ind):
         """
         Computes the raw envelope buffer along with a dictionary of indices. Address
-        is computed later by hwconfig
+        is computed later by hwconfig. Envelopes with identical (quantized) samples 
+        share the same location in the buffer. If self.pack_envs is True, each envelope
+        is placed at the first (aligned) location where it matches the existing buffer
+        contents, either entirely (e.g. a prefix of a longer envelope) or overlapping 
+        the end of the buffer; envelopes are placed longest first.
 
         Returns
         -------
             env_raw : np.ndarray
-                numpy array of the raw envelope buffer. Each element is a 
+                uint32 array of the raw envelope buffer. Each element is a 
                 32-bit word, with a signed 16-bit I value LSB followed by
                 a signed 16-bit Q value MSB
             env_addr_map : dict
@@ -458,31 +542,96 @@ class SingleCoreAssembler:
                 the address here is the envelope start index in env_raw divided
                 by four.
         """
-        cur_env_ind = 0
-        env_word_map = {}
-
-        env_raw = np.empty(0).astype(int)
+        env_raw, env_word_map, _ = self._layout_env_buffer(elem_ind)
+        return env_raw, env_word_map
 
-        for envkey, env in self._env_dicts[elem_ind].items():
-            env = self._elem_cfgs[elem_ind].get_env_buffer(env)
-            env_word_map[envkey] = self._elem_cfgs[elem_ind].get_env_word(cur_env_ind, len(env))
-            cur_env_ind += len(env)
-            env_raw = np.append(env_raw, env)
+    def _layout_env_buffer(self, elem_ind):
+        """
+        Implementation of _get_env_buffer; also returns the env memory usage stats
+        reported by get_env_utilization
+        """
+        elem_cfg = self._elem_cfgs[elem_ind]
+        env_bufs = {envkey: np.asarray(elem_cfg.get_env_buffer(env)).astype(np.uint32, copy=False)
+                    for envkey, env in self._env_dicts[elem_ind].items()}
+        envkeys = list(env_bufs.keys())
+        if self.pack_envs:
+            envkeys.sort(key=lambda envkey: len(env_bufs[envkey]), reverse=True)
+
+        env_raw = np.empty(sum(len(env) for env in env_bufs.values()), dtype=np.uint32)
+        env_inds = {} # sample words -> start index in env_raw
+        env_word_map = {}
+        cur_env_ind = 0
+        for envkey in envkeys:
+            env = env_bufs[envkey]
+            env_bytes = env.tobytes()
+            if env_bytes not in env_inds:
+                if self.pack_envs:
+                    env_ind = self._find_env_ind(env_raw[:cur_env_ind], env, elem_cfg.env_addr_samples)
+                else:
+                    env_ind = cur_env_ind
+                env_raw[env_ind : env_ind + len(env)] = env
+                cur_env_ind = max(cur_env_ind, env_ind + len(env))
+                env_inds[env_bytes] = env_ind
+            env_word_map[envkey] = elem_cfg.get_env_word(env_inds[env_bytes], len(env))
+
+        env_word_map = {envkey: env_word_map[envkey] for envkey in env_bufs.keys()}
+        stats = {'n_envs': len(env_bufs),
+                 'n_unique_envs': len(env_inds),
+                 'requested_samples': int(sum(len(env) for env in env_bufs.values())),
+                 'used_samples': cur_env_ind,
+                 'max_samples': getattr(elem_cfg, 'env_max_samples', None)}
+        return env_raw[:cur_env_ind], env_word_map, stats
+
+    @staticmethod
+    def _find_env_ind(env_raw, env, align):
+        """
+        Find the first start index (multiple of align) at which env matches 
+        env_raw, either entirely or up to the end of env_raw; if there is none,
+        env is placed at the end.
+        """
+        if len(env) == 0:
+            return len(env_raw)
+        starts = align*np.nonzero(env_raw[::align] == env[0])[0]
+        for start in starts:
+            overlap = min(len(env_raw) - start, len(env))
+            if np.array_equal(env_raw[start : start + overlap], env[:overlap]):
+                return int(start)
+        return len(env_raw)
+
+    def get_env_utilization(self):
+        """
+        Get the envelope memory usage of each element.
 
-        return env_raw, env_word_map
+        Returns
+        -------
+            list of dict (one per element), containing:
+                'n_envs' : number of envelopes used by the program
+                'n_unique_envs' : number of envelopes with distinct samples
+                'requested_samples' : total length of all envelopes
+                'used_samples' : length of the env buffer after merging/packing
+                'max_samples' : env memory size (None if the element config 
+                    doesn't specify env_max_samples)
+                'utilization' : used_samples/max_samples
+        """
+        utilization = []
+        for elem_ind in range(self.n_element):
+            stats = self._layout_env_buffer(elem_ind)[2]
+            stats['utilization'] = stats['used_samples']/stats['max_samples'] \
+                    if stats['max_samples'] is not None else None
+            utilization.append(stats)
+        return utilization
     
-    def _get_env_buffers(self):
+    def _get_env_buffers(self, as_memoryview=False):
         """
         Get all env_buffers and index maps for each element connected to this core. 
-        Env buffers are converted to packed byte array
+        Env buffers are converted to packed byte arrays, or byte-format memoryviews
+        of the uint32 buffers if as_memoryview is True
         """
         env_data = []
         env_word_maps = []
         for i in range(self.n_element):
             d, m = self._get_env_buffer(i)
-            # todo: figure out if dtype should be enforced in hwconfig
-            d = np.array(d, dtype=np.uint32)
-            env_data.append(d.tobytes())
+            env_data.append(memoryview(d).cast('B') if as_memoryview else d.tobytes())
             env_word_maps.append(m)
 
         return env_data, env_word_maps
@@ -524,13 +673,15 @@ class GlobalAssembler:
     Takes a CompiledProgram object and convert to np arrays to be written to FPGA BRAM.
     """
 
-    def __init__(self, compiled_program, channel_configs, elementconfig_class):
+    def __init__(self, compiled_program, channel_configs, elementconfig_class, pack_envs=False):
         """
-        channel configs is loaded from json file, using hwconfig.load_channel_configs
+        channel configs is loaded from json file, using hwconfig.load_channel_configs.
+        If pack_envs is True, envelope buffers are packed to reuse identical sample
+        runs (see SingleCoreAssembler._get_env_buffer).
         """
         self.assemblers = {}
         self.channel_configs = channel_configs
-        compiled_program = copy.deepcopy(compiled_program)
+        self._elem_channels = {}
 
         if compiled_program.fpga_config is not None \
                 and int(np.round(channel_configs['fpga_clk_freq'])) != int(np.round(compiled_program.fpga_config.fpga_clk_freq)):
@@ -539,30 +690,61 @@ class GlobalAssembler:
 
         for proc_group in compiled_program.proc_groups:
             elem_cfgs = {}
+            elem_channels = {}
             core_ind = str(channel_configs[proc_group[0]].core_ind)
             for chan in proc_group:
                 chan_cfg = channel_configs[chan]
                 assert chan_cfg.core_ind == int(core_ind)
                 elem_cfgs[chan_cfg.elem_ind] = elementconfig_class(**chan_cfg.elem_params)
+                elem_channels[chan_cfg.elem_ind] = chan
             elem_cfgs = [elem_cfgs[elem_ind] for elem_ind in sorted(elem_cfgs.keys())]
+            self._elem_channels[core_ind] = [elem_channels[elem_ind] for elem_ind in sorted(elem_channels.keys())]
 
-            self.assemblers[core_ind] = SingleCoreAssembler(elem_cfgs)
-            self._resolve_element_inds(compiled_program.program[proc_group])
-            self.assemblers[core_ind].from_list(compiled_program.program[proc_group])
+            self.assemblers[core_ind] = SingleCoreAssembler(elem_cfgs, pack_envs)
+            self.assemblers[core_ind].from_list(self._resolve_element_inds(compiled_program.program[proc_group]))
 
     def _resolve_element_inds(self, single_core_program):
         """
-        Replace the 'dest' key in pulse commands with 'elem_ind' according to self.channel_configs
+        Replace the 'dest' key in pulse commands with 'elem_ind' according to self.channel_configs.
+        Returns a new command list; compiled_program is not modified (so it can be assembled
+        multiple times, or cached), and non-pulse commands are shared with it.
         """
+        resolved_program = []
         for statement in single_core_program:
             if statement['op'] == 'pulse':
-                statement['elem_ind'] = self.channel_configs[statement['dest']].elem_ind
-                del statement['dest']
+                elem_ind = self.channel_configs[statement['dest']].elem_ind
+                statement = {key: value for key, value in statement.items() if key != 'dest'}
+                statement['elem_ind'] = elem_ind
+            resolved_program.append(statement)
+        return resolved_program
 
-    def get_assembled_program(self):
+    def get_env_utilization(self):
+        """
+        Get the envelope memory usage of each channel (see 
+        SingleCoreAssembler.get_env_utilization)
+
+        Returns
+        -------
+            dict
+                keys : channel names (e.g. 'Q0.qdrv')
+                values : dict of env memory usage stats
+        """
+        utilization = {}
+        for core_ind, asm in self.assemblers.items():
+            for elem_ind, stats in enumerate(asm.get_env_utilization()):
+                utilization[self._elem_channels[core_ind][elem_ind]] = stats
+        return utilization
+
+    def get_assembled_program(self, env_memoryview=False):
         """
         Get assembled program to load onto FPGA.
 
+        Parameters
+        ----------
+            env_memoryview : bool
+                if True, return env buffers as memoryviews instead of bytes
+                (see SingleCoreAssembler.get_compiled_program)
+
         Returns
         -------
             assembled_prog : dict
@@ -574,7 +756,7 @@ class GlobalAssembler:
         """
         assembled_prog = {}
         for core_ind, asm in self.assemblers.items():
-            cmd_buf, env_raw, freq_raw = asm.get_compiled_program()
+            cmd_buf, env_raw, freq_raw = asm.get_compiled_program(env_memoryview)
             assembled_prog[core_ind] = {'cmd_buf': cmd_buf, 'env_buffers': env_raw, 'freq_buffers': freq_raw}
 
         return assembled_prog
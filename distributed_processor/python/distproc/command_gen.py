@@ -154,6 +154,106 @@ def pulse_cmd(freq_word=None, freq_regaddr=None, phase_word=None, phase_regaddr=
     return cmd
 
 
+# pulse_cmd arguments, used as the field names of a pulse command array for
+# pulse_cmds. Fields set to -1 are treated as None
+pulse_cmd_dtype = np.dtype([('freq_word', np.int64), ('freq_regaddr', np.int64),
+                            ('phase_word', np.int64), ('phase_regaddr', np.int64),
+                            ('amp_word', np.int64), ('amp_regaddr', np.int64),
+                            ('cfg_word', np.int64), 
+                            ('env_word', np.int64), ('env_regaddr', np.int64),
+                            ('cmd_time', np.int64)])
+
+def pulse_cmds(pulse_args):
+    """
+    Vectorized version of pulse_cmd: encodes an array of pulse commands at once.
+    Output is identical to calling pulse_cmd on each element.
+
+    Parameters
+    ----------
+        pulse_args : np.ndarray
+            structured array with dtype pulse_cmd_dtype; each field corresponds
+            to the pulse_cmd argument of the same name, with -1 in place of None.
+            Other negative values raise a ValueError
+
+    Returns
+    -------
+        np.ndarray
+            (n, 4) uint32 array of commands; each row is one 128-bit command
+            (least significant word first), so cmds.tobytes() gives the same 
+            result as concatenating pulse_cmd(...).to_bytes(16, 'little')
+    """
+    pulse_args = np.asarray(pulse_args, dtype=pulse_cmd_dtype)
+    for name in pulse_cmd_dtype.names:
+        if np.any(pulse_args[name] < -1):
+            raise ValueError('{} out of range: only -1 (None) and non-negative values are allowed'.format(name))
+    fields = []
+
+    def add_field(value, pos, enable):
+        fields.append((np.where(enable, value, 0), pos))
+
+    for name, field, enable_bit in [('cfg_word', 'cfg', 4), ('amp_word', 'amp', 17), ('freq_word', 'freq', 10), 
+                                    ('phase_word', 'phase', 18), ('env_word', 'env_word', 25)]:
+        value = pulse_args[name]
+        present = value >= 0
+        if np.any(value >= 2**pulse_field_widths[field]):
+            raise ValueError('{} out of range'.format(name))
+        add_field(value + 2**enable_bit, pulse_field_pos[field], present)
+
+    regaddrs = [('freq_regaddr', 'freq_word', 'freq'), ('phase_regaddr', 'phase_word', 'phase'), 
+                ('amp_regaddr', 'amp_word', 'amp'), ('env_regaddr', 'env_word', 'env_word')]
+    n_regaddrs = np.zeros(len(pulse_args), dtype=int)
+    for name, word_name, field in regaddrs:
+        regaddr = pulse_args[name]
+        present = regaddr >= 0
+        if np.any(present & (pulse_args[word_name] >= 0)):
+            raise ValueError('{} and {} are both set'.format(name, word_name))
+        if np.any(regaddr >= 16):
+            raise ValueError('{} out of range'.format(name))
+        n_regaddrs += present
+        add_field(regaddr, 116, present)
+        add_field(0b11, pulse_field_pos[field] + pulse_field_widths[field], present)
+    if np.any(n_regaddrs > 1):
+        raise ValueError('only one pulse parameter can be loaded from a register')
+
+    cmd_time = pulse_args['cmd_time']
+    if np.any(cmd_time >= 2**pulse_field_widths['cmd_time']):
+        raise ValueError('cmd_time out of range')
+    add_field(cmd_time, pulse_field_pos['cmd_time'], cmd_time >= 0)
+    fields.append((np.where(cmd_time >= 0, opcodes['pulse_write_trig'], opcodes['pulse_write']), 123))
+
+    return _pack_cmd_fields(len(pulse_args), fields)
+
+def _pack_cmd_fields(n_cmds, fields):
+    """
+    Sum (i.e. value << pos for each field, as in pulse_cmd) a list of
+    (value array, bit position) fields into (n_cmds, 4) uint32 words.
+    Shifted values must fit into 64 bits relative to their 32-bit word.
+    """
+    cols = np.zeros((4, n_cmds), dtype=np.uint64)
+    for value, pos in fields:
+        word_ind, shift = divmod(pos, 32)
+        value = np.asarray(value).astype(np.uint64) << np.uint64(shift)
+        cols[word_ind] += value & np.uint64(0xffffffff)
+        if word_ind < 3:
+            cols[word_ind + 1] += value >> np.uint64(32)
+
+    cmds = np.empty((n_cmds, 4), dtype=np.uint32)
+    carry = np.zeros(n_cmds, dtype=np.uint64)
+    for i in range(4):
+        cols[i] += carry
+        carry = cols[i] >> np.uint64(32)
+        cmds[:, i] = cols[i] & np.uint64(0xffffffff)
+
+    return cmds
+
+def cmd_words(cmds):
+    """
+    Convert a list of 128-bit commands (python ints) to an (n, 4) uint32 array 
+    (least significant word first)
+    """
+    return np.frombuffer(b''.join(cmd.to_bytes(16, 'little') for cmd in cmds), dtype='<u4').reshape(-1, 4)
+
+
 def reg_alu_i(value, alu_op, reg_addr, reg_write_addr):
     """
     Returns 128-bit command corresponding to:
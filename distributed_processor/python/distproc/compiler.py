@@ -101,17 +101,20 @@ import matplotlib.pyplot as plt
 import os
 import sys
 import copy
+import math
 import logging 
 try:
     import ipdb
 except ImportError:
     logging.warning('failed to import ipdb')
 import json
-from collections import OrderedDict
+import hashlib
+from collections import OrderedDict, deque
 
 import qubitconfig.qchip as qc
 import distproc.assembler as asm
 import distproc.hwconfig as hw
+import distproc.ir as ir
 
 RESRV_NAMES = ['branch_fproc', 'branch_var', 'barrier', 'delay', 'sync', 
                'jump_i', 'alu', 'declare', 'jump_label', 'done',
@@ -125,8 +128,9 @@ class Compiler:
     Compilation stages:
         1. Determine the overall program scope (i.e. qubits used) as well
             as the scope of any declared variables
-        2. Convert program to intermediate representation: at the moment,
-            this is just flattening the control flow heirarchy to jump statements
+        2. Convert program to intermediate representation: flatten the control 
+            flow heirarchy to jump statements, then parse each statement into 
+            an ir.Instruction
         3. Construct basic blocks -- these are sections of code with linear 
             control flow (no branching/jumping/looping). In general, basic 
             blocks are scoped to some subset of qubits.
@@ -189,7 +193,8 @@ class Compiler:
             for freqname in qchip.qubit_dict[qubit].keys():
                 self.zphase[qubit + '.' + freqname] = 0
 
-        self._program_ir = generate_ir_program(self._program)
+        self._program_ir = [ir.Instruction.from_dict(statement) for statement in generate_ir_program(self._program)]
+        self._gate_cache = {} # dereferenced (unmodified) gates, shared by all basic blocks
         self._make_basic_blocks()
         self._generate_cfg()
 
@@ -201,31 +206,36 @@ class Compiler:
         Generates a dict of BasicBlock objects, stored in self._basic_blocks
         """
         self._basic_blocks = OrderedDict()
-        self._basic_blocks['start'] = BasicBlock([], self.proc_group_type, self._fpga_config, self.qchip)
+        self._basic_blocks['start'] = BasicBlock([], self.proc_group_type, self._fpga_config, self.qchip,
+                                                 self._gate_cache)
         self._basic_blocks['start'].qubit_scope = self.qubits
 
         cur_blockname = 'block_0'
         blockind = 1
         cur_block = []
         for statement in self._program_ir:
-            if statement['name'] in ['jump_fproc', 'jump_cond', 'jump_i']:
-                self._basic_blocks[cur_blockname] = BasicBlock(cur_block, self.proc_group_type, self._fpga_config, self.qchip)
+            if statement.opcode in ir.JUMP_OPCODES:
+                self._basic_blocks[cur_blockname] = BasicBlock(cur_block, self.proc_group_type, self._fpga_config, self.qchip,
+                                                               self._gate_cache)
                 if statement['jump_label'].split('_')[-1] == 'loopctrl': #todo: break this out
                     ctrl_blockname = '{}_ctrl'.format(statement['jump_label'])
                 else:
                     ctrl_blockname = '{}_ctrl'.format(cur_blockname)
-                self._basic_blocks[ctrl_blockname] = BasicBlock([statement], self.proc_group_type, self._fpga_config, self.qchip)
+                self._basic_blocks[ctrl_blockname] = BasicBlock([statement], self.proc_group_type, self._fpga_config, self.qchip,
+                                                                self._gate_cache)
                 cur_blockname = 'block_{}'.format(blockind)
                 blockind += 1
                 cur_block = []
-            elif statement['name'] == 'jump_label':
-                self._basic_blocks[cur_blockname] = BasicBlock(cur_block, self.proc_group_type, self._fpga_config, self.qchip)
+            elif statement.opcode == ir.JUMP_LABEL:
+                self._basic_blocks[cur_blockname] = BasicBlock(cur_block, self.proc_group_type, self._fpga_config, self.qchip,
+                                                               self._gate_cache)
                 cur_block = [statement]
                 cur_blockname = statement['label']
             else:
                 cur_block.append(statement)
 
-        self._basic_blocks[cur_blockname] = BasicBlock(cur_block, self.proc_group_type, self._fpga_config, self.qchip)
+        self._basic_blocks[cur_blockname] = BasicBlock(cur_block, self.proc_group_type, self._fpga_config, self.qchip,
+                                                       self._gate_cache)
 
         basic_blocks_nonempty = {}
         for blockname, block in self._basic_blocks.items():
@@ -287,60 +297,75 @@ class Compiler:
         return predecessors
 
     def schedule(self):
+        """
+        Schedule all basic blocks in topological order of the global CFG (ignoring
+        loop back-edges). Each block is scheduled exactly once, after all of its
+        predecessors, so this is linear in the size of the CFG.
+        """
         block_end_times = {blockname: None for blockname in self._basic_blocks.keys()}
         block_end_times['start'] = {qubit: INITIAL_TSTART for qubit in self.qubits}
         cfg_predecessors = self._get_cfg_predecessors()
+        n_unscheduled_preds = {node: len(preds) for node, preds in cfg_predecessors.items()}
         self._basic_blocks['start'].schedule({}, {})
-        node_queue = self._global_cfg['start'].copy()
         loop_dict = {}
         block_prev_loops = {blockname: {} for blockname in self._basic_blocks.keys()}
         block_prev_loops['start'] = {qubit: () for qubit in self.qubits}
 
+        node_queue = deque()
+        self._release_successors('start', cfg_predecessors, n_unscheduled_preds, node_queue)
+
         while node_queue:
-            cur_node = node_queue.pop(0)
+            cur_node = node_queue.popleft()
             cur_node_predecessors = cfg_predecessors[cur_node]
-            pred_block_end_times = [block_end_times[node] for node in cur_node_predecessors]
-            if None not in pred_block_end_times:
-                block_start_times = {}
+            block_start_times = {}
+            for qubit in self._basic_blocks[cur_node].qubit_scope:
+                block_start_times[qubit] = []
+                prev_loops = set()
+                for node in cur_node_predecessors:
+                    if qubit in self._basic_blocks[node].qubit_scope:
+                        block_start_times[qubit].append(block_end_times[node][qubit])
+                        #todo: consider breaking prev_loop timing analysis out into IR class
+                        prev_loops.update(block_prev_loops[node][qubit])
+                block_start_times[qubit] = max(block_start_times[qubit])
+                block_prev_loops[cur_node][qubit] = tuple(sorted(prev_loops))
+
+            self._basic_blocks[cur_node].schedule(block_start_times, block_prev_loops[cur_node])
+            block_end_times[cur_node] = self._basic_blocks[cur_node].qubit_last_t
+
+            if cur_node.split('_')[-1] == 'loopctrl': #start a loop
+                loop_dict[cur_node] = {'start_time': max([t for t in block_start_times.values()])}
+                block_prev_loops[cur_node] = {qubit: block_prev_loops[cur_node][qubit] + (cur_node,) 
+                                              for qubit in self._basic_blocks[cur_node].qubit_scope}
+
+            elif cur_node[-13:] == 'loopctrl_ctrl':
+                # end loop
+                loopname = cur_node[:-5]
+                loop_dict[loopname]['delta_t'] = max(block_start_times.values()) - loop_dict[loopname]['start_time']
                 for qubit in self._basic_blocks[cur_node].qubit_scope:
-                    block_start_times[qubit] = []
-                    block_prev_loops[cur_node][qubit] = ()
-                    for node in cur_node_predecessors:
-                        if qubit in self._basic_blocks[node].qubit_scope:
-                            block_start_times[qubit].append(block_end_times[node][qubit])
-                            #todo: consider breaking prev_loop timing analysis out into IR class
-                            block_prev_loops[cur_node][qubit] += block_prev_loops[node][qubit] 
-                    block_start_times[qubit] = max(block_start_times[qubit])
-                    block_prev_loops[cur_node][qubit] = tuple(np.unique(block_prev_loops[cur_node][qubit]))
-
-                self._basic_blocks[cur_node].schedule(block_start_times, block_prev_loops[cur_node])
-                block_end_times[cur_node] = self._basic_blocks[cur_node].qubit_last_t
-
-                if cur_node.split('_')[-1] == 'loopctrl': #start a loop
-                    loop_dict[cur_node] = {'start_time': max([t for t in block_start_times.values()])}
-                    block_prev_loops[cur_node] = {qubit: block_prev_loops[cur_node][qubit] + (cur_node,) 
-                                                  for qubit in self._basic_blocks[cur_node].qubit_scope}
-
-                elif cur_node[-13:] == 'loopctrl_ctrl':
-                    # end loop
-                    loopname = cur_node[:-5]
-                    loop_dict[loopname]['delta_t'] = max(block_start_times.values()) - loop_dict[loopname]['start_time']
-                    for qubit in self._basic_blocks[cur_node].qubit_scope:
-                        block_end_times[cur_node][qubit] = loop_dict[loopname]['start_time']
-
-                try:
-                    node_queue.extend([node for node in self._global_cfg[cur_node] if not self._basic_blocks[node].is_scheduled])
-                except KeyError:
-                    pass
-            else:
-                node_queue.append(cur_node)
+                    block_end_times[cur_node][qubit] = loop_dict[loopname]['start_time']
+
+            self._release_successors(cur_node, cfg_predecessors, n_unscheduled_preds, node_queue)
 
         self.loop_dict = loop_dict
         self.block_end_times = block_end_times
         self.is_scheduled = True
 
+    def _release_successors(self, node, cfg_predecessors, n_unscheduled_preds, node_queue):
+        """
+        Mark node as scheduled, and queue any successors that are now ready
+        (i.e. all predecessors have been scheduled). Loop back-edges aren't 
+        included in cfg_predecessors, so they are skipped here.
+        """
+        for dest in self._global_cfg.get(node, []):
+            if node in cfg_predecessors[dest]:
+                n_unscheduled_preds[dest] -= 1
+                if n_unscheduled_preds[dest] == 0:
+                    node_queue.append(dest)
+
     def _from_list(self, prog_list):
-        self._program = prog_list
+        # statements are shared with the input program (and never modified); 
+        # anything that needs to change a statement replaces it in self._program
+        self._program = list(prog_list)
 
     def _scope_program(self):
         self.qubits = []
@@ -349,12 +374,12 @@ class Compiler:
                 self.qubits.extend(statement['qubit'])
             if 'scope' in statement.keys():
                 self.qubits.extend(statement['scope'])
-        self.qubits = list(np.unique(np.asarray(self.qubits)))
+        self.qubits = sorted(set(self.qubits))
 
     def _lint_and_scopevars(self):
         #todo: add in loop stuff here
         vars = {}
-        for statement in self._program:
+        for i, statement in enumerate(self._program):
             if 'qubit' in statement.keys():
                 assert isinstance(statement['qubit'], list)
             else: # this is not a gate
@@ -369,11 +394,70 @@ class Compiler:
                 if isinstance(statement['in0'], str):
                     assert statement['in0']['dtype'] == vars[statement['out']]['dtype']
                     assert set(vars[statement['out']]['scope']).issubset(vars[statement['in0']]['scope'])
-                statement['scope'] = vars[statement['out']]['scope']
+                self._program[i] = {**statement, 'scope': vars[statement['out']]['scope']}
             elif statement['name'] == 'barrier' or statement['name'] == 'delay':
                 if 'qubit' not in statement.keys():
-                    statement['qubit'] = self.qubits
+                    self._program[i] = {**statement, 'qubit': self.qubits}
+
 
+    def update_block(self, blockname, program):
+        """
+        Replace the instructions in basic block blockname (e.g. to edit a branch
+        body) without rebuilding the rest of the program. The CFG isn't regenerated,
+        so program can only contain gates, virtualz, barrier and delay statements
+        (in QubiC circuit format), on qubits already in the block's scope. These 
+        replace the block's existing gate/virtualz/barrier/delay statements; all other 
+        instructions are kept: a leading jump label and barrier (e.g. at the start of 
+        a loop body) stay at the start of the block, and the new statements are 
+        inserted before any remaining instructions (declare, alu, loop_end, etc).
+
+        On the next schedule()/compile(), only this block and successors whose
+        start times change are rescheduled and recompiled; all other blocks reuse 
+        their previous results. Use CompiledProgram.diff to get the proc groups that
+        changed:
+
+            prog = compiler.compile()
+            compiler.update_block('true_0', [{'name': 'X90', 'qubit': ['Q0']}])
+            prog_diff = compiler.compile().diff(prog)
+
+        Parameters
+        ----------
+            blockname : str
+                name of the block to update (key in self._basic_blocks)
+            program : list of dicts
+                new block contents
+        """
+        if blockname not in self._basic_blocks or blockname == 'start' or blockname.endswith('_ctrl'):
+            raise ValueError('{} is not an updatable basic block'.format(blockname))
+        old_block = self._basic_blocks[blockname]
+
+        new_statements = []
+        for statement in program:
+            if statement['name'] in RESRV_NAMES and statement['name'] not in ['barrier', 'delay']:
+                raise ValueError('{} statements are not supported in block updates'.format(statement['name']))
+            if statement['name'] in ['barrier', 'delay'] and 'qubit' not in statement.keys():
+                statement = {**statement, 'qubit': old_block.qubit_scope}
+            if not set(statement['qubit']).issubset(old_block.qubit_scope):
+                raise ValueError('{} is outside of block scope {}'.format(statement, old_block.qubit_scope))
+            new_statements.append(ir.Instruction.from_dict(statement))
+
+        # splice the new statements in place of the old timed statements, keeping
+        # everything else (jump label + barrier at the start of a loop body, declare, 
+        # alu, loop_end, etc)
+        timed_opcodes = (ir.GATE, ir.VIRTUALZ, ir.DELAY)
+        insert_ind = len(old_block._program)
+        for i, instr in enumerate(old_block._program):
+            if instr.opcode not in (ir.JUMP_LABEL, ir.BARRIER):
+                insert_ind = i
+                break
+        new_program = list(old_block._program[:insert_ind]) + new_statements
+        new_program.extend(instr for instr in old_block._program[insert_ind:] 
+                           if instr.opcode not in timed_opcodes + (ir.BARRIER,))
+
+        new_block = BasicBlock(new_program, self.proc_group_type, self._fpga_config, self.qchip, self._gate_cache)
+        new_block.qubit_scope = old_block.qubit_scope
+        self._basic_blocks[blockname] = new_block
+        self.is_scheduled = False
 
     def compile(self):
         if not self.is_scheduled:
@@ -417,9 +501,32 @@ class BasicBlock:
         delta_t: total execution time of basic block, in fpga clocks
     """
 
-    def __init__(self, program, proc_grouping, fpga_config, qchip, swphase=True):
-        self._program = program
+    def __init__(self, program, proc_grouping, fpga_config, qchip, gate_cache=None, swphase=True):
+        """
+        Parameters
+        ----------
+            program : list
+                list of ir.Instruction (or statement dicts)
+            proc_grouping : str
+            fpga_config : hwconfig.FPGAConfig
+            qchip : qubitconfig.qchip.QChip
+            gate_cache : dict
+                cache of dereferenced gates, keyed by gate name. Can be shared 
+                between basic blocks in the same program; if None, a new one is
+                created
+            swphase : bool
+        """
+        self._program = [ir.as_instruction(statement) for statement in program]
+        self._gate_cache = gate_cache if gate_cache is not None else {}
         self._fpga_config = fpga_config
+        # clock cycles taken by each (non-gate) instruction type
+        self._instr_clks = {ir.DECLARE: 0,
+                            ir.ALU: fpga_config.alu_instr_clks,
+                            ir.JUMP_FPROC: fpga_config.jump_fproc_clks,
+                            ir.JUMP_I: fpga_config.jump_fproc_clks, #todo: change to jump_i_clks
+                            ir.JUMP_COND: fpga_config.jump_cond_clks,
+                            ir.JUMP_LABEL: 0,
+                            ir.LOOP_END: fpga_config.alu_instr_clks}
         self._scope()
         self.proc_group_type = proc_grouping
         self.zphase = {}
@@ -428,6 +535,8 @@ class BasicBlock:
                 self.zphase[qubit + '.' + freqname] = 0
         self.is_resolved = False
         self.is_scheduled = False
+        self._schedule_inputs = None
+        self._compiled_program = None # (loop deltas, compiled program) from last compile
         self.is_zresolved = not swphase
         self._swphase = swphase
         self.qchip = qchip
@@ -438,9 +547,9 @@ class BasicBlock:
     def dest_nodes(self):
         if len(self._program) == 0:
             return ['next_block']
-        elif self._program[-1]['name'] in ['jump_fproc', 'jump_cond']:
+        elif self._program[-1].opcode in (ir.JUMP_FPROC, ir.JUMP_COND):
             return [self._program[-1]['jump_label'], 'next_block']
-        elif self._program[-1]['name'] in ['jump_i']:
+        elif self._program[-1].opcode == ir.JUMP_I:
             return [self._program[-1]['jump_label']]
         else:
             return ['next_block']
@@ -450,13 +559,13 @@ class BasicBlock:
         return len(self._program) == 0
 
     def _scope(self):
-        self.qubit_scope = []
+        qubit_scope = set()
         for statement in self._program:
-            if 'qubit' in statement.keys():
-                self.qubit_scope.extend(statement['qubit'])
-            elif 'scope' in statement.keys():
-                self.qubit_scope.extend(statement['scope'])
-        self.qubit_scope = list(np.unique(np.asarray(self.qubit_scope)))
+            if statement.qubit is not None:
+                qubit_scope.update(statement.qubit)
+            elif statement.scope is not None:
+                qubit_scope.update(statement.scope)
+        self.qubit_scope = sorted(qubit_scope)
 
     def schedule(self, qubit_last_t, qubit_loop_dict):
         """
@@ -466,7 +575,14 @@ class BasicBlock:
                 last scheduled operation for each qubit
             qubit_loop_dict : dict of tuples
                 loops traversed by this qubit
+
+        If the block has already been scheduled with the same inputs, the previous
+        schedule is kept.
         """
+        if self.is_scheduled and self._schedule_inputs == (qubit_last_t, qubit_loop_dict):
+            return
+        self._schedule_inputs = (qubit_last_t.copy(), qubit_loop_dict.copy())
+        self._compiled_program = None
         if not self.is_resolved:
             self._resolve_gates()
             logging.debug('done resolving block')
@@ -479,57 +595,36 @@ class BasicBlock:
 
         self.scheduled_program = []
         for gate in self.resolved_program:
-            if isinstance(gate, dict):
-                if gate['name'] == 'barrier':
-                    qubit_max_t = max([qubit_last_t[qubit] for qubit in gate['qubit']])
-                    for qubit in gate['qubit']:
+            if isinstance(gate, ir.Instruction):
+                if gate.opcode == ir.BARRIER:
+                    qubit_max_t = max([qubit_last_t[qubit] for qubit in gate.qubit])
+                    for qubit in gate.qubit:
                         qubit_last_t[qubit] = qubit_max_t
-                elif gate['name'] == 'delay':
-                    for qubit in gate['qubit']:
+                elif gate.opcode == ir.DELAY:
+                    for qubit in gate.qubit:
                         qubit_last_t[qubit] += self._get_pulse_nclks(gate['t'])
-                elif gate['name'] == 'declare':
-                    self.scheduled_program.append(gate)
-                elif gate['name'] == 'alu':
-                    for qubit in self.qubit_scope:
-                        qubit_last_t[qubit] += self._fpga_config.alu_instr_clks
-                    self.scheduled_program.append(gate)
-                elif gate['name'] == 'jump_fproc':
-                    for qubit in self.qubit_scope:
-                        qubit_last_t[qubit] += self._fpga_config.jump_fproc_clks
-                    self.scheduled_program.append(gate)
-                elif gate['name'] == 'jump_i':
-                    for qubit in self.qubit_scope:
-                        qubit_last_t[qubit] += self._fpga_config.jump_fproc_clks #todo: change to jump_i_clks
-                    self.scheduled_program.append(gate)
-                elif gate['name'] == 'jump_cond':
-                    for qubit in self.qubit_scope:
-                        qubit_last_t[qubit] += self._fpga_config.jump_cond_clks
-                    self.scheduled_program.append(gate)
-                elif gate['name'] == 'jump_label':
-                    self.scheduled_program.append(gate)
-                elif gate['name'] == 'loop_end':
-                    for qubit in self.qubit_scope:
-                        qubit_last_t[qubit] += self._fpga_config.alu_instr_clks
+                elif gate.opcode in self._instr_clks:
+                    instr_clks = self._instr_clks[gate.opcode]
+                    if instr_clks:
+                        for qubit in self.qubit_scope:
+                            qubit_last_t[qubit] += instr_clks
                     self.scheduled_program.append(gate)
                 else:
-                    raise Exception('{} not yet implemented'.format(gate['name']))
+                    raise Exception('{} not yet implemented'.format(gate.name))
                 continue
-            pulses = gate.get_pulses()
-            loop_history = qubit_loop_dict[pulses[0].dest.split('.')[0]]
-            min_pulse_t = []
-            for pulse in pulses:
-                qubit = pulse.dest.split('.')[0]
+            timing = self._gate_timing[id(gate)]
+            loop_history = qubit_loop_dict[timing[0][0]]
+            gate_t = None
+            for qubit, offset, end in timing:
                 assert qubit in self.qubit_scope
                 assert qubit_loop_dict[qubit] == loop_history
-                qubit_t = qubit_last_t[qubit]
-                min_pulse_t.append(qubit_t - self._get_pulse_nclks(pulse.t0))
-            gate_t = max(min_pulse_t)
-            for pulse in pulses:
-                qubit_last_t[pulse.dest[:2]] = max(qubit_last_t[pulse.dest[:2]], gate_t \
-                        + self._get_pulse_nclks(pulse.t0) + max(self._get_pulse_nclks(pulse.twidth),
-                        self._fpga_config.pulse_regwrite_clks))
+                if gate_t is None or qubit_last_t[qubit] - offset > gate_t:
+                    gate_t = qubit_last_t[qubit] - offset
+            for qubit, offset, end in timing:
+                if gate_t + end > qubit_last_t[qubit]:
+                    qubit_last_t[qubit] = gate_t + end
 
-            self.scheduled_program.append({'gate': gate, 't': gate_t})
+            self.scheduled_program.append(ir.ScheduledGate(gate, gate_t))
 
         self.qubit_last_t = qubit_last_t
         self.is_scheduled = True
@@ -538,46 +633,91 @@ class BasicBlock:
         """
         convert gatedict references to objects, then dereference (i.e.
         all gate.contents elements are GatePulse or VirtualZ objects)
+
+        Unmodified gates are dereferenced once and shared (through self._gate_cache)
+        between all occurrences, so resolved gates (and their pulses) must not be
+        modified in place; _resolve_virtualz_pulses copies any that need to change.
+        The timing table (see _get_timing_table) for each resolved gate is stored in 
+        self._gate_timing, keyed by id(gate).
         """
         self.resolved_program = []
+        self._gate_timing = {}
         for gatedict in self._program:
-            if gatedict['name'] in RESRV_NAMES:
-                self.resolved_program.append(gatedict)
+            if gatedict.opcode == ir.GATE:
+                gatename = ''.join(gatedict.qubit) + gatedict.name
+                if gatedict.modi is not None:
+                    gate = self.qchip.gates[gatename].get_updated_copy(gatedict.modi)
+                    gate.dereference()
+                    timing = self._get_timing_table(gate)
+                else:
+                    if gatename not in self._gate_cache:
+                        gate = self.qchip.gates[gatename].copy()
+                        gate.dereference()
+                        self._gate_cache[gatename] = (gate, self._get_timing_table(gate))
+                    gate, timing = self._gate_cache[gatename]
+                self._gate_timing[id(gate)] = timing
+                self.resolved_program.append(gate)
 
-            elif gatedict['name'] == 'virtualz':
-                assert len(gatedict['qubit']) == 1
-                self.resolved_program.append(qc.VirtualZ(gatedict.pop('freqname', DEFAULT_FREQNAME),
-                                                         gatedict.pop('phase'), gatedict.pop('qubit')[0]))
+            elif gatedict.opcode == ir.VIRTUALZ:
+                assert len(gatedict.qubit) == 1
+                self.resolved_program.append(qc.VirtualZ(gatedict.get('freqname', DEFAULT_FREQNAME),
+                                                         gatedict['phase'], gatedict.qubit[0]))
 
             else:
-                gatename = ''.join(gatedict['qubit']) + gatedict['name']
-                gate = self.qchip.gates[gatename]
-                if 'modi' in gatedict and gatedict['modi'] is not None:
-                    gate = gate.get_updated_copy(gatedict['modi'])
-                else:
-                    gate = gate.copy()
-                gate.dereference()
-                self.resolved_program.append(gate)
+                self.resolved_program.append(gatedict)
 
         self.is_resolved = True
 
     def _get_pulse_nclks(self, length_secs):
-        return int(np.ceil(length_secs/self._fpga_config.fpga_clk_period))
+        return math.ceil(length_secs/self._fpga_config.fpga_clk_period)
+
+    def _get_timing_table(self, gate):
+        """
+        Get the integer (FPGA clock) timing of a dereferenced gate, used for 
+        scheduling. 
+
+        Returns
+        -------
+            tuple of (qubit, offset, end) tuples
+                one per qubit targeted by the gate. offset is the earliest
+                pulse start time (t0) on that qubit, and end is the time 
+                at which the qubit is free, both relative to the gate start time
+        """
+        timing = {}
+        for pulse in gate.contents:
+            if isinstance(pulse, qc.VirtualZ):
+                continue
+            qubit = pulse.dest.split('.')[0]
+            offset = self._get_pulse_nclks(pulse.t0)
+            end = offset + max(self._get_pulse_nclks(pulse.twidth), self._fpga_config.pulse_regwrite_clks)
+            if qubit in timing:
+                timing[qubit] = (min(timing[qubit][0], offset), max(timing[qubit][1], end))
+            else:
+                timing[qubit] = (offset, end)
+        return tuple((qubit, offset, end) for qubit, (offset, end) in timing.items())
 
     def _resolve_virtualz_pulses(self):
         zresolved_program = []
         for gate in self.resolved_program:
             if isinstance(gate, qc.Gate):
-                # gate = gate.copy()
+                contents = []
                 for pulse in gate.contents:
                     # TODO: fix config/encoding of these
                     if isinstance(pulse, qc.VirtualZ):
                         self.zphase[pulse.global_freqname] += pulse.phase
                     else:
-                        if pulse.fcarriername is not None:
+                        if pulse.fcarriername is not None and self.zphase[pulse.fcarriername] != 0:
                             # TODO: figure out if this is intended behavior...
-                            pulse.pcarrier += self.zphase[pulse.fcarriername]
-                gate.remove_virtualz()
+                            # gate may be shared, so copy pulse before applying phase
+                            pulse = copy.copy(pulse)
+                            pulse.pcarrier = pulse.pcarrier + self.zphase[pulse.fcarriername]
+                        contents.append(pulse)
+                if len(contents) != len(gate.contents) \
+                        or any(pulse is not orig for pulse, orig in zip(contents, gate.contents)):
+                    timing = self._gate_timing[id(gate)]
+                    gate = copy.copy(gate)
+                    gate.contents = contents
+                    self._gate_timing[id(gate)] = timing
                 if len(gate.contents) > 0:
                     zresolved_program.append(gate)
 
@@ -588,81 +728,89 @@ class BasicBlock:
                 zresolved_program.append(gate)
 
         self.resolved_program = zresolved_program
+        self.is_zresolved = True
 
     def compile(self, loop_dict):
         """
         Converts gates to pulses, and all IR instructions to proc ASM code
         """
         # TODO: add twidth attribute to env, not pulse
+        if not (self.is_resolved and self.is_scheduled):
+            raise Exception('schedule and resolve gates first!')
+        loop_deltas = tuple(loop_dict[instr['loop_label']]['delta_t'] for instr in self.scheduled_program
+                            if instr.opcode == ir.LOOP_END)
+        if self._compiled_program is not None and self._compiled_program[0] == loop_deltas:
+            return self._compiled_program[1]
+
         proc_groups_byqubit = generate_proc_groups(self.proc_group_type, self.qubit_scope, perqubit=True)
         proc_groups_flat = [grp for grouplist in proc_groups_byqubit.values() for grp in grouplist]
         proc_groups_bydest = {}
         for grp in proc_groups_flat:
             proc_groups_bydest.update({dest: grp for dest in grp})
         compiled_program = {grp: [] for grp in proc_groups_flat} 
-        if not (self.is_resolved and self.is_scheduled):
-            raise Exception('schedule and resolve gates first!')
         for i, instr in enumerate(self.scheduled_program):
-            if 'gate' in instr.keys():
-                for pulse in instr['gate'].get_pulses():
+            if instr.opcode == ir.GATE:
+                for pulse in instr.gate.contents:
                     proc_group = proc_groups_bydest[pulse.dest]
                     envdict = pulse.env.env_desc[0]
                     if 'twidth' not in envdict['paradict'].keys():
                         envdict['paradict']['twidth'] = pulse.twidth
-                    start_time = instr['t'] + self._get_pulse_nclks(pulse.t0)
+                    start_time = instr.t + self._get_pulse_nclks(pulse.t0)
                     compiled_program[proc_group].append(
                             {'op': 'pulse', 'freq': pulse.fcarrier, 'phase': pulse.pcarrier, 'amp': pulse.amp,
                              'env': pulse.env.env_desc[0], 'start_time': start_time, 'dest': pulse.dest})
 
-            elif instr['name'] == 'jump_label':
-                for q in instr['scope']:
+            elif instr.opcode == ir.JUMP_LABEL:
+                for q in instr.scope:
                     for grp in proc_groups_byqubit[q]:
                         compiled_program[grp].append({'op': 'jump_label', 'dest_label': instr['label']})
 
-            elif instr['name'] == 'done':
-                for q in instr['scope']:
+            elif instr.opcode == ir.DONE:
+                for q in instr.scope:
                     for grp in proc_groups_byqubit[q]:
                         compiled_program[grp].append({'op': 'done_stb'})
 
-            elif instr['name'] == 'declare':
-                for q in instr['scope']:
+            elif instr.opcode == ir.DECLARE:
+                for q in instr.scope:
                     for grp in proc_groups_byqubit[q]:
                         compiled_program[grp].append({'op': 'declare_reg', 'name': instr['var'], 'dtype': instr['dtype']})
 
-            elif instr['name'] == 'alu':
-                for q in instr['scope']:
+            elif instr.opcode == ir.ALU:
+                for q in instr.scope:
                     for grp in proc_groups_byqubit[q]:
                         compiled_program[grp].append({'op': 'reg_alu', 'in0': instr['lhs'], 'in1': instr['rhs'], 
                                                       'alu_op': instr['alu_op'], 'out_reg': instr['out']})
 
-            elif instr['name'] == 'jump_fproc':
+            elif instr.opcode == ir.JUMP_FPROC:
                 statement = {'op': 'jump_fproc', 'in0': instr['cond_lhs'], 'alu_op': instr['alu_cond'], 
                              'jump_label': instr['jump_label'], 'func_id': instr['func_id']}
-                for q in instr['scope']:
+                for q in instr.scope:
                     for grp in proc_groups_byqubit[q]:
                         compiled_program[grp].append(statement)
 
-            elif instr['name'] == 'jump_cond':
+            elif instr.opcode == ir.JUMP_COND:
                 statement = {'op': 'jump_cond', 'in0': instr['cond_lhs'], 'alu_op': instr['alu_cond'], 
                              'jump_label': instr['jump_label'], 'in1': instr['cond_rhs']}
-                for q in instr['scope']:
+                for q in instr.scope:
                     for grp in proc_groups_byqubit[q]:
                         compiled_program[grp].append(statement)
 
-            elif instr['name'] == 'jump_i':
+            elif instr.opcode == ir.JUMP_I:
                 statement = {'op': 'jump_i', 'jump_label': instr['jump_label']}
-                for q in instr['scope']:
+                for q in instr.scope:
                     for grp in proc_groups_byqubit[q]:
                         compiled_program[grp].append(statement)
 
-            elif instr['name'] == 'loop_end':
+            elif instr.opcode == ir.LOOP_END:
                 statement = {'op': 'inc_qclk', 'in0': -loop_dict[instr['loop_label']]['delta_t']}
-                for q in instr['scope']:
+                for q in instr.scope:
                     for grp in proc_groups_byqubit[q]:
                         compiled_program[grp].append(statement)
 
             else:
-                raise Exception('{} not yet implemented'.format(instr['name']))
+                raise Exception('{} not yet implemented'.format(instr.name))
+
+        self._compiled_program = (loop_deltas, compiled_program)
         return compiled_program
 
     def __repr__(self):
@@ -706,12 +854,14 @@ def generate_ir_program(program, label_prefix=''):
          'jump_label': <loop_label>, 'jump_type': 'loopctrl'}
         
 
+    Statements are not copied; the output shares them with the input program, so
+    downstream stages must treat them as read-only.
+
     TODO: consider sticking this in a class
     """
     flattened_program = []
     branchind = 0
     for i, statement in enumerate(program):
-        statement = copy.deepcopy(statement)
         if statement['name'] in ['branch_fproc', 'branch_var']:
             falseblock = statement['false']
             trueblock = statement['true']
@@ -800,23 +950,165 @@ class CompiledProgram:
     def proc_groups(self):
         return self.program.keys()
 
-    def save(self, filename):
-        progdict = copy.deepcopy(self.program)
-        if self.fpga_config is not None:
-            progdict['fpga_config'] = self.fpga_config.__dict__
+    def diff(self, other):
+        """
+        Get the proc groups whose programs differ from those in other (e.g. 
+        an earlier compilation of the same circuit, before Compiler.update_block).
+        Only these need to be reassembled and loaded (using CircuitRunner.load_circuit 
+        with zero=False); if the runner has diff_load enabled, only the changed 
+        BRAM words are written.
+
+        Returns
+        -------
+            CompiledProgram
+                containing only the proc groups that are new or changed
+        """
+        changed = {grp: prog for grp, prog in self.program.items() if other.program.get(grp) != prog}
+        return CompiledProgram(changed, self.fpga_config)
+
+    def save(self, filename, fmt=None):
+        """
+        Save the compiled program (along with fpga_config) to a file; see
+        save_compiled_programs
+        """
+        save_compiled_programs([self], filename, fmt)
+
+    @classmethod
+    def load(cls, filename):
+        return load_compiled_program(filename)
+
+
+COMPILED_PROGRAM_FORMAT_VERSION = 1
+
+def _encode_program_obj(obj, arrays=None):
+    """
+    Convert obj (an element of a compiled program) into a JSON-serializable form. 
+    Tuples (e.g. register dtypes) and numpy arrays (e.g. envelopes) are tagged so they 
+    can be restored by _decode_program_obj. If arrays (dict) is provided, numpy arrays
+    are stored there instead of being converted to lists, and are referenced by key. Arrays
+    with the same contents are only stored once.
+    """
+    if isinstance(obj, dict):
+        return {key: _encode_program_obj(value, arrays) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [_encode_program_obj(value, arrays) for value in obj]
+    elif isinstance(obj, tuple):
+        return {'__tuple__': [_encode_program_obj(value, arrays) for value in obj]}
+    elif isinstance(obj, np.ndarray):
+        if arrays is not None:
+            arr = np.ascontiguousarray(obj)
+            arrkey = (arr.dtype.str, arr.shape, hashlib.sha1(arr.tobytes()).hexdigest())
+            if arrkey not in arrays:
+                arrays[arrkey] = ('arr_{}'.format(len(arrays)), arr)
+            return {'__ndarray_ref__': arrays[arrkey][0]}
+        elif np.iscomplexobj(obj):
+            return {'__ndarray__': obj.dtype.str, 'real': obj.real.tolist(), 'imag': obj.imag.tolist()}
+        else:
+            return {'__ndarray__': obj.dtype.str, 'data': obj.tolist()}
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    else:
+        return obj
+
+def _decode_program_obj(obj, arrays=None):
+    if isinstance(obj, dict):
+        if '__tuple__' in obj:
+            return tuple(_decode_program_obj(value, arrays) for value in obj['__tuple__'])
+        elif '__ndarray_ref__' in obj:
+            return arrays[obj['__ndarray_ref__']]
+        elif '__ndarray__' in obj:
+            if 'data' in obj:
+                return np.asarray(obj['data'], dtype=obj['__ndarray__'])
+            return (np.asarray(obj['real']) + 1j*np.asarray(obj['imag'])).astype(obj['__ndarray__'])
+        return {key: _decode_program_obj(value, arrays) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [_decode_program_obj(value, arrays) for value in obj]
+    else:
+        return obj
+
+def _encode_compiled_program(compiled_program, arrays=None):
+    fpga_config = compiled_program.fpga_config.__dict__ if compiled_program.fpga_config is not None else None
+    return {'fpga_config': fpga_config,
+            'program': [[_encode_program_obj(grp), _encode_program_obj(prog, arrays)] 
+                        for grp, prog in compiled_program.program.items()]}
 
+def _decode_compiled_program(progdict, arrays=None):
+    fpga_config = hw.FPGAConfig(**progdict['fpga_config']) if progdict['fpga_config'] is not None else None
+    program = {_decode_program_obj(grp): _decode_program_obj(prog, arrays) for grp, prog in progdict['program']}
+    return CompiledProgram(program, fpga_config)
+
+def save_compiled_programs(compiled_programs, filename, fmt=None):
+    """
+    Save a list of CompiledPrograms to a single file, so they can be compiled
+    offline and loaded later with load_compiled_programs.
+
+    Parameters
+    ----------
+        compiled_programs : list of CompiledProgram
+        filename : str
+        fmt : str
+            'json' or 'npz'. 'json' is human-readable; numpy arrays (e.g. envelopes) 
+            are stored as lists. 'npz' stores the program structure as JSON and 
+            numpy arrays as separate (deduplicated) arrays in an uncompressed numpy 
+            .npz archive, which is much faster to save/load for large batches or 
+            programs with sampled envelopes. If None (default), 'npz' is used if 
+            filename ends with '.npz', and 'json' otherwise.
+    """
+    if fmt is None:
+        fmt = 'npz' if filename.endswith('.npz') else 'json'
+
+    if fmt == 'json':
+        progdict = {'version': COMPILED_PROGRAM_FORMAT_VERSION,
+                    'programs': [_encode_compiled_program(prog) for prog in compiled_programs]}
+        with open(filename, 'w') as f:
+            json.dump(progdict, f, indent=4)
+
+    elif fmt == 'npz':
+        arrays = {}
+        progdict = {'version': COMPILED_PROGRAM_FORMAT_VERSION,
+                    'programs': [_encode_compiled_program(prog, arrays) for prog in compiled_programs]}
+        header = np.frombuffer(json.dumps(progdict).encode(), dtype=np.uint8)
+        with open(filename, 'wb') as f:
+            np.savez(f, __programs__=header, **dict(arrays.values()))
+
+    else:
+        raise ValueError('unsupported format {}'.format(fmt))
+
+def load_compiled_programs(filename):
+    """
+    Load a list of CompiledPrograms saved using save_compiled_programs 
+    (or CompiledProgram.save). The format (json or npz) is detected 
+    from the file contents.
+
+    Returns
+    -------
+        list of CompiledProgram
+    """
+    with open(filename, 'rb') as f:
+        is_npz = f.read(4) == b'PK\x03\x04' # zip archive
+
+    if is_npz:
+        with np.load(filename) as npzfile:
+            progdict = json.loads(npzfile['__programs__'].tobytes())
+            arrays = {name: npzfile[name] for name in npzfile.files if name != '__programs__'}
+    else:
         with open(filename) as f:
-            json.dumps(progdict, f, indent=4)
+            progdict = json.load(f)
+        arrays = None
 
-    def load(self, filename):
-        raise NotImplementedError()
+    if progdict.get('version') != COMPILED_PROGRAM_FORMAT_VERSION:
+        raise ValueError('{} is not a compiled program file (version {})'.format(filename, COMPILED_PROGRAM_FORMAT_VERSION))
 
+    return [_decode_compiled_program(prog, arrays) for prog in progdict['programs']]
 
 def load_compiled_program(filename):
-    with open(filename) as f:
-        progdict = json.load(f)
-
-    return hw.FPGAConfig(**progdict['fpga_config'])
+    """
+    Load a single CompiledProgram saved using CompiledProgram.save
+    """
+    programs = load_compiled_programs(filename)
+    if len(programs) != 1:
+        raise ValueError('{} contains {} programs; use load_compiled_programs'.format(filename, len(programs)))
+    return programs[0]
 
 
 def generate_proc_groups(proc_grouping, qubits, perqubit=False):
@@ -32,6 +32,13 @@ class ElementConfig(ABC):
     def fpga_clk_freq(self):
         return 1/self.fpga_clk_period
 
+    @property
+    def env_addr_samples(self):
+        """
+        Envelope start addresses (in env buffer samples) must be a multiple of this
+        """
+        return self.samples_per_clk
+
     @abstractmethod
     def get_phase_word(self, phase):
         pass
@@ -0,0 +1,172 @@
+"""
+Compact intermediate representation (IR) used internally by the compiler.
+Programs are still written in the QubiC circuit (list of dicts) format;
+Compiler parses each (flattened) statement into an Instruction, which has
+an integer opcode (used for dispatch instead of comparing names) and qubit
+names interned as tuples of strings.
+
+Instructions support read-only dict-style access (instr['name'], instr['qubit'],
+instr['jump_label'], 'label' in instr.keys(), etc), so code written against the
+dict format keeps working.
+"""
+import sys
+
+GATE = 0
+VIRTUALZ = 1
+BARRIER = 2
+DELAY = 3
+SYNC = 4
+DECLARE = 5
+ALU = 6
+JUMP_FPROC = 7
+JUMP_COND = 8
+JUMP_I = 9
+JUMP_LABEL = 10
+LOOP_END = 11
+DONE = 12
+BRANCH_FPROC = 13
+BRANCH_VAR = 14
+LOOP = 15
+
+OPCODES = {'virtualz': VIRTUALZ,
+           'barrier': BARRIER,
+           'delay': DELAY,
+           'sync': SYNC,
+           'declare': DECLARE,
+           'alu': ALU,
+           'jump_fproc': JUMP_FPROC,
+           'jump_cond': JUMP_COND,
+           'jump_i': JUMP_I,
+           'jump_label': JUMP_LABEL,
+           'loop_end': LOOP_END,
+           'done': DONE,
+           'branch_fproc': BRANCH_FPROC,
+           'branch_var': BRANCH_VAR,
+           'loop': LOOP} # all other names are gates
+
+JUMP_OPCODES = (JUMP_FPROC, JUMP_COND, JUMP_I)
+
+
+_qubit_tuples = {}
+
+def intern_qubits(qubits):
+    """
+    Convert a list of qubit names to a tuple of interned strings. Tuples are
+    also interned, so all instructions on the same qubits share one tuple.
+    """
+    key = tuple(qubits)
+    interned = _qubit_tuples.get(key)
+    if interned is None:
+        interned = _qubit_tuples[key] = tuple(sys.intern(str(qubit)) for qubit in key)
+    return interned
+
+
+class Instruction:
+    """
+    Single IR instruction. name, qubit, scope, and modi (the most commonly used
+    statement fields) are stored as attributes; any other fields are kept in the
+    fields dict. Instructions should not be modified after they are created.
+
+    Attributes:
+        opcode : int
+        name : str
+        qubit : tuple of str
+            None if not provided
+        scope : tuple of str
+            None if not provided
+        modi : dict
+            gate modifications, None if not provided
+        fields : dict
+            other statement fields (e.g. 'jump_label', 'phase'); None if there are none
+    """
+    __slots__ = ('opcode', 'name', 'qubit', 'scope', 'modi', 'fields')
+
+    _ATTRS = ('name', 'qubit', 'scope', 'modi')
+
+    def __init__(self, opcode, name, qubit=None, scope=None, modi=None, fields=None):
+        self.opcode = opcode
+        self.name = name
+        self.qubit = qubit
+        self.scope = scope
+        self.modi = modi
+        self.fields = fields
+
+    @classmethod
+    def from_dict(cls, statement):
+        """
+        Parse a statement in the QubiC circuit format
+        """
+        name = statement['name']
+        qubit = intern_qubits(statement['qubit']) if 'qubit' in statement else None
+        scope = intern_qubits(statement['scope']) if 'scope' in statement else None
+        fields = {key: value for key, value in statement.items() if key not in cls._ATTRS}
+        return cls(OPCODES.get(name, GATE), sys.intern(name), qubit, scope, statement.get('modi'),
+                   fields if fields else None)
+
+    def to_dict(self):
+        statement = {key: getattr(self, key) for key in self._ATTRS if getattr(self, key) is not None}
+        if self.fields is not None:
+            statement.update(self.fields)
+        return statement
+
+    def __getitem__(self, key):
+        if key in self._ATTRS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        elif self.fields is not None:
+            return self.fields[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+def as_instruction(statement):
+    if isinstance(statement, Instruction):
+        return statement
+    return Instruction.from_dict(statement)
+
+
+class ScheduledGate:
+    """
+    Resolved gate (qubitconfig.qchip.Gate) along with its scheduled start time,
+    in FPGA clocks. Supports dict-style access to 'gate' and 't'.
+    """
+    __slots__ = ('gate', 't')
+
+    opcode = GATE
+
+    def __init__(self, gate, t):
+        self.gate = gate
+        self.t = t
+
+    def __getitem__(self, key):
+        if key == 'gate':
+            return self.gate
+        elif key == 't':
+            return self.t
+        raise KeyError(key)
+
+    def keys(self):
+        return ('gate', 't')
+
+    def __repr__(self):
+        return repr({'gate': self.gate, 't': self.t})
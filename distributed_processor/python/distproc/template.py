@@ -0,0 +1,266 @@
+"""
+Parametric (compile once, bind many) program templates. A template is a
+QubiC circuit (compiler input format) where some gate parameters, given using
+'modi', are symbolic Parameter objects:
+
+    template = ProgramTemplate([{'name': 'X90', 'qubit': ['Q0'], 'modi': {(0, 'amp'): Parameter('amp')}},
+                                {'name': 'read', 'qubit': ['Q0']}],
+                               fpga_config, qchip, channel_configs, RFSoCElementCfg, {'amp': 0.5})
+    for amp in amps:
+        raw_asm = template.bind(amp=amp)
+
+The template is compiled and assembled once. Binding a value to a parameter
+used as a pulse 'amp', 'pcarrier', or 'fcarrier' only re-encodes the affected
+pulse commands (amp, phase) or freq buffer entries (fcarrier) in the assembled
+program. Parameters used anywhere else (e.g. twidth, t0, or env parameters) change
+the schedule or envelopes, so binding a new value to them triggers a full
+recompile of the template.
+"""
+import numpy as np
+import distproc.compiler as cm
+import distproc.assembler as am
+import distproc.command_gen as cg
+
+PATCHABLE_ATTRS = {'amp': 'amp', 'pcarrier': 'phase', 'fcarrier': 'freq'} # pulse attr: compiled pulse key
+
+
+class Parameter:
+    """
+    Symbolic gate parameter. Supports addition of a constant offset, which
+    is needed for z-phase resolution of pulse phases.
+    """
+
+    def __init__(self, name, offset=0.):
+        self.name = name
+        self.offset = offset
+
+    def evaluate(self, value):
+        return value + self.offset
+
+    def __add__(self, other):
+        if isinstance(other, Parameter):
+            raise TypeError('cannot add two Parameters')
+        return Parameter(self.name, self.offset + other)
+
+    __radd__ = __add__
+
+    def __repr__(self):
+        if self.offset:
+            return 'Parameter({}, offset={})'.format(self.name, self.offset)
+        return 'Parameter({})'.format(self.name)
+
+
+class _FreqSlot(float):
+    """
+    Placeholder freq for a parameterized pulse. Compares equal only to other slots
+    for the same parameter, so the assembler always gives it a dedicated freq buffer
+    entry (instead of sharing an entry with a fixed freq of the same value).
+    """
+
+    def __new__(cls, value, param_name):
+        slot = super().__new__(cls, value)
+        slot.param_name = param_name
+        return slot
+
+    def __getnewargs__(self):
+        return (float(self), self.param_name)
+
+    def __eq__(self, other):
+        return isinstance(other, _FreqSlot) and other.param_name == self.param_name
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(('_FreqSlot', self.param_name))
+
+
+def _substitute(obj, values):
+    """
+    Return a copy of the program obj with Parameters in values replaced
+    by their values
+    """
+    if isinstance(obj, Parameter):
+        return obj.evaluate(values[obj.name]) if obj.name in values else obj
+    elif isinstance(obj, dict):
+        return {k: _substitute(v, values) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_substitute(v, values) for v in obj]
+    return obj
+
+
+def _find_params(obj, patchable, other):
+    """
+    Sort the Parameters in program obj into patchable (used as a 'modi' value for a
+    pulse amp/pcarrier/fcarrier) and other
+    """
+    if isinstance(obj, Parameter):
+        other.add(obj.name)
+    elif isinstance(obj, dict):
+        for k, v in obj.items():
+            if k == 'modi' and isinstance(v, dict):
+                for modkey, modval in v.items():
+                    if isinstance(modval, Parameter) and len(modkey) == 2 and modkey[1] in PATCHABLE_ATTRS:
+                        patchable.add(modval.name)
+                    else:
+                        _find_params(modval, patchable, other)
+            else:
+                _find_params(v, patchable, other)
+    elif isinstance(obj, list):
+        for v in obj:
+            _find_params(v, patchable, other)
+
+
+class ProgramTemplate:
+    """
+    Circuit compiled and assembled once, with symbolic Parameters that can be
+    bound cheaply. See the module docstring for usage.
+
+    Attributes:
+        values : dict
+            current parameter values
+        patch_params : set
+            parameters that are bound by patching the assembled program
+        recompile_params : set
+            parameters that trigger a recompile when their value is changed
+        n_compiles : int
+            number of times the template has been compiled
+    """
+
+    def __init__(self, program, fpga_config, qchip, channel_configs, elementconfig_class,
+                 values, proc_grouping='by_qubit'):
+        """
+        Parameters
+        ----------
+            program : list of dicts
+                QubiC circuit, with Parameter objects as values in 'modi'
+            fpga_config : hwconfig.FPGAConfig
+            qchip : qubitconfig.qchip.QChip
+            channel_configs : dict
+                output of hwconfig.load_channel_configs
+            elementconfig_class : class
+                hwconfig.ElementConfig subclass for the target platform
+            values : dict
+                initial parameter values. Must include all parameters
+            proc_grouping : str
+                see compiler.Compiler
+        """
+        self._program = program
+        self._fpga_config = fpga_config
+        self._qchip = qchip
+        self._channel_configs = channel_configs
+        self._elementconfig_class = elementconfig_class
+        self._proc_grouping = proc_grouping
+
+        patchable, other = set(), set()
+        _find_params(program, patchable, other)
+        self.recompile_params = other
+        self.patch_params = patchable - other
+        missing = (self.recompile_params | self.patch_params) - set(values.keys())
+        if missing:
+            raise ValueError('no initial values provided for {}'.format(missing))
+
+        self.values = dict(values)
+        self.n_compiles = 0
+        self._build()
+
+    def _build(self):
+        """
+        Compile + assemble the template for the current values of the recompile params,
+        keeping track of where patchable params end up in the assembled program
+        """
+        compiled_values = {name: self.values[name] for name in self.recompile_params}
+        program = _substitute(self._program, compiled_values)
+        compiled_prog = cm.Compiler(program, self._proc_grouping, self._fpga_config, self._qchip).compile()
+        self.n_compiles += 1
+
+        # replace Parameters with placeholder values and record their locations
+        pulse_params = {} # keys: proc_group, values: {pulse_ind: {field: Parameter}}
+        for proc_group, cmd_list in compiled_prog.program.items():
+            pulse_ind = 0
+            for cmd in cmd_list:
+                if cmd['op'] != 'pulse':
+                    continue
+                params = {field: cmd[field] for field in PATCHABLE_ATTRS.values() if isinstance(cmd.get(field), Parameter)}
+                if params:
+                    pulse_params.setdefault(proc_group, {})[pulse_ind] = params
+                    for field, param in params.items():
+                        if field == 'freq':
+                            cmd[field] = _FreqSlot(param.evaluate(self.values[param.name]), param.name)
+                        else:
+                            cmd[field] = param.evaluate(self.values[param.name])
+                pulse_ind += 1
+
+        globalasm = am.GlobalAssembler(compiled_prog, self._channel_configs, self._elementconfig_class)
+        raw_asm = {}
+        patch_sites = []
+        freq_sites = {}
+        for proc_group in compiled_prog.proc_groups:
+            core_ind = str(self._channel_configs[proc_group[0]].core_ind)
+            asm = globalasm.assemblers[core_ind]
+            cmd_buf, env_raw, freq_raw, pulses = asm.get_pulse_layout()
+            raw_asm[core_ind] = {'cmd_buf': np.frombuffer(cmd_buf, dtype=np.uint8), 'env_buffers': env_raw,
+                                 'freq_buffers': [np.frombuffer(buf, dtype=np.uint32) for buf in freq_raw]}
+
+            # every compiled pulse maps to exactly one assembled pulse with a start_time
+            for pulse_ind, params in pulse_params.get(proc_group, {}).items():
+                pulse = pulses[pulse_ind]
+                elem_cfg = pulse['elem_cfg']
+                patch_sites.append((core_ind, pulse['cmd_ind'], elem_cfg, pulse['pulse_args'], params))
+                if 'freq' in params:
+                    freq_sites[(core_ind, pulse['elem'], pulse['freq_ind'])] = (elem_cfg, params['freq'])
+
+        self._compiled_values = compiled_values
+        self._raw_asm = raw_asm
+        self._patch_sites = patch_sites
+        self._freq_sites = [key + value for key, value in freq_sites.items()]
+
+    def bind(self, **values):
+        """
+        Bind parameter values and get the resulting assembled program. Parameters
+        not specified keep their previous values. If binding fails (e.g. the
+        template can't be compiled with the new values), the previous values are kept.
+
+        Returns
+        -------
+            dict
+                assembled program, in the same format as GlobalAssembler.get_assembled_program
+        """
+        unknown = set(values.keys()) - self.recompile_params - self.patch_params
+        if unknown:
+            raise ValueError('unknown parameters: {}'.format(unknown))
+        prev_values = self.values
+        self.values = {**prev_values, **values}
+        try:
+            if any(self.values[name] != self._compiled_values[name] for name in self.recompile_params):
+                self._build()
+            return self._patch()
+        except Exception:
+            self.values = prev_values
+            raise
+
+    def _patch(self):
+        """
+        Patch the current values of the patchable params into the assembled program
+        """
+        cmd_bufs = {core_ind: asm['cmd_buf'].copy() for core_ind, asm in self._raw_asm.items()}
+        for core_ind, cmd_ind, elem_cfg, pulseargs, params in self._patch_sites:
+            pulseargs = pulseargs.copy()
+            if 'amp' in params:
+                pulseargs['amp_word'] = elem_cfg.get_amp_word(params['amp'].evaluate(self.values[params['amp'].name]))
+            if 'phase' in params:
+                pulseargs['phase_word'] = elem_cfg.get_phase_word(params['phase'].evaluate(self.values[params['phase'].name]))
+            cmd_bufs[core_ind][16*cmd_ind : 16*(cmd_ind + 1)] = np.frombuffer(cg.pulse_cmd(**pulseargs).to_bytes(16, 'little'),
+                                                                            dtype=np.uint8)
+
+        freq_bufs = {core_ind: list(asm['freq_buffers']) for core_ind, asm in self._raw_asm.items()}
+        for core_ind, elem_ind, freq_ind, elem_cfg, param in self._freq_sites:
+            freq_words = np.asarray(elem_cfg.get_freq_buffer([param.evaluate(self.values[param.name])]), dtype=np.uint32)
+            freq_buf = freq_bufs[core_ind][elem_ind]
+            if freq_buf is self._raw_asm[core_ind]['freq_buffers'][elem_ind]:
+                freq_buf = freq_bufs[core_ind][elem_ind] = freq_buf.copy()
+            freq_buf[len(freq_words)*freq_ind : len(freq_words)*(freq_ind + 1)] = freq_words
+
+        return {core_ind: {'cmd_buf': cmd_bufs[core_ind].tobytes(), 'env_buffers': asm['env_buffers'],
+                           'freq_buffers': [buf.tobytes() for buf in freq_bufs[core_ind]]}
+                for core_ind, asm in self._raw_asm.items()}
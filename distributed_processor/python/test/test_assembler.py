@@ -76,3 +76,40 @@ def test_compiled_prog():
     rawasm = globalasm.get_assembled_program()
 
 
+
+class EnvElementConfig(ElementConfig):
+    env_max_samples = 64
+
+    def get_env_buffer(self, env_samples):
+        return np.round(np.asarray(env_samples)*20).astype(int)
+
+    def get_env_word(self, env_start_ind, env_length):
+        return env_start_ind + (env_length << 12)
+
+@pytest.mark.parametrize('pack_envs', [False, True])
+def test_env_dedup(pack_envs):
+    envs = [np.arange(1, 9)/20,         # A
+            np.arange(1, 9)/20 + 0.001, # same samples as A after quantization
+            np.arange(5, 13)/20,        # overlaps the end of A
+            np.arange(1, 5)/20]         # prefix of A
+    asmprog = asm.SingleCoreAssembler([EnvElementConfig(samples_per_clk=4)], pack_envs)
+    for i, env in enumerate(envs):
+        asmprog.add_pulse(100e6, 0, 0.5, 10*i, env, 0)
+
+    env_raw, env_word_map = asmprog._get_env_buffer(0)
+    env_words = list(env_word_map.values())
+    assert env_words[0] == env_words[1]
+    if pack_envs:
+        assert np.all(env_raw == np.arange(1, 13))
+        assert [word & 0xfff for word in env_words] == [0, 0, 4, 0]
+    else:
+        assert np.all(env_raw == np.concatenate((np.arange(1, 9), np.arange(5, 13), np.arange(1, 5))))
+        assert [word & 0xfff for word in env_words] == [0, 0, 8, 16]
+    assert [word >> 12 for word in env_words] == [8, 8, 8, 4]
+
+    utilization = asmprog.get_env_utilization()[0]
+    assert utilization['n_envs'] == 4
+    assert utilization['n_unique_envs'] == 3
+    assert utilization['requested_samples'] == 28
+    assert utilization['used_samples'] == len(env_raw)
+    assert utilization['utilization'] == len(env_raw)/64
@@ -0,0 +1,43 @@
+import pytest
+import numpy as np
+import distproc.command_gen as cg
+
+def test_pulse_cmds():
+    rng = np.random.default_rng(0)
+    pulse_args = []
+    for i in range(1000):
+        pulseargs = {}
+        for name, field in [('freq_word', 'freq'), ('phase_word', 'phase'), ('amp_word', 'amp'), 
+                            ('cfg_word', 'cfg'), ('env_word', 'env_word'), ('cmd_time', 'cmd_time')]:
+            if rng.random() < 0.8:
+                pulseargs[name] = int(rng.integers(2**cg.pulse_field_widths[field]))
+        if rng.random() < 0.3:
+            field = rng.choice(['freq', 'phase', 'amp', 'env'])
+            pulseargs.pop(field + '_word', None)
+            pulseargs[field + '_regaddr'] = int(rng.integers(16))
+        pulse_args.append(pulseargs)
+
+    args = np.array([tuple(pulseargs.get(name, -1) for name in cg.pulse_cmd_dtype.names) 
+                     for pulseargs in pulse_args], dtype=cg.pulse_cmd_dtype)
+    cmds = cg.pulse_cmds(args)
+    ref_cmds = [cg.pulse_cmd(**pulseargs) for pulseargs in pulse_args]
+    assert cmds.shape == (1000, 4)
+    assert np.all(cmds == cg.cmd_words(ref_cmds))
+    assert cmds.tobytes() == b''.join(cmd.to_bytes(16, 'little') for cmd in ref_cmds)
+
+def test_pulse_cmds_invalid():
+    args = np.full(1, -1, dtype=cg.pulse_cmd_dtype)
+    args['amp_word'] = 2**16
+    with pytest.raises(ValueError):
+        cg.pulse_cmds(args)
+
+    args = np.full(1, -1, dtype=cg.pulse_cmd_dtype)
+    args['amp_regaddr'] = 1
+    args['freq_regaddr'] = 2
+    with pytest.raises(ValueError):
+        cg.pulse_cmds(args)
+
+    args = np.full(1, -1, dtype=cg.pulse_cmd_dtype)
+    args['phase_word'] = -2
+    with pytest.raises(ValueError):
+        cg.pulse_cmds(args)
@@ -421,3 +421,109 @@ def test_nested_loop():
     compiled_prog = compiler.compile()
     print(compiled_prog)
     return compiled_prog
+
+def test_update_block():
+    qchip = qc.QChip('qubitcfg.json')
+    fpga_config = hw.FPGAConfig(**{'alu_instr_clks': 2,
+                                   'fpga_clk_period': 2.e-9,
+                                   'jump_cond_clks': 3,
+                                   'jump_fproc_clks': 4,
+                                   'pulse_regwrite_clks': 1})
+    def get_program(true_block):
+        return [{'name': 'X90', 'qubit': ['Q0']},
+                {'name': 'X90', 'qubit': ['Q1']},
+                {'name': 'branch_fproc', 'alu_cond': 'eq', 'cond_lhs': 1, 'func_id': 0,
+                 'true': true_block,
+                 'false': [{'name': 'X90', 'qubit': ['Q0']}], 'scope':['Q0']},
+                {'name': 'read', 'qubit': ['Q0']},
+                {'name': 'read', 'qubit': ['Q1']}]
+
+    compiler = cm.Compiler(get_program([{'name': 'X90', 'qubit': ['Q0']}]), 'by_qubit', fpga_config, qchip)
+    compiled_prog = compiler.compile()
+    block_0_sched = compiler._basic_blocks['block_0'].scheduled_program
+
+    new_true_block = [{'name': 'X90', 'qubit': ['Q0']}, {'name': 'X90', 'qubit': ['Q0']}]
+    compiler.update_block('true_0', new_true_block)
+    updated_prog = compiler.compile()
+    full_prog = cm.Compiler(get_program(new_true_block), 'by_qubit', fpga_config, qchip).compile()
+    assert updated_prog.program == full_prog.program
+    assert compiler._basic_blocks['block_0'].scheduled_program is block_0_sched
+
+    prog_diff = updated_prog.diff(compiled_prog)
+    assert list(prog_diff.proc_groups) == [('Q0.qdrv', 'Q0.rdrv', 'Q0.rdlo')]
+
+    with pytest.raises(ValueError):
+        compiler.update_block('true_0', [{'name': 'X90', 'qubit': ['Q1']}])
+
+def test_update_block_loop():
+    qchip = qc.QChip('qubitcfg.json')
+    fpga_config = hw.FPGAConfig(**{'alu_instr_clks': 2,
+                                   'fpga_clk_period': 2.e-9,
+                                   'jump_cond_clks': 3,
+                                   'jump_fproc_clks': 4,
+                                   'pulse_regwrite_clks': 1})
+    def get_program(first_block, loop_body):
+        return first_block + [
+                {'name': 'declare', 'var': 'loopind', 'dtype': 'int', 'scope': ['Q0']},
+                {'name': 'loop', 'cond_lhs': 10, 'cond_rhs': 'loopind', 'alu_cond': 'ge', 
+                 'scope': ['Q0'], 'body': loop_body},
+                {'name': 'read', 'qubit': ['Q0']}]
+
+    first_block = [{'name': 'X90', 'qubit': ['Q0']}]
+    loop_body = [{'name': 'X90', 'qubit': ['Q0']}]
+    compiler = cm.Compiler(get_program(first_block, loop_body), 'by_qubit', fpga_config, qchip)
+    compiler.compile()
+
+    new_loop_body = [{'name': 'X90', 'qubit': ['Q0']}, {'name': 'Z90', 'qubit': ['Q0']}, {'name': 'X90', 'qubit': ['Q0']}]
+    compiler.update_block('loop_0_loopctrl', new_loop_body)
+    full_prog = cm.Compiler(get_program(first_block, new_loop_body), 'by_qubit', fpga_config, qchip).compile()
+    assert compiler.compile().program == full_prog.program
+
+    new_first_block = [{'name': 'X90', 'qubit': ['Q0']}, {'name': 'X90', 'qubit': ['Q0']}]
+    compiler.update_block('block_0', new_first_block)
+    full_prog = cm.Compiler(get_program(new_first_block, new_loop_body), 'by_qubit', fpga_config, qchip).compile()
+    updated_prog = compiler.compile()
+    assert updated_prog.program == full_prog.program
+    ops = [cmd['op'] for cmd in updated_prog.program[('Q0.qdrv', 'Q0.rdrv', 'Q0.rdlo')]]
+    assert 'declare_reg' in ops and 'inc_qclk' in ops
+
+@pytest.mark.parametrize('fmt', ['json', 'npz'])
+def test_save_load(tmp_path, fmt):
+    qchip = qc.QChip('qubitcfg.json')
+    fpga_config = hw.FPGAConfig(**{'alu_instr_clks': 2,
+                                   'fpga_clk_period': 2.e-9,
+                                   'jump_cond_clks': 3,
+                                   'jump_fproc_clks': 4,
+                                   'pulse_regwrite_clks': 1})
+    program = [{'name': 'X90', 'qubit': ['Q0']},
+               {'name': 'virtualz', 'qubit': ['Q0'], 'phase': 0.3},
+               {'name': 'X90', 'qubit': ['Q1']},
+               {'name': 'read', 'qubit': ['Q0']}]
+    compiled_prog = cm.Compiler(program, 'by_qubit', fpga_config, qchip).compile()
+    env = np.exp(1j*np.linspace(0, 1, 32))/2
+    compiled_prog.program[('Q0.qdrv', 'Q0.rdrv', 'Q0.rdlo')][1:1] = [
+            {'op': 'declare_reg', 'name': 'phase', 'dtype': ('phase', 0)},
+            {'op': 'pulse', 'freq': 4.5e9, 'phase': 'phase', 'amp': 0.5, 'env': env, 'start_time': 5, 'dest': 'Q0.qdrv'}]
+
+    filename = str(tmp_path / 'prog.{}'.format(fmt))
+    compiled_prog.save(filename)
+    loaded_prog = cm.load_compiled_program(filename)
+
+    assert loaded_prog.fpga_config.__dict__ == fpga_config.__dict__
+    assert list(loaded_prog.proc_groups) == list(compiled_prog.proc_groups)
+    for grp in compiled_prog.proc_groups:
+        assert len(loaded_prog.program[grp]) == len(compiled_prog.program[grp])
+        for cmd, loaded_cmd in zip(compiled_prog.program[grp], loaded_prog.program[grp]):
+            assert cmd.keys() == loaded_cmd.keys()
+            for key in cmd.keys():
+                if isinstance(cmd[key], np.ndarray):
+                    assert loaded_cmd[key].dtype == cmd[key].dtype
+                    assert np.array_equal(loaded_cmd[key], cmd[key])
+                else:
+                    assert loaded_cmd[key] == cmd[key]
+                    assert type(loaded_cmd[key]) == type(cmd[key])
+
+    cm.save_compiled_programs([compiled_prog, loaded_prog], filename, fmt)
+    assert len(cm.load_compiled_programs(filename)) == 2
+    with pytest.raises(ValueError):
+        cm.load_compiled_program(filename)
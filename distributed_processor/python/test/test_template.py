@@ -0,0 +1,87 @@
+import pytest
+import numpy as np
+import distproc.compiler as cm
+import distproc.assembler as am
+import distproc.hwconfig as hw
+import qubitconfig.qchip as qc
+from distproc.template import ProgramTemplate, Parameter
+
+class ElementConfigTest(hw.ElementConfig):
+    def __init__(self, samples_per_clk, interp_ratio):
+        super().__init__(2.e-9, samples_per_clk)
+
+    def get_phase_word(self, phase):
+        return int(((phase % (2*np.pi))/(2*np.pi) * 2**17))
+
+    def get_env_word(self, env_start_ind, env_length):
+        return env_start_ind
+
+    def get_env_buffer(self, env):
+        return np.arange(16)
+
+    def get_freq_buffer(self, freqs):
+        return np.asarray([[int(freq/1.e3), 1] for freq in freqs]).flatten()
+
+    def get_freq_addr(self, freq_ind):
+        return freq_ind
+
+    def get_amp_word(self, amplitude):
+        return int(amplitude*(2**15 - 1))
+
+    def length_nclks(self, tlength):
+        return int(np.ceil(tlength/self.fpga_clk_period))
+
+    def get_cfg_word(self, elem_ind, mode_bits):
+        return elem_ind
+
+def get_program(amp, phase, freq, twidth):
+    return [{'name': 'X90', 'qubit': ['Q0'], 'modi': {(0, 'amp'): amp, (0, 'pcarrier'): phase}},
+            {'name': 'virtualz', 'qubit': ['Q0'], 'phase': 0.3},
+            {'name': 'X90', 'qubit': ['Q0'], 'modi': {(0, 'pcarrier'): phase, (0, 'fcarrier'): freq}},
+            {'name': 'X90', 'qubit': ['Q1'], 'modi': {(0, 'twidth'): twidth}},
+            {'name': 'read', 'qubit': ['Q0']}]
+
+def compile_program(program, fpga_config, qchip, channel_configs):
+    compiled_prog = cm.Compiler(program, 'by_qubit', fpga_config, qchip).compile()
+    return am.GlobalAssembler(compiled_prog, channel_configs, ElementConfigTest).get_assembled_program()
+
+def test_template_bind():
+    qchip = qc.QChip('qubitcfg.json')
+    fpga_config = hw.FPGAConfig(**{'alu_instr_clks': 2,
+                                   'fpga_clk_period': 2.e-9,
+                                   'jump_cond_clks': 3,
+                                   'jump_fproc_clks': 4,
+                                   'pulse_regwrite_clks': 1})
+    channel_configs = hw.load_channel_configs('channel_config.json')
+    template = ProgramTemplate(get_program(Parameter('amp'), Parameter('phase'), Parameter('freq'), Parameter('twidth')),
+                               fpga_config, qchip, channel_configs, ElementConfigTest,
+                               {'amp': 0.5, 'phase': 0.1, 'freq': 4.5e9, 'twidth': 32.e-9})
+    assert template.patch_params == {'amp', 'phase', 'freq'}
+    assert template.recompile_params == {'twidth'}
+
+    for amp, phase, freq in [(0.5, 0.1, 4.5e9), (0.2, 1.3, 4.6e9), (0.9, 5., 4.4e9)]:
+        raw_asm = template.bind(amp=amp, phase=phase, freq=freq)
+        assert raw_asm == compile_program(get_program(amp, phase, freq, 32.e-9), fpga_config, qchip, channel_configs)
+    assert template.n_compiles == 1
+
+    raw_asm = template.bind(twidth=40.e-9)
+    assert raw_asm == compile_program(get_program(0.9, 5., 4.4e9, 40.e-9), fpga_config, qchip, channel_configs)
+    assert template.n_compiles == 2
+
+    with pytest.raises(Exception):
+        template.bind(amp=0.1, twidth='invalid')
+    assert template.values == {'amp': 0.9, 'phase': 5., 'freq': 4.4e9, 'twidth': 40.e-9}
+    raw_asm = template.bind()
+    assert raw_asm == compile_program(get_program(0.9, 5., 4.4e9, 40.e-9), fpga_config, qchip, channel_configs)
+
+def test_template_missing_param():
+    qchip = qc.QChip('qubitcfg.json')
+    fpga_config = hw.FPGAConfig(**{'alu_instr_clks': 2,
+                                   'fpga_clk_period': 2.e-9,
+                                   'jump_cond_clks': 3,
+                                   'jump_fproc_clks': 4,
+                                   'pulse_regwrite_clks': 1})
+    channel_configs = hw.load_channel_configs('channel_config.json')
+    with pytest.raises(ValueError):
+        ProgramTemplate(get_program(Parameter('amp'), 0., 4.5e9, 32.e-9), fpga_config, qchip,
+                        channel_configs, ElementConfigTest, {})
@@ -0,0 +1,43 @@
+"""
+Benchmark accumulator buffer readback conversion: legacy vsign32 + complex
+multiply/add vs. the int32 view used by PLInterface.read_acc. Can be run off-board:
+
+    python benchmarks/acc_readback.py --n-chans 8 --readcnt 1000
+"""
+import time
+import argparse
+import numpy as np
+from qubic.rfsoc.bram import vsign32, acc_to_iq
+
+
+def legacy_readback(words):
+    readval = np.reshape(vsign32(words.astype(int)), (-1, 2))
+    return 1j*readval[:, 0] + readval[:, 1]
+
+
+def time_readback(fn, bufs, n_iter, **kwargs):
+    t0 = time.perf_counter()
+    for i in range(n_iter):
+        for buf in bufs:
+            fn(buf, **kwargs)
+    return (time.perf_counter() - t0)/n_iter
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-chans', type=int, default=8)
+    parser.add_argument('--readcnt', type=int, default=1000)
+    parser.add_argument('--n-iter', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    bufs = [rng.integers(0, 2**32, 2*args.readcnt, dtype=np.uint32) for i in range(args.n_chans)]
+    for buf in bufs:
+        assert np.all(legacy_readback(buf) == acc_to_iq(buf))
+
+    t_legacy = time_readback(legacy_readback, bufs, args.n_iter)
+    print('{} chans x {} reads, per run:'.format(args.n_chans, args.readcnt))
+    print('vsign32:    {:.3f} ms'.format(1.e3*t_legacy))
+    for dtype in [np.complex128, np.complex64, np.int32]:
+        t = time_readback(acc_to_iq, bufs, args.n_iter, dtype=dtype)
+        print('{:11} {:.3f} ms ({:.0f}x)'.format(np.dtype(dtype).name + ':', 1.e3*t, t_legacy/t))
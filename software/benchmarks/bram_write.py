@@ -0,0 +1,68 @@
+"""
+Benchmark block vs word-wise BRAM writes (as done by PLInterface.write_mem_buf)
+against a mock pynq MMIO object. Can be run off-board:
+
+    python benchmarks/bram_write.py --n-circuits 100
+"""
+import os
+import time
+import argparse
+import numpy as np
+from qubic.rfsoc.bram import BramCfgs, bram_words, write_block, write_wordwise
+
+BITS_DIR = os.path.join(os.path.dirname(__file__), '..', 'qubic', 'rfsoc', 'bits')
+
+
+class MockMMIO:
+    """
+    Minimal stand-in for pynq.MMIO: a uint32 array plus a
+    byte-addressed write method
+    """
+    def __init__(self, nwords):
+        self.array = np.zeros(nwords, dtype=np.uint32)
+
+    def write(self, offset, value):
+        self.array[offset//4] = value
+
+
+def get_buffers(bram_cfgs, rng):
+    """
+    Random command/env/freq buffers filling a single core's memories
+    """
+    buffers = {}
+    for name in ['command0', 'qdrvenv0', 'rdrvenv0', 'rdloenv0', 'qdrvfreq0', 'rdrvfreq0', 'rdlofreq0']:
+        buffers[name] = rng.integers(0, 2**32, bram_cfgs[name].length, dtype=np.uint32).tobytes()
+    return buffers
+
+
+def run_writes(mmio, bram_cfgs, buffers, write_fn, n_circuits):
+    t0 = time.perf_counter()
+    for i in range(n_circuits):
+        for name, buf in buffers.items():
+            words = bram_words(buf)
+            bram_cfgs[name].check_write(words)
+            write_fn(mmio, bram_cfgs[name].address, words)
+    return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commit', default='81f773e5')
+    parser.add_argument('--n-circuits', type=int, default=20)
+    args = parser.parse_args()
+
+    bram_cfgs = BramCfgs(os.path.join(BITS_DIR, args.commit, 'bram.json'))
+    nwords = max(cfg.address + cfg.length for cfg in bram_cfgs.values())
+    buffers = get_buffers(bram_cfgs, np.random.default_rng(0))
+    nbytes = sum(len(buf) for buf in buffers.values())
+
+    block_mmio = MockMMIO(nwords)
+    word_mmio = MockMMIO(nwords)
+    t_block = run_writes(block_mmio, bram_cfgs, buffers, write_block, args.n_circuits)
+    t_word = run_writes(word_mmio, bram_cfgs, buffers, write_wordwise, args.n_circuits)
+    assert np.all(block_mmio.array == word_mmio.array)
+
+    print('{} circuits, {} kB per circuit'.format(args.n_circuits, nbytes//1024))
+    print('word-wise: {:.3f} s ({:.2f} MB/s)'.format(t_word, args.n_circuits*nbytes/t_word/1.e6))
+    print('block:     {:.3f} s ({:.2f} MB/s)'.format(t_block, args.n_circuits*nbytes/t_block/1.e6))
+    print('speedup:   {:.1f}x'.format(t_word/t_block))
@@ -0,0 +1,95 @@
+"""
+Benchmark run_circuit_batch over XML-RPC (CircuitRunnerClient) vs. the binary
+protocol (BinaryCircuitRunnerClient), using a dummy runner that returns random
+IQ data, so only the transport is measured. Can be run off-board:
+
+    python benchmarks/rpc_transport.py --n-circuits 100 --n-shots 1000
+"""
+import time
+import argparse
+import threading
+import xmlrpc.server
+import numpy as np
+from qubic.rpc_client import CircuitRunnerClient, BinaryCircuitRunnerClient
+from qubic.binary_rpc import BinaryRPCServer
+
+N_CHANS = 8
+
+
+class DummyRunner:
+    """
+    Stand-in for CircuitRunner with the same RPC-facing signatures
+    """
+    def __init__(self):
+        self.rng = np.random.default_rng(0)
+        self.loaded_channels = [str(i) for i in range(N_CHANS)]
+
+    def load_circuit(self, rawasm, zero=True, load_commands=True, load_freqs=True, load_envs=True):
+        pass
+
+    def run_circuit(self, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6, from_server=False):
+        s11 = {ch: self.rng.normal(size=(n_total_shots, reads_per_shot)) + 0j for ch in self.loaded_channels}
+        if from_server:
+            s11 = {ch: val.tobytes() for ch, val in s11.items()}
+        return s11
+
+    def run_circuit_batch(self, raw_asm_list, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6,
+                          reload_cmd=True, reload_freq=True, reload_env=True, zero_between_reload=True,
+                          from_server=False):
+        # roughly integer-valued IQ, like real accumulator data
+        s11 = {ch: np.round(1.e4*self.rng.normal(size=(len(raw_asm_list), n_total_shots, reads_per_shot, 2)))
+               .view(np.complex128)[..., 0] for ch in self.loaded_channels}
+        if from_server:
+            s11 = {ch: val.tobytes() for ch, val in s11.items()}
+        return s11
+
+
+def get_raw_asm(rng):
+    """
+    Random raw asm for N_CHANS cores, with mostly empty (zero) buffers
+    """
+    def buf(nwords, nfilled):
+        words = np.zeros(nwords, dtype=np.uint32)
+        words[:nfilled] = rng.integers(0, 2**32, nfilled, dtype=np.uint32)
+        return words.tobytes()
+    return {str(i): {'cmd_buf': buf(4*1024, 4*50),
+                     'env_buffers': [buf(4096, 500), buf(4096, 500), buf(4096, 500)],
+                     'freq_buffers': [buf(1024, 16), buf(1024, 16), buf(1024, 16)]} for i in range(N_CHANS)}
+
+
+def time_batch(client, raw_asm_list, n_shots, n_iter):
+    t0 = time.perf_counter()
+    for i in range(n_iter):
+        s11 = client.run_circuit_batch(raw_asm_list, n_shots)
+    return (time.perf_counter() - t0)/n_iter, s11
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-circuits', type=int, default=100)
+    parser.add_argument('--n-shots', type=int, default=1000)
+    parser.add_argument('--n-iter', type=int, default=3)
+    parser.add_argument('--port', type=int, default=9195)
+    args = parser.parse_args()
+
+    runner = DummyRunner()
+    xml_server = xmlrpc.server.SimpleXMLRPCServer(('localhost', args.port), logRequests=False, allow_none=True)
+    xml_server.register_function(runner.run_circuit_batch)
+    bin_server = BinaryRPCServer(('localhost', args.port + 1), runner)
+    for server in [xml_server, bin_server]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    raw_asm_list = [get_raw_asm(runner.rng) for i in range(args.n_circuits)]
+    nbytes = N_CHANS*args.n_circuits*args.n_shots*16
+    print('{} circuits x {} shots x {} chans ({:.1f} MB of IQ data)'.format(args.n_circuits, args.n_shots,
+                                                                           N_CHANS, nbytes/1.e6))
+
+    t_xml, s11 = time_batch(CircuitRunnerClient('localhost', args.port), raw_asm_list, args.n_shots, args.n_iter)
+    assert s11['0'].shape == (args.n_circuits, args.n_shots, 1)
+    print('xmlrpc:           {:.3f} s'.format(t_xml))
+    for compress in [0, 1]:
+        client = BinaryCircuitRunnerClient('localhost', args.port + 1, compress=compress)
+        t_bin, s11 = time_batch(client, raw_asm_list, args.n_shots, args.n_iter)
+        assert s11['0'].shape == (args.n_circuits, args.n_shots, 1)
+        print('binary (zlib={}): {:.3f} s ({:.1f}x)'.format(compress, t_bin, t_xml/t_bin))
+        client.close()
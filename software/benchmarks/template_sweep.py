@@ -0,0 +1,64 @@
+"""
+Benchmark an amplitude sweep (as in AmpRabi) compiled point-by-point with the
+full compile + assemble pipeline vs. a distproc ProgramTemplate compiled once
+and bound for each point. Uses the qchip/channel configs from the distproc tests:
+
+    python benchmarks/template_sweep.py --n-points 200
+"""
+import os
+import time
+import argparse
+import numpy as np
+import distproc.compiler as cm
+import distproc.assembler as am
+import distproc.hwconfig as hw
+import qubitconfig.qchip as qc
+from distproc.template import ProgramTemplate, Parameter
+from qubic.rfsoc.hwconfig import RFSoCElementCfg
+
+TEST_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'distributed_processor', 'python', 'test')
+FPGA_CONFIG = {'alu_instr_clks': 2,
+               'fpga_clk_period': 2.e-9,
+               'jump_cond_clks': 3,
+               'jump_fproc_clks': 4,
+               'pulse_regwrite_clks': 1}
+
+
+def get_program(amp, n_gates):
+    program = [{'name': 'X90', 'qubit': ['Q0'], 'modi': {(0, 'amp'): amp}} for i in range(n_gates)]
+    program.append({'name': 'read', 'qubit': ['Q0']})
+    return program
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-points', type=int, default=200)
+    parser.add_argument('--n-gates', type=int, default=2)
+    args = parser.parse_args()
+
+    qchip = qc.QChip(os.path.join(TEST_DIR, 'qubitcfg.json'))
+    channel_configs = hw.load_channel_configs(os.path.join(TEST_DIR, 'channel_config.json'))
+    fpga_config = hw.FPGAConfig(**FPGA_CONFIG)
+    amps = np.linspace(0, 0.9, args.n_points)
+
+    t0 = time.perf_counter()
+    full_asm = []
+    for amp in amps:
+        compiled_prog = cm.Compiler(get_program(amp, args.n_gates), 'by_qubit', fpga_config, qchip).compile()
+        full_asm.append(am.GlobalAssembler(compiled_prog, channel_configs, RFSoCElementCfg).get_assembled_program())
+    t_full = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    template = ProgramTemplate(get_program(Parameter('amp'), args.n_gates), fpga_config, qchip,
+                               channel_configs, RFSoCElementCfg, {'amp': 0.})
+    t_compile = time.perf_counter() - t0
+    template_asm = [template.bind(amp=amp) for amp in amps]
+    t_template = time.perf_counter() - t0
+
+    assert template_asm == full_asm
+
+    print('{} point amplitude sweep:'.format(args.n_points))
+    print('full pipeline: {:.3f} s ({:.2f} ms/point)'.format(t_full, 1.e3*t_full/args.n_points))
+    print('template:      {:.3f} s (compile {:.2f} ms, {:.3f} ms/bind)'.format(t_template, 1.e3*t_compile,
+                                                                         1.e3*(t_template - t_compile)/args.n_points))
+    print('speedup:       {:.1f}x'.format(t_full/t_template))
@@ -0,0 +1,212 @@
+"""
+Length-prefixed binary RPC protocol for exposing a CircuitRunner over TCP (or a
+local unix socket). This is a faster alternative to the XML-RPC server in
+rpc_server.py: bytes and numpy arrays (e.g. raw asm buffers and IQ data) are
+sent as raw (optionally zlib-compressed) buffers instead of base64 encoded XML.
+
+Message format (lengths are big-endian uint64):
+
+    header length | JSON header | for each buffer: buffer length | buffer
+
+The JSON header holds the message payload, with each bytes/ndarray object
+replaced by {'__buf__': index}, and a list of buffer descriptors (dtype, shape,
+compression). Dict keys must be strings.
+"""
+import json
+import socket
+import socketserver
+import struct
+import threading
+import zlib
+from xmlrpc.client import Binary
+import numpy as np
+from qubic.job_queue import RunnerJobQueue, locked, DEFAULT_QUEUE_SIZE
+
+DEFAULT_PORT = 9096
+RUNNER_METHODS = ('load_circuit', 'run_circuit', 'run_circuit_batch')
+JOB_METHODS = ('submit', 'status', 'fetch', 'cancel')
+MIN_COMPRESS_SIZE = 4096 # don't bother compressing buffers smaller than this (in bytes)
+
+_LEN = struct.Struct('!Q')
+
+
+def _pack(obj, buffers):
+    """
+    Replace bytes/ndarrays in obj with buffer references, appending
+    them to buffers
+    """
+    if isinstance(obj, (bytes, bytearray, memoryview, np.ndarray)):
+        buffers.append(obj)
+        return {'__buf__': len(buffers) - 1}
+    elif isinstance(obj, Binary):
+        return _pack(obj.data, buffers)
+    elif isinstance(obj, dict):
+        return {str(k): _pack(v, buffers) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [_pack(v, buffers) for v in obj]
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _unpack(obj, buffers):
+    if isinstance(obj, dict):
+        if '__buf__' in obj:
+            return buffers[obj['__buf__']]
+        return {k: _unpack(v, buffers) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_unpack(v, buffers) for v in obj]
+    return obj
+
+
+def _encode_buffer(buf, compress):
+    if isinstance(buf, np.ndarray):
+        buf = np.ascontiguousarray(buf)
+        desc = {'dtype': buf.dtype.str, 'shape': buf.shape}
+        data = memoryview(buf.reshape(-1).view(np.uint8))
+    else:
+        desc = {'dtype': None}
+        data = memoryview(buf).cast('B')
+    desc['zlib'] = bool(compress) and data.nbytes >= MIN_COMPRESS_SIZE
+    if desc['zlib']:
+        data = zlib.compress(data, compress)
+    return desc, data
+
+
+def _decode_buffer(desc, data):
+    if desc['zlib']:
+        data = zlib.decompress(data)
+    if desc['dtype'] is None:
+        return bytes(data)
+    return np.frombuffer(data, dtype=desc['dtype']).reshape(desc['shape'])
+
+
+def _recv_exact(sock, nbytes):
+    buf = bytearray(nbytes)
+    view = memoryview(buf)
+    nread = 0
+    while nread < nbytes:
+        n = sock.recv_into(view[nread:])
+        if n == 0:
+            raise ConnectionError('connection closed')
+        nread += n
+    return buf
+
+
+def send_message(sock, obj, compress=0):
+    """
+    Send obj over sock. Array and bytes data is sent without copying unless compressed.
+
+    Parameters
+    ----------
+        sock : socket.socket
+        obj : dict, list, or JSON-serializable object
+            may contain bytes, numpy arrays, and xmlrpc Binary objects
+        compress : int
+            zlib compression level for buffers; 0 (default) disables compression
+    """
+    buffers = []
+    payload = _pack(obj, buffers)
+    descs, data = zip(*[_encode_buffer(buf, compress) for buf in buffers]) if buffers else ((), ())
+    header = json.dumps({'payload': payload, 'buffers': descs}).encode()
+    sock.sendall(_LEN.pack(len(header)) + header)
+    for buf in data:
+        sock.sendall(_LEN.pack(len(buf)))
+        sock.sendall(buf)
+
+
+def recv_message(sock):
+    """
+    Receive a message sent using send_message. Arrays are backed
+    by (writeable) receive buffers, so are not copied.
+    """
+    header_len, = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    header = json.loads(_recv_exact(sock, header_len))
+    buffers = []
+    for desc in header['buffers']:
+        buf_len, = _LEN.unpack(_recv_exact(sock, _LEN.size))
+        buffers.append(_decode_buffer(desc, _recv_exact(sock, buf_len)))
+    return _unpack(header['payload'], buffers)
+
+
+class BinaryRPCHandler(socketserver.BaseRequestHandler):
+    """
+    Serves requests from one client connection until it is closed.
+    Requests are dicts with keys 'method', 'args', 'kwargs', and 'compress'.
+    """
+
+    def setup(self):
+        if self.request.family in (socket.AF_INET, socket.AF_INET6):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        while True:
+            try:
+                request = recv_message(self.request)
+            except ConnectionError:
+                return
+            try:
+                if request['method'] not in self.server.functions:
+                    raise ValueError('unsupported method: {}'.format(request['method']))
+                result = self.server.functions[request['method']](*request.get('args', []),
+                                                                   **request.get('kwargs', {}))
+                response = {'status': 'ok', 'result': result}
+            except Exception as e:
+                response = {'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)}
+            send_message(self.request, response, request.get('compress', 0))
+
+
+class _RunnerServerMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, runner, methods=RUNNER_METHODS, job_queue_size=DEFAULT_QUEUE_SIZE):
+        self.runner = runner
+        self.lock = threading.Lock() # runner (i.e. the FPGA) is used by one request or job at a time
+        self.functions = {name: locked(getattr(runner, name), self.lock) for name in methods}
+        if job_queue_size:
+            self.job_queue = RunnerJobQueue(runner, job_queue_size, self.lock)
+            self.functions.update({name: getattr(self.job_queue, name) for name in JOB_METHODS})
+        super().__init__(address, BinaryRPCHandler)
+
+
+class BinaryRPCServer(_RunnerServerMixin, socketserver.ThreadingTCPServer):
+    """
+    Threaded TCP server exposing runner.load_circuit, run_circuit and
+    run_circuit_batch, as well as the submit/status/fetch/cancel job API 
+    (see job_queue.RunnerJobQueue). Each connection is handled in its own thread; 
+    calls into runner are serialized with a lock, so clients can e.g. upload their next
+    request while another client's circuit is running.
+
+    Parameters
+    ----------
+        address : tuple
+            (ip, port)
+        runner : CircuitRunner
+        methods : tuple
+            names of runner methods to expose
+        job_queue_size : int
+            maximum number of queued jobs; 0 disables the job API
+    """
+    pass
+
+
+class UnixBinaryRPCServer(_RunnerServerMixin, socketserver.ThreadingUnixStreamServer):
+    """
+    Same as BinaryRPCServer, but listening on a unix socket (address is a path)
+    """
+    pass
+
+
+def connect(ip=None, port=DEFAULT_PORT, unix_socket=None):
+    """
+    Open a client socket to a BinaryRPCServer (or UnixBinaryRPCServer if
+    unix_socket is provided)
+    """
+    if unix_socket is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unix_socket)
+    else:
+        sock = socket.create_connection((ip, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
@@ -0,0 +1,237 @@
+"""
+Asynchronous job queue in front of a single CircuitRunner, used by the RPC
+servers to expose submit/status/fetch/cancel methods. Jobs are batches of
+circuits (as in CircuitRunner.run_circuit_batch); they are run in submission
+order by a single worker thread, and results can be fetched circuit-by-circuit
+while the job is still running.
+"""
+import functools
+import itertools
+import queue
+import threading
+import numpy as np
+from collections import OrderedDict
+
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_MAX_FINISHED = 16
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+ERROR = 'error'
+FINISHED = (DONE, CANCELLED, ERROR)
+
+
+def locked(fn, lock):
+    """
+    Wrap fn so that it holds lock while running
+    """
+    @functools.wraps(fn)
+    def locked_fn(*args, **kwargs):
+        with lock:
+            return fn(*args, **kwargs)
+    return locked_fn
+
+
+class _Job:
+
+    def __init__(self, job_id, raw_asm_list, n_total_shots, reads_per_shot, run_kwargs):
+        self.job_id = job_id
+        self.raw_asm_list = raw_asm_list
+        self.n_circuits = len(raw_asm_list)
+        self.n_total_shots = n_total_shots
+        self.reads_per_shot = reads_per_shot
+        self.run_kwargs = run_kwargs
+        self.status = QUEUED
+        self.error = None
+        self.results = []
+        self.retrieved = False
+        self.cancelled = threading.Event()
+
+
+class RunnerJobQueue:
+    """
+    Bounded FIFO of circuit batch jobs, executed on runner by a worker thread.
+    Results of finished (done, cancelled, or errored) jobs are kept until the 
+    client has retrieved them: i.e. fetched them up to the last circuit (or, for 
+    jobs without results, read the final status) after the job finished. Of the 
+    retrieved jobs, the max_finished most recently finished are kept so that their 
+    results can be fetched again; older ones are discarded. Cancelling a finished
+    job discards it immediately. The job id of a discarded job is unknown.
+
+    Attributes:
+        runner : CircuitRunner (or any object implementing iter_circuit_batch)
+        lock : threading.Lock held by the worker while a job is running. Direct
+               calls into runner from other threads should hold this lock
+               (e.g. using locked())
+    """
+
+    def __init__(self, runner, maxsize=DEFAULT_QUEUE_SIZE, lock=None, max_finished=DEFAULT_MAX_FINISHED):
+        """
+        Parameters
+        ----------
+            runner : CircuitRunner
+            maxsize : int
+                maximum number of queued (not yet running) jobs
+            max_finished : int
+                maximum number of retrieved finished jobs whose results are kept
+            lock : threading.Lock
+                lock guarding runner; a new one is created if not provided
+        """
+        self.runner = runner
+        self.lock = threading.Lock() if lock is None else lock
+        self._queue = queue.Queue(maxsize)
+        self._jobs = {}
+        self._finished = OrderedDict()
+        self.max_finished = max_finished
+        self._jobs_lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._worker = threading.Thread(target=self._run_jobs, daemon=True)
+        self._worker.start()
+
+    def submit(self, raw_asm_list, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6,
+               reload_cmd=True, reload_freq=True, reload_env=True, zero_between_reload=True):
+        """
+        Queue a batch of circuits to run; arguments are the same as CircuitRunner.run_circuit_batch.
+        Raises an exception if the queue is full.
+
+        Returns
+        -------
+            int:
+                job id
+        """
+        with self._jobs_lock:
+            job = _Job(next(self._job_ids), raw_asm_list, n_total_shots, reads_per_shot,
+                       {'delay_per_shot': delay_per_shot, 'reload_cmd': reload_cmd, 'reload_freq': reload_freq,
+                        'reload_env': reload_env, 'zero_between_reload': zero_between_reload})
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise Exception('job queue full ({} jobs queued)'.format(self._queue.maxsize))
+            self._jobs[job.job_id] = job
+        return job.job_id
+
+    def status(self, job_id):
+        """
+        Returns
+        -------
+            dict:
+                'status' : one of 'queued', 'running', 'done', 'cancelled', or 'error'
+                'n_circuits' : number of circuits in the job
+                'n_done' : number of circuits whose results are available
+                'shot_shape' : shape of the results for one circuit
+                'error' : error message if status is 'error', else None
+        """
+        job = self._get_job(job_id)
+        if job.status in FINISHED and len(job.results) == 0:
+            self._set_retrieved(job)
+        return {'status': job.status, 'n_circuits': job.n_circuits, 'n_done': len(job.results),
+                'shot_shape': [job.n_total_shots, job.reads_per_shot], 'error': job.error}
+
+    def fetch(self, job_id, start=0, stop=None, from_server=False):
+        """
+        Get results for circuits start:stop of a job. Can be called
+        while the job is running; stop is limited to the number of circuits done.
+
+        Parameters
+        ----------
+            job_id : int
+            start : int
+            stop : int
+                defaults to all completed circuits
+            from_server : bool
+                if True, pack returned s11 arrays into byte objects
+
+        Returns
+        -------
+            dict:
+                Complex IQ shots for each accbuf; each array has
+                shape (n_fetched, n_total_shots, reads_per_shot)
+        """
+        job = self._get_job(job_id)
+        finished = job.status in FINISHED # checked first: results are complete once the job is finished
+        results = job.results[start:stop]
+        if finished and (stop is None or stop >= len(job.results)):
+            self._set_retrieved(job)
+        if len(results) == 0:
+            return {}
+        s11 = {ch: np.stack([result[ch] for result in results]) for ch in results[0].keys()}
+        if from_server:
+            for ch in s11.keys():
+                s11[ch] = s11[ch].tobytes()
+        return s11
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are removed from the queue; running jobs stop after
+        the current circuit (results for completed circuits can still be fetched).
+        Cancelling a job that has already finished discards its results.
+
+        Returns
+        -------
+            str:
+                job status after cancelling
+        """
+        job = self._get_job(job_id)
+        if job.status in FINISHED:
+            with self._jobs_lock:
+                self._jobs.pop(job_id, None)
+                self._finished.pop(job_id, None)
+            return job.status
+        job.cancelled.set()
+        if job.status == QUEUED:
+            job.status = CANCELLED
+        return job.status
+
+    def _get_job(self, job_id):
+        try:
+            return self._jobs[job_id]
+        except KeyError:
+            raise ValueError('unknown job id: {}'.format(job_id))
+
+    def _finish(self, job):
+        """
+        Record job as finished
+        """
+        with self._jobs_lock:
+            if job.job_id not in self._jobs:
+                return
+            self._finished[job.job_id] = job
+            self._evict()
+
+    def _set_retrieved(self, job):
+        with self._jobs_lock:
+            job.retrieved = True
+            self._evict()
+
+    def _evict(self):
+        """
+        Discard the oldest retrieved jobs beyond max_finished. Must be called 
+        with self._jobs_lock held
+        """
+        retrieved = [job_id for job_id, job in self._finished.items() if job.retrieved]
+        for job_id in retrieved[:max(len(retrieved) - self.max_finished, 0)]:
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+
+    def _run_jobs(self):
+        while True:
+            job = self._queue.get()
+            if job.cancelled.is_set():
+                self._finish(job)
+                continue
+            with self.lock:
+                job.status = RUNNING
+                try:
+                    for s11 in self.runner.iter_circuit_batch(job.raw_asm_list, job.n_total_shots,
+                                                              job.reads_per_shot, **job.run_kwargs):
+                        job.results.append(s11)
+                        if job.cancelled.is_set():
+                            break
+                    job.status = CANCELLED if job.cancelled.is_set() else DONE
+                except Exception as e:
+                    job.error = '{}: {}'.format(type(e).__name__, e)
+                    job.status = ERROR
+                job.raw_asm_list = None
+            self._finish(job)
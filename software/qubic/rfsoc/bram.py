@@ -19,6 +19,77 @@ vsign16 = np.vectorize(sign16)
 vsign32 = np.vectorize(sign32)
 
 
+def bram_words(buf):
+    """
+    Interpret buf (bytes, bytearray, or uint32 np array) as an
+    array of little-endian 32-bit memory words. No copy is made.
+    """
+    return np.frombuffer(buf, dtype='<u4')
+
+
+def acc_to_iq(words, dtype=np.complex128):
+    """
+    Convert raw accumulator buffer words to IQ values. Words are
+    interpreted as pairs of signed 32-bit (Q, I) values; the int32 view 
+    is zero-copy and the complex output is filled in place.
+
+    Parameters
+    ----------
+        words : np.ndarray
+            uint32 (or int32) array of raw accbuf words
+        dtype : np.dtype
+            np.complex64 or np.complex128 for complex IQ output; 
+            np.int32 to return a view of the raw (Q, I) pairs
+    Returns
+    -------
+        np.ndarray
+            complex IQ array of shape (len(words)//2,), or int32
+            array of shape (len(words)//2, 2)
+    """
+    iq = words.view(np.int32).reshape((-1, 2))
+    if np.dtype(dtype) == np.int32:
+        return iq
+    acc = np.empty(len(iq), dtype=dtype)
+    acc.real = iq[:, 1]
+    acc.imag = iq[:, 0]
+    return acc
+
+
+def changed_ranges(changed):
+    """
+    Get the contiguous runs of True values in a boolean mask.
+
+    Parameters
+    ----------
+        changed : np.ndarray
+            boolean mask of changed words
+    Returns
+    -------
+        np.ndarray
+            (n_runs, 2) array of [start, stop) indices
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], changed, [False])).astype(np.int8)))
+    return edges.reshape((-1, 2))
+
+
+def write_block(mmio, addr, words):
+    """
+    Write words to mmio starting at (word) address addr using
+    a single slice copy into the mmio array.
+    """
+    mmio.array[addr : addr + len(words)] = words
+
+
+def write_wordwise(mmio, addr, words):
+    """
+    Write words to mmio starting at (word) address addr, one 
+    mmio.write call per word. Slow; use for overlays that don't 
+    support block writes to the mmio array.
+    """
+    for i, word in enumerate(words):
+        mmio.write((addr + i)*4, int(word))
+
+
 class BramCfgs(dict):
     def __init__(self, jsonfilename):
         with open(jsonfilename) as jfile:
@@ -41,6 +112,26 @@ class BramCfg:
     def address(self):
         return int(str(self.paradict['address']), 0)
     
+    def check_write(self, words, start_addr=0):
+        """
+        Validate a block of words to be written to this memory. All
+        checks are done in a single pass over the array.
+
+        Parameters
+        ----------
+            words : np.ndarray
+                array of uint32 words to write
+            start_addr : int
+                start write addr relative to base address
+        """
+        if self.access != 'write':
+            raise Exception('BRAM {} does not have write access!'.format(self.name))
+        if start_addr < 0 or start_addr + len(words) > self.length:
+            raise Exception('Cannot write {} values at address {} of {} word memory {}'
+                            .format(len(words), start_addr, self.length, self.name))
+        if self.paradict['Awidth'] < 32 and np.any(words >> self.paradict['Awidth']):
+            raise Exception('{} has values wider than {} bits'.format(self.name, self.paradict['Awidth']))
+
     @property
     def access(self):
         """
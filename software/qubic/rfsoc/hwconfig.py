@@ -7,6 +7,139 @@ try:
 except ImportError:
     print('warning: failed to import ipdb')
 import numpy as np
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+# memoized freq buffer words, keyed by (freq, samples_per_clk, fpga_clk_freq)
+_freq_buffer_cache = {}
+FREQ_BUFFER_CACHE_SIZE = 2**16
+
+# bounds on the process-wide envelope cache (env_cache)
+ENV_CACHE_SIZE = 1024
+ENV_CACHE_MAX_BYTES = 2**26
+
+
+def _env_param_json(obj):
+    """
+    JSON encoder fallback for envelope parameters; arrays are represented by 
+    a hash of their contents (repr truncates large arrays)
+    """
+    if isinstance(obj, np.ndarray):
+        return {'__ndarray__': hashlib.sha1(np.ascontiguousarray(obj).tobytes()).hexdigest(), 
+                'dtype': obj.dtype.str, 'shape': obj.shape}
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    return repr(obj)
+
+def _env_func_key(env):
+    """
+    Canonical (ordering-independent) string for an envelope dict, excluding
+    twidth (which the compiler sets per-pulse)
+    """
+    paradict = {k: v for k, v in env['paradict'].items() if k != 'twidth'}
+    return json.dumps({'env_func': env['env_func'], 'paradict': paradict}, sort_keys=True, default=_env_param_json)
+
+
+class EnvelopeCache:
+    """
+    Process-wide LRU cache of quantized envelope buffers (output of 
+    RFSoCElementCfg.get_env_buffer for envelope dicts), so that envelope functions 
+    are only evaluated once per unique envelope across all assemblers. Entries are 
+    keyed by the canonicalized envelope dict along with dt and the element 
+    parameters. Cached buffers are read-only.
+
+    Since entries are keyed by the envelope parameters, changing a parameter 
+    (e.g. using QChip.update) never returns stale samples. Entries for envelopes 
+    that are no longer used are not tracked; instead, the cache is bounded to 
+    maxsize entries and max_bytes of buffer memory, evicting the least recently 
+    used entries, so superseded envelopes age out automatically. evict_stale(qchip) 
+    can be used to drop them immediately.
+
+    Attributes:
+        maxsize : int
+            maximum number of cached buffers
+        max_bytes : int
+            maximum total size (in bytes) of the cached buffers
+        nbytes : int
+            current total size of the cached buffers
+        hits : int
+        misses : int
+    """
+
+    def __init__(self, maxsize=ENV_CACHE_SIZE, max_bytes=ENV_CACHE_MAX_BYTES):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_key(self, env, dt, elem_cfg):
+        return (_env_func_key(env), repr(env['paradict'].get('twidth')), dt, 
+                elem_cfg.samples_per_clk, elem_cfg.interp_ratio, elem_cfg.env_n_bits)
+
+    def get(self, key):
+        """
+        Returns
+        -------
+            cached env buffer, or None if key is not in the cache
+        """
+        with self._lock:
+            env_buffer = self._entries.get(key)
+            if env_buffer is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return env_buffer
+
+    def put(self, key, env_buffer):
+        env_buffer.setflags(write=False)
+        if env_buffer.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key).nbytes
+            self._entries[key] = env_buffer
+            self.nbytes += env_buffer.nbytes
+            while len(self._entries) > self.maxsize or self.nbytes > self.max_bytes:
+                self.nbytes -= self._entries.popitem(last=False)[1].nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def evict_stale(self, qchip):
+        """
+        Evict entries for envelopes that aren't used by any gate in qchip (e.g. 
+        after an envelope parameter was changed using QChip.update)
+
+        Parameters
+        ----------
+            qchip : qubitconfig.qchip.QChip
+        """
+        func_keys = set()
+        for gate in qchip.gates.values():
+            for pulse in gate.contents:
+                env = getattr(pulse, 'env', None)
+                if env is not None:
+                    func_keys.update(_env_func_key(env_desc) for env_desc in env.env_desc)
+
+        with self._lock:
+            for key in [key for key in self._entries.keys() if key[0] not in func_keys]:
+                self.nbytes -= self._entries.pop(key).nbytes
+
+
+env_cache = EnvelopeCache()
 
 class RFSoCElementCfg(ElementConfig):
     """
@@ -23,6 +156,10 @@ class RFSoCElementCfg(ElementConfig):
         self.env_max_samples = env_max_samples
         super().__init__(2.e-9, samples_per_clk)
 
+    @property
+    def env_addr_samples(self):
+        return self.samples_per_clk//self.interp_ratio
+
     def get_freq_addr(self, freq_ind):
         return freq_ind
 
@@ -36,21 +173,63 @@ class RFSoCElementCfg(ElementConfig):
         Each frequency has 16 elements
             [0] is a 32-bit freq word
             [1:15] are 16 bit I MSB + 16 bit Q LSB
+
+        Words for each frequency are memoized (process-wide), so repeated 
+        frequencies (e.g. across a batch of circuits) are only computed once.
+
+        Parameters
+        ----------
+            freqs : list
+                frequencies in Hz; None entries are all zeros
+
+        Returns
+        -------
+            np.ndarray
+                uint32 array of length len(freqs)*samples_per_clk
+        """
+        # key by the plain float value, so float subclasses with custom equality
+        # (e.g. template freq placeholders) can't alias other cache entries
+        freqs = [float(freq) if freq is not None else None for freq in freqs]
+        cache_keys = [(freq, self.samples_per_clk, self.fpga_clk_freq) for freq in freqs]
+        rows = [_freq_buffer_cache.get(key) if key[0] is not None else None for key in cache_keys]
+
+        miss_freqs = list(dict.fromkeys(freq for freq, row in zip(freqs, rows) if freq is not None and row is None))
+        if len(miss_freqs) > 0:
+            new_rows = dict(zip(miss_freqs, self._calc_freq_words(np.asarray(miss_freqs, dtype=np.float64))))
+            if len(_freq_buffer_cache) + len(new_rows) > FREQ_BUFFER_CACHE_SIZE:
+                _freq_buffer_cache.clear()
+            _freq_buffer_cache.update({(freq, self.samples_per_clk, self.fpga_clk_freq): row 
+                                       for freq, row in new_rows.items()})
+            rows = [new_rows[freq] if row is None and freq is not None else row for freq, row in zip(freqs, rows)]
+
+        freq_buffer = np.zeros((len(freqs), self.samples_per_clk), dtype=np.uint32)
+        for i, row in enumerate(rows):
+            if row is not None:
+                freq_buffer[i] = row
+
+        return freq_buffer.reshape(-1)
+
+    def _calc_freq_words(self, freqs):
+        """
+        Compute the freq buffer words for an array of frequencies (all 
+        frequencies x all sample phases at once).
+
+        Returns
+        -------
+            np.ndarray
+                uint32 array of shape (len(freqs), samples_per_clk)
         """
-        freq_buffer = np.empty(0)
         scale = 2**(self.freq_n_bits/2 - 1) - 1
-        for freq in freqs:
-            cur_freq_buffer = np.zeros(self.samples_per_clk)
-            if freq is not None:
-                cur_freq_buffer[0] = int(freq*2**self.freq_n_bits/self.fpga_clk_freq) & (2**self.freq_n_bits - 1)
-                for i in range(1, self.samples_per_clk):
-                    i_mult = int(round(np.cos(2*np.pi*freq*i*self.sample_period)*scale) % (2**(self.freq_n_bits/2)))
-                    q_mult = int(round(np.sin(2*np.pi*freq*i*self.sample_period)*scale) % (2**(self.freq_n_bits/2)))
-                    cur_freq_buffer[i] = (i_mult << (self.freq_n_bits//2)) + q_mult
+        freq_words = np.empty((len(freqs), self.samples_per_clk), dtype=np.uint32)
+        freq_words[:, 0] = np.trunc(freqs*2**self.freq_n_bits/self.fpga_clk_freq).astype(np.int64) \
+                & (2**self.freq_n_bits - 1)
 
-            freq_buffer = np.append(freq_buffer, cur_freq_buffer)
+        phases = 2*np.pi*freqs[:, None]*np.arange(1, self.samples_per_clk)*self.sample_period
+        i_mult = np.round(np.cos(phases)*scale).astype(np.int64) % 2**(self.freq_n_bits//2)
+        q_mult = np.round(np.sin(phases)*scale).astype(np.int64) % 2**(self.freq_n_bits//2)
+        freq_words[:, 1:] = (i_mult << (self.freq_n_bits//2)) + q_mult
 
-        return freq_buffer
+        return freq_words
 
     def get_phase_word(self, phase):
         return int(((phase % (2*np.pi))/(2*np.pi) * 2**17))
@@ -75,18 +254,25 @@ class RFSoCElementCfg(ElementConfig):
                 calculate the envelope samples. env['env_func'] should be the name of the function,
                 and env['paradict'] is a dictionary of attributes to pass to env_func. The 
                 set of attributes varies according to the function but should include the 
-                pulse duration twidth
+                pulse duration twidth. Quantized buffers for envelope dicts are 
+                cached in env_cache, and are read-only.
         """
         if isinstance(env, np.ndarray) or isinstance(env, list):
-            env_samples = np.asarray(env)
+            return self._quantize_env(np.asarray(env))
         elif isinstance(env, dict):
             dt = self.interp_ratio * self.sample_period
-            env_func = getattr(ep, env['env_func'])
-            _, env_samples = env_func(dt=dt, **env['paradict'])
-            # ipdb.set_trace()
+            cache_key = env_cache.get_key(env, dt, self)
+            env_buffer = env_cache.get(cache_key)
+            if env_buffer is None:
+                env_func = getattr(ep, env['env_func'])
+                _, env_samples = env_func(dt=dt, **env['paradict'])
+                env_buffer = self._quantize_env(env_samples)
+                env_cache.put(cache_key, env_buffer)
+            return env_buffer
         else:
             raise TypeError('env must be dict or array')
 
+    def _quantize_env(self, env_samples):
         env_samples = np.pad(env_samples, (0, (self.samples_per_clk//self.interp_ratio - len(env_samples)
                 % self.samples_per_clk//self.interp_ratio) % self.samples_per_clk//self.interp_ratio))
 
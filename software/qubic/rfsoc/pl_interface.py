@@ -1,14 +1,17 @@
 import numpy as np
-from pynq import Overlay
-import xrfclk
-import xrfdc
 import json
 import time
 import os
 import glob
-from qubic.rfsoc.bram import BramCfgs, vsign32
+from collections import deque
+from qubic.rfsoc.bram import BramCfgs, acc_to_iq, bram_words, write_block, write_wordwise
 
 
+RUN_TIME_HISTORY = 10000
+# register polling parameters for detecting the start of a run (see wait_started)
+START_POLL_INTERVAL = 10.e-6
+START_TIMEOUT = 1.e-3
+
 def vector(val):
     if isinstance(val,list) or isinstance(val,tuple) or isinstance(val, np.ndarray):
         vout = val
@@ -21,7 +24,7 @@ class PLInterface:
     This class is a low level interface to RFSoC PL, and is intended to be run on the RFSoC 
     ZYNQ ARM core, configured with pyq 3.0. Uses a pynq overlay for PS-PL communication.
     """
-    def __init__(self, commit_hash):
+    def __init__(self, commit_hash, blockwrite=True):
         """
         Parameters
         ----------
@@ -29,6 +32,10 @@ class PLInterface:
                 first 6 digits of gateware commit hash used to compile
                 the XSA to load. xsa files (along with bram and reg json files)
                 should be in rfsoc/bits/commit_hash.
+            blockwrite : bool
+                if True (default), BRAM buffers are written with a single slice
+                copy into the mmio array. Set to False to fall back to word-wise 
+                mmio writes on overlays that need them.
         """
         commit_dir = os.path.join(os.path.dirname(__file__), 'bits', commit_hash)
         self.bram_cfgs = BramCfgs(os.path.join(commit_dir, 'bram.json'))
@@ -42,6 +49,8 @@ class PLInterface:
         self.fmem = {}
         self.nproc = len([name for name in self.bram_cfgs.keys() if name[:7] == 'command'])
         self.commit_dir = commit_dir
+        self.blockwrite = blockwrite
+        self.run_times = deque(maxlen=RUN_TIME_HISTORY)
 
     def config_mts(self,dactiles=0xf,adctiles=0xf,daclatency=-1,adclatency=-1):
     # Set which RF tiles use MTS and turn MTS off
@@ -91,12 +100,17 @@ class PLInterface:
         """
         Load gateware into FPGA PL
         """
+        # pynq and the RFSoC drivers are only available on the board; they are imported 
+        # here so that PLInterface can be used without them (e.g. with a mock overlay)
+        from pynq import Overlay
+        import xrfdc # registers the RF data converter driver with pynq
         if xsafile is None:
             xsafile = glob.glob(os.path.join(self.commit_dir, 'psbd*.xsa'))[0]
         self.overlay = Overlay(xsafile, download=download)
         self.rfdc = self.overlay.rf_data_converter
 
     def refclks(self, lmk_freq, lmx_freq=0):
+        import xrfclk
         xrfclk.set_ref_clks(lmk_freq=lmk_freq,lmx_freq=lmx_freq)
 
     def read(self, name, start_addr=0, stop_addr=None):
@@ -136,7 +150,7 @@ class PLInterface:
 
         elif name in self.dspregs_cfg.keys():
             val = self.overlay.dspregs.mmio.read(self.dspregs_cfg[name]['base_addr']*4)
-        elif name in self.cfgregs.keys():
+        elif name in self.cfgregs_cfg.keys():
             val = self.overlay.cfgregs.mmio.read(self.cfgregs_cfg[name]['base_addr']*4)
         else:
             raise ValueError('could not find {}'.format(name))
@@ -151,20 +165,12 @@ class PLInterface:
         ----------
             index : int or str
                 core index to write
-            cmd_list : list
-                list of 128-bit command words to write
+            cmd_buf : bytes
+                packed 128-bit command words to write
             start_addr : int
                 starting address relative to base address
         """
-        bufname = 'command' + str(index)
-        addr = start_addr
-        dt = np.dtype(np.uint32)
-        dt = dt.newbyteorder('little')
-        cmd_array = np.frombuffer(cmd_buf, dtype=dt)
-        #self.overlay.bramctrl.mmio.array[start_addr : start_addr + len(cmd_array)] = cmd_array
-        for i, cmd_word in enumerate(cmd_array):
-            self.overlay.bramctrl.mmio.write((self.bram_cfgs[bufname].address + addr)*4, int(cmd_word))
-            addr += 1
+        self.write_mem_buf('command' + str(index), cmd_buf, start_addr)
 
     def write_env_buf(self, elem_type, index, env_list, start_addr=0):
         """
@@ -183,27 +189,54 @@ class PLInterface:
 
     def write_mem_buf(self, name, mem_vals, start_addr=0):
         """
-        General function for BRAM writes.
+        General function for BRAM writes. The whole buffer is validated
+        in one pass, then written using a single block copy (or word-by-word
+        if self.blockwrite is False).
+
+        Parameters
+        ----------
+            name : str
+                name of BRAM (referenced to bram.json)
+            mem_vals : bytes or np.ndarray
+                packed 32-bit values to write
+            start_addr : int
+                start write addr relative to base_addr
+        """
+        self.write_words(*self.stage_mem_buf(name, mem_vals, start_addr))
+
+    def stage_mem_buf(self, name, mem_vals, start_addr=0):
+        """
+        Validate a BRAM write without touching the hardware; the result can
+        be written later using write_words. Safe to call while a program is
+        running.
 
         Parameters
         ----------
             name : str
                 name of BRAM (referenced to bram.json)
-            mem_vals : list
-                list of values to write
+            mem_vals : bytes or np.ndarray
+                packed 32-bit values to write
             start_addr : int
                 start write addr relative to base_addr
+
+        Returns
+        -------
+            tuple:
+                (absolute word address, np.ndarray of uint32 words)
         """
-        #start_addr += self.bram_cfgs[name].address
-        #self.overlay.bramctrl.mmio.array[start_addr : start_addr + len(mem_vals)] = mem_vals
-        addr = start_addr
-        mem_vals = np.frombuffer(mem_vals, dtype=np.uint32)
-        for i, val in enumerate(mem_vals):
-            val = int(val)
-            assert self.bram_cfgs[name].access == 'write'
-            assert 0 <= val < 2**self.bram_cfgs[name].paradict['Awidth']
-            self.overlay.bramctrl.mmio.write((self.bram_cfgs[name].address + addr)*4, int(val))
-            addr += 1
+        words = bram_words(mem_vals)
+        self.bram_cfgs[name].check_write(words, start_addr)
+        return self.bram_cfgs[name].address + start_addr, words
+
+    def write_words(self, addr, words):
+        """
+        Write a (validated) block of words to BRAM, starting at absolute 
+        word address addr.
+        """
+        if self.blockwrite:
+            write_block(self.overlay.bramctrl.mmio, addr, words)
+        else:
+            write_wordwise(self.overlay.bramctrl.mmio, addr, words)
 
     def write_reg(self, name, value):
         """
@@ -223,7 +256,135 @@ class PLInterface:
         else:
             raise ValueError('register {} not found'.format(name))
 
-    def run_prog_acc(self, chanlist, nshots, readcnt=None, delay=0):
+    def read_acc(self, chan, readcnt=None, dtype=np.complex128, start=0):
+        """
+        Read back integrated IQ values from an accumulator buffer.
+
+        Parameters
+        ----------
+            chan : int or str
+                accbuf index to read from
+            readcnt : int
+                number of IQ values to read. Defaults to the full buffer
+                (from start)
+            dtype : np.dtype
+                np.complex128 (default) or np.complex64 for complex IQ; 
+                np.int32 to return raw (Q, I) pairs, with shape (readcnt, 2)
+            start : int
+                index of the first IQ value to read
+
+        Returns
+        -------
+            np.ndarray
+        """
+        buf = 'accbuf{}'.format(chan)
+        if readcnt is None:
+            readcnt = self.bram_cfgs[buf].length//2 - start
+        acc = acc_to_iq(self.read(buf, 2*start, 2*(start + readcnt)), dtype)
+        if np.dtype(dtype) == np.int32:
+            acc = acc.copy() # raw pairs are a view of the accbuf, which is overwritten on the next run
+        return acc
+
+    def get_acc_depth(self, chan):
+        """
+        Number of IQ values that fit in accumulator buffer chan
+        """
+        return self.bram_cfgs['accbuf{}'.format(chan)].length//2
+
+    def read_acc_ring(self, chan, start, readcnt, dtype=np.complex128):
+        """
+        Read readcnt IQ values from an accumulator buffer treated as a ring:
+        reads starting at index start (mod the buffer depth), wrapping around to 
+        the beginning of the buffer if necessary.
+        """
+        depth = self.get_acc_depth(chan)
+        start = start % depth
+        first = min(readcnt, depth - start)
+        acc = self.read_acc(chan, first, dtype, start)
+        if first < readcnt:
+            acc = np.concatenate((acc, self.read_acc(chan, readcnt - first, dtype, 0)))
+        return acc
+
+    def start_run(self, nshots):
+        """
+        Reset the accumulators and start a run of nshots shots
+        """
+        self.write_reg('nshot', nshots)
+        self.write_reg("resetacc", 1)
+        self.write_reg("resetacc", 0)
+        self.write_reg('start', 0)
+
+    def wait_started(self, poll_interval=START_POLL_INTERVAL, timeout=START_TIMEOUT):
+        """
+        Wait until the gateware reports that the run started by start_run is in
+        progress (busy set or lastshotdone cleared), so that status registers read 
+        afterwards (shotcnt, lastshotdone) refer to the new run instead of the 
+        previous one. 
+
+        A run that is already complete by the first read (e.g. a single short shot) 
+        looks the same as a start that hasn't taken effect yet; so if no start is seen 
+        within timeout, the status registers are assumed to reflect the new (complete) 
+        run. timeout should be much longer than the start latency of the gateware.
+
+        Parameters
+        ----------
+            poll_interval : float
+                time (in seconds) to wait between register reads
+            timeout : float
+                time (in seconds) after which to stop waiting
+
+        Returns
+        -------
+            bool:
+                True if the start of the run was observed
+        """
+        t0 = time.perf_counter()
+        while self.read('busy') == 0 and self.read('lastshotdone') != 0:
+            if time.perf_counter() - t0 > timeout:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def wait_done(self, nshots, poll_interval=100.e-6, timeout=10., done_reg='shotcnt'):
+        """
+        Poll a status register until the current run is complete. Call wait_started 
+        first after starting a run; otherwise the status registers may still report 
+        the (completed) previous run.
+
+        Parameters
+        ----------
+            nshots : int
+                number of shots in the current run
+            poll_interval : float
+                time (in seconds) to wait between register reads
+            timeout : float
+                time (in seconds) after which to give up
+            done_reg : str
+                'shotcnt' : run is done when the shot counter reaches nshots
+                'lastshotdone' : run is done when the last shot done flag is set
+
+        Returns
+        -------
+            float:
+                time elapsed (in seconds) until completion was detected
+        """
+        if done_reg == 'shotcnt':
+            is_done = lambda: self.read('shotcnt') >= nshots
+        elif done_reg == 'lastshotdone':
+            is_done = lambda: self.read('lastshotdone') != 0
+        else:
+            raise ValueError('done_reg must be shotcnt or lastshotdone, not {}'.format(done_reg))
+
+        t0 = time.perf_counter()
+        while not is_done():
+            elapsed = time.perf_counter() - t0
+            if elapsed > timeout:
+                raise TimeoutError('run of {} shots not done after {} s'.format(nshots, elapsed))
+            time.sleep(poll_interval)
+        return time.perf_counter() - t0
+
+    def run_prog_acc(self, chanlist, nshots, readcnt=None, delay=0, dtype=np.complex128, 
+                     poll=False, poll_interval=100.e-6, timeout=None, done_reg='shotcnt'):
         """
         Trigger the proc cores to start a program, run it for nshots iterations,
         and read back the integrated IQ data from the acc buffers
@@ -240,25 +401,137 @@ class PLInterface:
                 number of values to read back from each accbuf. Defaults to nshots
             delay : int
                 time to wait between starting program and reading back all results.
-                Should be set to roughly nshots*circuit_execution_time
+                Should be set to roughly nshots*circuit_execution_time. Ignored if
+                poll is True
+            dtype : np.dtype
+                np.complex128 (default) or np.complex64 for complex IQ; 
+                np.int32 to return raw (Q, I) pairs, with shape (readcnt, 2)
+            poll : bool
+                if True, wait for the run to start (see wait_started), then poll done_reg
+                (see wait_done) instead of sleeping for delay, and record the measured
+                run time in self.run_times
+            poll_interval : float
+                time (in seconds) between register reads if polling
+            timeout : float
+                polling timeout in seconds. Defaults to max(10*delay, 1)
+            done_reg : str
+                register used to detect completion if polling; see wait_done
 
         Returns
         -------
             dict:
-                Complex IQ shots for each accbuf in chanlist
+                Complex IQ shots (or raw IQ pairs) for each accbuf in chanlist
         """
-        self.write_reg('nshot', nshots)
-        self.write_reg("resetacc", 1)
-        self.write_reg("resetacc", 0)
-        self.write_reg('start', 0)
+        self.start_run(nshots)
         if readcnt is None:
             readcnt = nshots
         acc_iq = {}
-        time.sleep(delay)
+        if poll:
+            if timeout is None:
+                timeout = max(10*delay, 1.)
+            t0 = time.perf_counter()
+            self.wait_started()
+            self.wait_done(nshots, poll_interval, timeout, done_reg)
+            self.run_times.append((nshots, time.perf_counter() - t0))
+        else:
+            time.sleep(delay)
         for chan in chanlist:
-            buf = 'accbuf{}'.format(chan)
-            if readcnt is None:
-                readcnt = self.bram_cfgs[buf].length//2
-            readval = np.reshape(vsign32(self.read(buf, 0, readcnt*2).astype(int)), (-1, 2))
-            acc_iq[chan] = 1j*readval[:, 0] + readval[:, 1]
+            acc_iq[chan] = self.read_acc(chan, readcnt, dtype)
         return acc_iq
+
+    def run_prog_acc_stream(self, chanlist, nshots, reads_per_shot=1, dtype=np.complex128,
+                            poll_interval=100.e-6, timeout=1.):
+        """
+        Trigger the proc cores to start a program and run it for nshots iterations
+        as a single acquisition, streaming integrated IQ data out of the acc buffers
+        while the program is running. nshots*reads_per_shot may be (much) larger 
+        than the accbuf depth.
+
+        The accbufs are treated as ring buffers: this requires gateware that wraps 
+        the accbuf write address modulo the buffer depth instead of stopping when the
+        buffer is full. The fill level is derived from the shotcnt register, and 
+        the read pointer is kept in software. Only data from completed shots is read out.
+        If the gateware gets more than one buffer depth ahead of the read pointer
+        (i.e. unread data has been overwritten) an exception is raised; in that case
+        poll_interval should be reduced.
+
+        Whenever new shots are read, the accbuf write addresses reported by the 
+        addr_accbuf_mon registers (available for some channels; at least one channel 
+        in chanlist must have one) are checked against the fill level derived from 
+        shotcnt, and an exception is raised if they disagree (e.g. if the gateware 
+        doesn't wrap the write address).
+
+        Parameters
+        ----------
+            chanlist : list
+                list of channels to read from, referenced to proc_core/memory
+                indices
+            nshots : int
+                number of shots to run
+            reads_per_shot : int
+                number of accbuf values written per shot (per channel)
+            dtype : np.dtype
+                np.complex128 (default) or np.complex64 for complex IQ; 
+                np.int32 to return raw (Q, I) pairs
+            poll_interval : float
+                time (in seconds) to wait between shotcnt reads when no new data is
+                available
+            timeout : float
+                give up (raise TimeoutError) if no new shots complete within this 
+                time (in seconds)
+
+        Yields
+        ------
+            dict:
+                IQ values (or raw IQ pairs) read since the previous yield, for each 
+                accbuf in chanlist. All channels have the same number of values, which
+                is always a multiple of reads_per_shot
+        """
+        depth = min(self.get_acc_depth(chan) for chan in chanlist)
+        if reads_per_shot > depth:
+            raise ValueError('reads_per_shot ({}) exceeds accbuf depth ({})'.format(reads_per_shot, depth))
+        addr_mons = {chan: 'addr_accbuf_mon{}'.format(chan) for chan in chanlist 
+                     if 'addr_accbuf_mon{}'.format(chan) in self.dspregs_cfg}
+        if len(addr_mons) == 0:
+            raise ValueError('none of channels {} have an accbuf address monitor'.format(chanlist))
+        self.start_run(nshots)
+        self.wait_started()
+
+        n_reads = nshots*reads_per_shot
+        read_ptr = 0
+        t_last = time.perf_counter()
+        while read_ptr < n_reads:
+            write_ptr = min(self.read('shotcnt'), nshots)*reads_per_shot
+            if write_ptr == read_ptr:
+                if time.perf_counter() - t_last > timeout:
+                    raise TimeoutError('no shots completed in {} s; {} of {} shots done'
+                                       .format(timeout, read_ptr//reads_per_shot, nshots))
+                time.sleep(poll_interval)
+                continue
+            self._check_acc_addr(addr_mons, write_ptr, nshots, reads_per_shot)
+            # the shot in progress may already have written some of its values
+            if write_ptr + reads_per_shot - read_ptr > depth and write_ptr < n_reads:
+                raise Exception('accbuf overrun: {} unread values (depth {})'.format(write_ptr - read_ptr, depth))
+            acc_iq = {chan: self.read_acc_ring(chan, read_ptr, write_ptr - read_ptr, dtype) for chan in chanlist}
+
+            # data for the start of this chunk may have been overwritten while reading
+            if (self.read('shotcnt') + 1)*reads_per_shot - read_ptr > depth and write_ptr < n_reads:
+                raise Exception('accbuf overrun during readout at shot {}'.format(read_ptr//reads_per_shot))
+            read_ptr = write_ptr
+            t_last = time.perf_counter()
+            yield acc_iq
+
+    def _check_acc_addr(self, addr_mons, write_ptr, nshots, reads_per_shot):
+        """
+        Check the accbuf write addresses (in IQ values) reported by the addr_accbuf_mon 
+        registers against write_ptr, the number of values written according to 
+        shotcnt (read before calling this). The shot in progress (and any shots
+        completed since shotcnt was read) may have advanced the write address further.
+        """
+        addrs = {chan: self.read(mon) for chan, mon in addr_mons.items()}
+        max_ahead = (min(self.read('shotcnt'), nshots)*reads_per_shot - write_ptr) + reads_per_shot
+        for chan, addr in addrs.items():
+            depth = self.get_acc_depth(chan)
+            if max_ahead < depth and (addr - write_ptr) % depth >= max_ahead:
+                raise Exception('accbuf{} write address is {}, but {} values have been written; check that '
+                                'the gateware wraps the accbuf write address'.format(chan, addr, write_ptr))
@@ -1,5 +1,7 @@
 import xmlrpc.client
+import threading
 import numpy as np
+import qubic.binary_rpc as brpc
 
 class CircuitRunnerClient:
     """
@@ -121,3 +123,146 @@ class CircuitRunnerClient:
                 if True, (default), load env buffers
         """
         self.proxy.load_circuit(rawasm, zero, load_commands, load_freqs, load_envs)
+
+    def submit(self, raw_asm_list, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6,
+               reload_cmd=True, reload_freq=True, reload_env=True, zero_between_reload=True):
+        """
+        Queue a batch of circuits to run on the server without waiting for it
+        to finish. Arguments are the same as run_circuit_batch. This allows e.g. 
+        compiling/submitting the next batch while the current one runs.
+
+        Returns
+        -------
+            int:
+                job id, for use with status, fetch and cancel
+        """
+        return self.proxy.submit(raw_asm_list, n_total_shots, reads_per_shot, float(delay_per_shot),
+                                 reload_cmd, reload_freq, reload_env, zero_between_reload)
+
+    def status(self, job_id):
+        """
+        Get the status of a submitted job
+
+        Returns
+        -------
+            dict:
+                'status' : one of 'queued', 'running', 'done', 'cancelled', or 'error'
+                'n_circuits' : number of circuits in the job
+                'n_done' : number of circuits whose results are available
+                'shot_shape' : shape of the results for one circuit
+                'error' : error message if status is 'error', else None
+        """
+        return self.proxy.status(job_id)
+
+    def fetch(self, job_id, start=0, stop=None):
+        """
+        Get results for circuits start:stop (default all completed circuits) 
+        of a submitted job. Can be called while the job is running.
+
+        Returns
+        -------
+            dict:
+                Complex IQ shots for each accbuf in chanlist; each array has 
+                shape (n_fetched, n_total_shots, reads_per_shot)
+        """
+        shot_shape = tuple(self.proxy.status(job_id)['shot_shape'])
+        s11 = self.proxy.fetch(job_id, start, stop, True)
+        for ch in s11.keys():
+            s11[ch] = np.reshape(np.frombuffer(s11[ch].data, dtype=np.complex128), (-1,) + shot_shape)
+        return s11
+
+    def cancel(self, job_id):
+        """
+        Cancel a submitted job. Running jobs stop after the current circuit; 
+        cancelling a finished job discards its results on the server.
+
+        Returns
+        -------
+            str:
+                job status after cancelling
+        """
+        return self.proxy.cancel(job_id)
+
+
+class BinaryCircuitRunnerClient:
+    """
+    Drop-in replacement for CircuitRunnerClient that talks to a BinaryRPCServer
+    (see binary_rpc.py and rpc_server.py) instead of the XML-RPC server. Buffers and 
+    IQ data are transferred as raw binary, optionally zlib-compressed. The connection 
+    is kept open between calls.
+    """
+
+    def __init__(self, ip=None, port=brpc.DEFAULT_PORT, compress=0, unix_socket=None):
+        """
+        Parameters
+        ----------
+            ip : str
+            port : int
+            compress : int
+                zlib compression level (0-9) for buffers sent in both directions. 
+                0 (default) disables compression, which is usually fastest on a local network
+            unix_socket : str
+                if provided, connect to a UnixBinaryRPCServer at this path instead 
+                of ip:port
+        """
+        self.compress = compress
+        self._sock = brpc.connect(ip, port, unix_socket)
+        self._lock = threading.Lock()
+
+    def _call(self, method, *args, **kwargs):
+        with self._lock:
+            brpc.send_message(self._sock, {'method': method, 'args': args, 'kwargs': kwargs,
+                                           'compress': self.compress}, self.compress)
+            response = brpc.recv_message(self._sock)
+        if response['status'] != 'ok':
+            raise Exception('{} failed on server: {}'.format(method, response['error']))
+        return response['result']
+
+    def close(self):
+        self._sock.close()
+
+    def run_circuit(self, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6):
+        """
+        See CircuitRunnerClient.run_circuit
+        """
+        return self._call('run_circuit', n_total_shots, reads_per_shot, float(delay_per_shot))
+
+    def run_circuit_batch(self, raw_asm_list, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6,
+                          reload_cmd=True, reload_freq=True, reload_env=True, zero_between_reload=True):
+        """
+        See CircuitRunnerClient.run_circuit_batch
+        """
+        return self._call('run_circuit_batch', raw_asm_list, n_total_shots, reads_per_shot, float(delay_per_shot),
+                          reload_cmd, reload_freq, reload_env, zero_between_reload)
+
+    def load_circuit(self, rawasm, zero=True, load_commands=True, load_freqs=True, load_envs=True):
+        """
+        See CircuitRunnerClient.load_circuit
+        """
+        self._call('load_circuit', rawasm, zero, load_commands, load_freqs, load_envs)
+
+    def submit(self, raw_asm_list, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6,
+               reload_cmd=True, reload_freq=True, reload_env=True, zero_between_reload=True):
+        """
+        See CircuitRunnerClient.submit
+        """
+        return self._call('submit', raw_asm_list, n_total_shots, reads_per_shot, float(delay_per_shot),
+                          reload_cmd, reload_freq, reload_env, zero_between_reload)
+
+    def status(self, job_id):
+        """
+        See CircuitRunnerClient.status
+        """
+        return self._call('status', job_id)
+
+    def fetch(self, job_id, start=0, stop=None):
+        """
+        See CircuitRunnerClient.fetch
+        """
+        return self._call('fetch', job_id, start, stop)
+
+    def cancel(self, job_id):
+        """
+        See CircuitRunnerClient.cancel
+        """
+        return self._call('cancel', job_id)
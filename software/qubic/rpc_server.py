@@ -2,16 +2,30 @@
 Script to start and run an xmlrpc server on the ZCU216
 """
 import xmlrpc.server
+import socketserver
 from qubic.run import CircuitRunner
+from qubic.binary_rpc import BinaryRPCServer
+from qubic.job_queue import RunnerJobQueue, locked
 import logging
 import argparse
 
+class ThreadingXMLRPCServer(socketserver.ThreadingMixIn, xmlrpc.server.SimpleXMLRPCServer):
+    """
+    SimpleXMLRPCServer that handles each request in a separate thread, so that
+    job status/fetch calls aren't blocked by a long-running call into the runner
+    """
+    daemon_threads = True
+
+
 def run_rpc_server(ip, port, xsa_commit):
     """
     Start an xmlrpc server that exposes an instance of CircuitRunner over a 
     network. Intended to be run from the RFSoC ARM core python (pynq) 
     environment. IP should only be accessible locally!
 
+    In addition to the blocking CircuitRunner methods, exposes the asynchronous
+    job API (submit, status, fetch, cancel) from job_queue.RunnerJobQueue.
+
     Parameters
     ----------
         ip : str
@@ -19,24 +33,56 @@ def run_rpc_server(ip, port, xsa_commit):
         xsa_commit : str
     """
     runner = CircuitRunner(commit=xsa_commit)
+    job_queue = RunnerJobQueue(runner)
 
-    server = xmlrpc.server.SimpleXMLRPCServer((ip, port), logRequests=True, allow_none=True)
+    server = ThreadingXMLRPCServer((ip, port), logRequests=True, allow_none=True)
 
-    server.register_function(runner.load_circuit)
-    server.register_function(runner.run_circuit)
-    server.register_function(runner.run_circuit_batch)
+    # jobs and requests run in separate threads, so direct runner calls need to hold the job queue lock
+    server.register_function(locked(runner.load_circuit, job_queue.lock))
+    server.register_function(locked(runner.run_circuit, job_queue.lock))
+    server.register_function(locked(runner.run_circuit_batch, job_queue.lock))
+    server.register_function(job_queue.submit)
+    server.register_function(job_queue.status)
+    server.register_function(job_queue.fetch)
+    server.register_function(job_queue.cancel)
 
     print('RPC server running on {}:{}'.format(ip, port))
 
     server.serve_forever()
 
+def run_binary_rpc_server(ip, port, xsa_commit):
+    """
+    Start a BinaryRPCServer (see binary_rpc.py) that exposes an instance of 
+    CircuitRunner over a network, for use with rpc_client.BinaryCircuitRunnerClient. 
+    Intended to be run from the RFSoC ARM core python (pynq) environment. 
+    IP should only be accessible locally!
+
+    Parameters
+    ----------
+        ip : str
+        port : int
+        xsa_commit : str
+    """
+    runner = CircuitRunner(commit=xsa_commit)
+
+    server = BinaryRPCServer((ip, port), runner)
+
+    print('binary RPC server running on {}:{}'.format(ip, port))
+
+    server.serve_forever()
+
 if __name__=='__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--ip', default='192.168.1.247')
-    parser.add_argument('--port', default=9095)
+    parser.add_argument('--port', type=int, default=None)
     parser.add_argument('--xsa-commit', default='81f773e5')
+    parser.add_argument('--binary', action='store_true', 
+                        help='use the binary protocol (default port 9096) instead of xmlrpc (default port 9095)')
     args = parser.parse_args()
 
-    run_rpc_server(args.ip, args.port, args.xsa_commit)
+    if args.binary:
+        run_binary_rpc_server(args.ip, 9096 if args.port is None else args.port, args.xsa_commit)
+    else:
+        run_rpc_server(args.ip, 9095 if args.port is None else args.port, args.xsa_commit)
 
 
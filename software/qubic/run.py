@@ -1,8 +1,10 @@
 import qubic.rfsoc.pl_interface as pl
 import qubic.rfsoc.hwconfig as hw
+from qubic.rfsoc.bram import changed_ranges
 import distproc.assembler as am
 import numpy as np
 import pdb
+import hashlib
 from tqdm import tqdm
 from xmlrpc.client import Binary
 
@@ -10,6 +12,12 @@ ACC_BUF_SIZE = 1000
 
 ELEM_CHAN_TYPES = ['qdrv', 'rdrv', 'rdlo']
 
+def _get_bytes(buf):
+    if isinstance(buf, Binary):
+        return buf.data
+    return buf
+
+
 class CircuitRunner:
     """
     Class for taking a program in binary/ASM form and running it on 
@@ -22,11 +30,15 @@ class CircuitRunner:
         _pl_driver : pl.PLInterface instance used for low level access
                      to memory and registers
         loaded_channels : list of channels with a program currently loaded
+        diff_load : if True, keep a hash + shadow copy of each BRAM's contents, 
+                    and only write buffers (or word ranges) that have changed.
+                    BRAM writes that bypass this class (e.g. directly using
+                    _pl_driver) must be followed by invalidate_bram_shadow()
     """
 
-    def __init__(self, platform='rfsoc', commit='81f773e5', load_xsa=True):
+    def __init__(self, platform='rfsoc', commit='81f773e5', load_xsa=True, blockwrite=True, diff_load=True):
         if platform == 'rfsoc':
-            self._pl_driver = pl.PLInterface(commit)
+            self._pl_driver = pl.PLInterface(commit, blockwrite)
             self._pl_driver.load_overlay(download=load_xsa)
             self._pl_driver.refclks(lmk_freq=500.18)
             self._pl_driver.mts()
@@ -40,6 +52,10 @@ class CircuitRunner:
             raise Exception('rfsoc is the only implemented platform!')
 
         self.loaded_channels = []
+        self.diff_load = diff_load
+        self._bram_shadow = {}
+        self._zero_cmd_buf = self._get_zero_program()
+        self._zeroed_cores = set()
 
 
     def load_and_run(self, rawasm, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6):
@@ -117,9 +133,9 @@ class CircuitRunner:
                 str index of core mem to load
             cmd_buf : bytes or Binary
         """
-        if isinstance(cmd_buf, Binary):
-            cmd_buf = cmd_buf.data
-        self._pl_driver.write_cmd_buf(core_key, cmd_buf)
+        bufname = 'command' + str(core_key)
+        self._write_buffer(bufname, *self._pl_driver.stage_mem_buf(bufname, _get_bytes(cmd_buf)))
+        self._zeroed_cores.discard(str(core_key))
         if core_key not in self.loaded_channels:
             self.loaded_channels.append(core_key)
 
@@ -130,7 +146,9 @@ class CircuitRunner:
         a new program is loaded on a subset of cores such that the 
         previous program is not completely overwritten (e.g. you 
         are loading a program that runs only on core 2, and the 
-        previous program used cores 2 and 3).
+        previous program used cores 2 and 3). The dummy program is 
+        assembled once per runner; cores that already hold it (i.e. 
+        have not been loaded since they were last zeroed) are skipped.
 
         Parameters
         ----------
@@ -141,18 +159,25 @@ class CircuitRunner:
         if core_keys is None:
             core_keys = [str(i) for i in range(self._pl_driver.nproc)]
 
+        for core_key in core_keys:
+            if str(core_key) not in self._zeroed_cores:
+                bufname = 'command' + str(core_key)
+                self._write_buffer(bufname, *self._pl_driver.stage_mem_buf(bufname, self._zero_cmd_buf))
+                self._zeroed_cores.add(str(core_key))
+            if core_key in self.loaded_channels:
+                self.loaded_channels.remove(core_key)
+
+    def _get_zero_program(self):
+        """
+        Assemble the dummy program used by zero_command_buf: reset phase,
+        output done signal, then idle.
+        """
         rdrvelemcfg = hw.RFSoCElementCfg(16, 16)
         asm0 = am.SingleCoreAssembler([rdrvelemcfg, rdrvelemcfg, rdrvelemcfg])
         asm0.add_phase_reset()
         asm0.add_done_stb()
         cmd0, _, _ = asm0.get_compiled_program()
-
-        for i in core_keys:
-            self.load_command_buf(i, cmd0)
-
-        for i in core_keys:
-            if i in self.loaded_channels:
-                self.loaded_channels.remove(i)
+        return cmd0
 
     def load_env_buf(self, chan_type, core_key, env_buf):
         """
@@ -165,11 +190,10 @@ class CircuitRunner:
                 'qdrv', 'rdrv', or 'rdlo'
             core_key : str
                 str index of core mem to load
-            env_buf : bytes or Binary
+            env_buf : bytes, memoryview, or Binary
         """
-        if isinstance(env_buf, Binary):
-            env_buf = env_buf.data
-        self._pl_driver.write_env_buf(chan_type, core_key, env_buf)
+        bufname = chan_type + 'env' + str(core_key)
+        self._write_buffer(bufname, *self._pl_driver.stage_mem_buf(bufname, _get_bytes(env_buf)))
 
     def load_freq_buf(self, chan_type, core_key, freq_buf):
         """
@@ -184,13 +208,51 @@ class CircuitRunner:
                 str index of core mem to load
             freq_buf : bytes or Binary
         """
-        if isinstance(freq_buf, Binary):
-            freq_buf = freq_buf.data
-        self._pl_driver.write_freq_buf(chan_type, core_key, freq_buf)
+        bufname = chan_type + 'freq' + str(core_key)
+        self._write_buffer(bufname, *self._pl_driver.stage_mem_buf(bufname, _get_bytes(freq_buf)))
+
+    def _write_buffer(self, bufname, addr, words):
+        """
+        Write (validated) words to BRAM bufname, starting at absolute address addr. 
+        If self.diff_load is True, the write is skipped if its hash matches the 
+        previous write to the same location; otherwise only the word ranges that 
+        differ from the shadow copy of the BRAM are written.
+        """
+        if not self.diff_load:
+            self._pl_driver.write_words(addr, words)
+            return
+
+        if bufname not in self._bram_shadow:
+            length = self._pl_driver.bram_cfgs[bufname].length
+            self._bram_shadow[bufname] = {'words': np.zeros(length, dtype=np.uint32),
+                                          'known': np.zeros(length, dtype=bool),
+                                          'hashes': {}}
+        shadow = self._bram_shadow[bufname]
+        start = addr - self._pl_driver.bram_cfgs[bufname].address
+        stop = start + len(words)
+        digest = hashlib.sha1(words).digest()
+        if shadow['hashes'].get((start, stop)) == digest:
+            return
+
+        changed = ~shadow['known'][start:stop] | (shadow['words'][start:stop] != words)
+        for range_start, range_stop in changed_ranges(changed):
+            self._pl_driver.write_words(addr + range_start, words[range_start:range_stop])
+
+        shadow['words'][start:stop] = words
+        shadow['known'][start:stop] = True
+        shadow['hashes'] = {(start, stop): digest}
+
+    def invalidate_bram_shadow(self):
+        """
+        Forget the tracked BRAM contents, so the next load rewrites all
+        buffers in full.
+        """
+        self._bram_shadow = {}
+        self._zeroed_cores = set()
 
     def run_circuit_batch(self, raw_asm_list, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6,
                           reload_cmd=True, reload_freq=True, reload_env=True, zero_between_reload=True,
-                          from_server=False):
+                          from_server=False, poll=False):
         """
         Runs a batch of circuits given by a list of raw_asm "binaries". Each circuit is run n_total_shots
         times. reads_per_shot, n_total_shots, and delay_per_shot are passed directly into run_circuit, and must
@@ -198,7 +260,16 @@ class CircuitRunner:
         zero_between_reload control which of these fields is rewritten circuit-to-circuit (everything is 
         rewritten initially). Leave these all at True (default) for maximum safety, to ensure that QubiC 
         is in a clean state before each run. Depending on the circuits, some of these can be turned off 
-        to save time.
+        to save time. Note that if self.diff_load is True (default), unchanged buffers (and unchanged
+        words within modified buffers) are not rewritten regardless of these settings.
+
+        Each circuit is loaded after the previous one has finished running: the gateware 
+        has a single command/env/freq memory per core, which is read by the running 
+        program, so the next circuit can't be written while the current one is running. 
+        Use diff_load (and the reload_* flags) to reduce the load time between circuits.
+
+        This is a convenience wrapper around iter_circuit_batch, which should be used 
+        instead for large batches to avoid holding all of the results in memory.
 
         TODO: consider throwing some version of all the args here into a BatchedCircuitRun or somesuch
         object
@@ -223,6 +294,8 @@ class CircuitRunner:
             from_server : bool
                 set to true if calling over RPC. If True, pack returned s11 arrays into
                 byte objects
+            poll : bool
+                if True, poll for run completion instead of sleeping; see run_circuit
         Returns
         -------
             dict:
@@ -233,13 +306,10 @@ class CircuitRunner:
                             dtype=np.complex128) for ch in raw_asm_list[0].keys()}
         #TODO: using the channels in the first raw_asm_list elem is hacky, should figure out
         # a better way to initialize
-        for i, raw_asm in enumerate(tqdm(raw_asm_list)):
-            if i==0:
-                self.load_circuit(raw_asm, True, True, True, True)
-            else:
-                self.load_circuit(raw_asm, zero=zero_between_reload, load_commands=reload_cmd,
-                                  load_freqs=reload_freq, load_envs=reload_env)
-            s11_i = self.run_circuit(n_total_shots, reads_per_shot, delay_per_shot)
+        batch_iter = self.iter_circuit_batch(raw_asm_list, n_total_shots, reads_per_shot, delay_per_shot, 
+                                             reload_cmd, reload_freq, reload_env, zero_between_reload, 
+                                             poll=poll)
+        for i, s11_i in enumerate(tqdm(batch_iter, total=len(raw_asm_list))):
             for ch in s11_i.keys():
                 s11[ch][i] = s11_i[ch]
 
@@ -249,14 +319,54 @@ class CircuitRunner:
 
         return s11
 
+    def iter_circuit_batch(self, raw_asm_list, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6,
+                           reload_cmd=True, reload_freq=True, reload_env=True, zero_between_reload=True,
+                           dtype=np.complex128, poll=False, stream=False):
+        """
+        Generator version of run_circuit_batch: runs the circuits in raw_asm_list 
+        one at a time, yielding the results of each circuit as soon as they have 
+        been read back. Only the current circuit's results are kept in memory. The 
+        next circuit is not loaded until the consumer requests it, so processing 
+        the yielded results delays the rest of the batch.
+
+        Parameters
+        ----------
+            raw_asm_list : iterable
+                raw_asm binaries to run. May be a generator (e.g. of circuits compiled
+                on the fly)
+            n_total_shots, reads_per_shot, delay_per_shot, reload_cmd, reload_freq, 
+            reload_env, zero_between_reload, poll : 
+                see run_circuit_batch
+            dtype : np.dtype
+                output dtype; see run_circuit
+            stream : bool
+                if True, run each circuit as a single streaming acquisition; see run_circuit
+
+        Yields
+        ------
+            dict:
+                IQ shots for each loaded channel, with shape (n_total_shots, reads_per_shot)
+                (or (n_total_shots, reads_per_shot, 2) if dtype is np.int32)
+        """
+        for i, raw_asm in enumerate(raw_asm_list):
+            if i == 0:
+                self.load_circuit(raw_asm, True, True, True, True)
+            else:
+                self.load_circuit(raw_asm, zero=zero_between_reload, load_commands=reload_cmd,
+                                  load_freqs=reload_freq, load_envs=reload_env)
+            yield self.run_circuit(n_total_shots, reads_per_shot, delay_per_shot, dtype=dtype, 
+                                   poll=poll, stream=stream)
 
-    def run_circuit(self, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6, from_server=False):
+    def run_circuit(self, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6, from_server=False,
+                    dtype=np.complex128, poll=False, stream=False):
         """
         Run the currently loaded program and acquire integrated IQ shots. Program is
         run n_total_shots times, in batches of size shots_per_run (i.e. shots_per_run runs of the program
         are executed in logic before each readback/restart cycle). The current gateware 
         is limited to ~1000 reads in its IQ buffer, which generally means 
-        shots_per_run = 1000//reads_per_shot
+        shots_per_run = 1000//reads_per_shot. If stream is True, all shots are instead
+        run as a single acquisition, with the IQ buffers read out as they fill (see
+        PLInterface.run_prog_acc_stream)
 
         Parameters
         ----------
@@ -271,25 +381,47 @@ class CircuitRunner:
             from_server : bool
                 set to true if calling over RPC. If True, pack returned s11 arrays into
                 byte objects
+            dtype : np.dtype
+                np.complex128 (default) or np.complex64 for complex IQ; np.int32 to 
+                return the raw (Q, I) accumulator pairs
+            poll : bool
+                if True, poll the gateware shot counter to detect when each run is done
+                instead of sleeping for delay_per_shot*shots_per_run (which is then only 
+                used to set the timeout). Measured run times are recorded in 
+                self._pl_driver.run_times
+            stream : bool
+                if True, run all n_total_shots without restarting the program, reading 
+                the accbufs as ring buffers while the program runs. Requires gateware that 
+                wraps the accbuf write address. poll is ignored in this mode
 
         Returns
         -------
             dict:
                 Complex IQ shots for each accbuf in chanlist; each array has 
-                shape (n_total_shots, reads_per_shot)
+                shape (n_total_shots, reads_per_shot) (or (n_total_shots, reads_per_shot, 2)
+                if dtype is np.int32)
         """
+        if stream:
+            s11 = self._run_circuit_stream(n_total_shots, reads_per_shot, delay_per_shot, dtype)
+            if from_server:
+                for ch in self.loaded_channels:
+                    s11[ch] = s11[ch].tobytes()
+            return s11
+
         shots_per_run = min(ACC_BUF_SIZE//reads_per_shot, n_total_shots)
         n_runs = int(np.ceil(n_total_shots/shots_per_run))
-        s11 = {ch: np.zeros((shots_per_run*n_runs, reads_per_shot), dtype=np.complex128) for ch in self.loaded_channels}
+        shot_shape = (reads_per_shot, 2) if np.dtype(dtype) == np.int32 else (reads_per_shot,)
+        s11 = {ch: np.zeros((shots_per_run*n_runs,) + shot_shape, dtype=dtype) for ch in self.loaded_channels}
         delay = delay_per_shot*shots_per_run
         for i in range(n_runs):
-            result = self._pl_driver.run_prog_acc(self.loaded_channels, shots_per_run, readcnt=reads_per_shot*shots_per_run, delay=delay)
+            result = self._pl_driver.run_prog_acc(self.loaded_channels, shots_per_run, readcnt=reads_per_shot*shots_per_run, 
+                                                  delay=delay, dtype=dtype, poll=poll)
             for ch in self.loaded_channels:
-                s11[ch][i*shots_per_run : (i + 1)*shots_per_run, :] = result[ch].reshape((shots_per_run, reads_per_shot))
+                s11[ch][i*shots_per_run : (i + 1)*shots_per_run] = result[ch].reshape((shots_per_run,) + shot_shape)
 
         #remove extraneous data
         if shots_per_run*n_runs > n_total_shots:
-            for ch in self.loaded_chanels:
+            for ch in self.loaded_channels:
                 s11[ch] = s11[ch][:n_total_shots]
 
         if from_server:
@@ -297,3 +429,23 @@ class CircuitRunner:
                 s11[ch] = s11[ch].tobytes()
 
         return s11
+
+    def _run_circuit_stream(self, n_total_shots, reads_per_shot, delay_per_shot, dtype):
+        """
+        Run n_total_shots as one continuous acquisition, copying streamed accbuf 
+        chunks into preallocated output arrays. Polls roughly four times per 
+        buffer fill.
+        """
+        shot_shape = (reads_per_shot, 2) if np.dtype(dtype) == np.int32 else (reads_per_shot,)
+        s11 = {ch: np.zeros((n_total_shots,) + shot_shape, dtype=dtype) for ch in self.loaded_channels}
+        depth = min(self._pl_driver.get_acc_depth(ch) for ch in self.loaded_channels)
+        poll_interval = delay_per_shot*max(depth//reads_per_shot, 1)/4
+        stream = self._pl_driver.run_prog_acc_stream(self.loaded_channels, n_total_shots, reads_per_shot, dtype=dtype,
+                                                     poll_interval=poll_interval, timeout=max(10*delay_per_shot, 1.))
+        shot_ind = 0
+        for acc_iq in stream:
+            nshots = len(acc_iq[self.loaded_channels[0]])//reads_per_shot
+            for ch in self.loaded_channels:
+                s11[ch][shot_ind : shot_ind + nshots] = acc_iq[ch].reshape((nshots,) + shot_shape)
+            shot_ind += nshots
+        return s11
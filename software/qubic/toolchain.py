@@ -4,50 +4,309 @@ import qubic.rfsoc.hwconfig as hw
 import qubitconfig.qchip as qc
 import json
 import os
+import hashlib
+import pickle
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
-def run_compile_stage(program, fpga_config, qchip):
+# per-process state for batch compile/assemble workers; set once by the pool initializer
+# so that configs aren't pickled with every circuit
+_worker_state = {}
+
+def _init_worker(fn, *config):
+    _worker_state['fn'] = fn
+    _worker_state['config'] = config
+
+def _run_worker(item):
+    return _worker_state['fn'](item, *_worker_state['config'])
+
+def _compile_circuit(circuit, fpga_config, qchip):
+    compiler = cm.Compiler(circuit, 'by_qubit', fpga_config, qchip)
+    return compiler.compile()
+
+def _assemble_program(compiled_program, channel_configs, pack_envs=False):
+    asm = am.GlobalAssembler(compiled_program, channel_configs, hw.RFSoCElementCfg, pack_envs)
+    return asm.get_assembled_program()
+
+def _run_batch(fn, items, config, n_workers, chunksize):
+    """
+    Evaluate fn(item, *config) for each item, either serially (n_workers=1) or 
+    using a process pool, where config is sent once to each worker. Output order 
+    always matches the input order.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if n_workers == 1 or len(items) <= 1:
+        return [fn(item, *config) for item in items]
+
+    if chunksize is None:
+        chunksize = max(1, len(items)//(4*n_workers))
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(fn,) + config) as executor:
+        return list(executor.map(_run_worker, items, chunksize=chunksize))
+
+def _canonicalize(obj):
+    """
+    Convert obj (program, config, etc) into a JSON-serializable form that
+    is independent of dict ordering, for hashing
+    """
+    if isinstance(obj, dict):
+        items = [(json.dumps(_canonicalize(k)), _canonicalize(v)) for k, v in obj.items()]
+        return {'__dict__': sorted(items, key=lambda item: item[0])}
+    elif isinstance(obj, (list, tuple)):
+        return [_canonicalize(v) for v in obj]
+    elif isinstance(obj, np.ndarray):
+        return {'__ndarray__': hashlib.sha1(np.ascontiguousarray(obj).tobytes()).hexdigest(), 
+                'dtype': obj.dtype.str, 'shape': obj.shape}
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    elif isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+    elif hasattr(obj, '__dict__'):
+        return {'__obj__': type(obj).__name__, 'attrs': _canonicalize(vars(obj))}
+    else:
+        return repr(obj)
+
+def _hash(obj):
+    return hashlib.sha256(json.dumps(_canonicalize(obj)).encode()).hexdigest()
+
+def _get_gatenames(program, gatenames):
+    """
+    Get the names of all qchip gates directly referenced by program (including 
+    inside control flow blocks)
+    """
+    for statement in program:
+        if 'qubit' in statement.keys() and statement['name'] not in cm.RESRV_NAMES + ['virtualz']:
+            gatenames.add(''.join(statement['qubit']) + statement['name'])
+        for block in ['true', 'false', 'body']:
+            if block in statement.keys():
+                _get_gatenames(statement[block], gatenames)
+    return gatenames
+
+
+class CompileCache:
+    """
+    Content-addressed cache of compiled (CompiledProgram) and assembled (raw asm) 
+    programs, for use with run_compile_stage and run_assemble_stage. Compiled 
+    programs are keyed by a hash of the canonicalized circuit, the definitions of 
+    all qchip gates it references (as well as qubit frequencies), and the 
+    fpga_config. Since the gate definitions are part of the key, any change to a 
+    referenced gate (e.g. using QChip.update) results in a cache miss, and entries 
+    for the old definition eventually get evicted. Assembled programs are keyed 
+    by a hash of the compiled program and channel_configs.
+
+    Entries are pickled and kept in an in-memory LRU, and optionally also 
+    written to cache_dir, which persists across sessions. Each lookup unpickles 
+    a new copy, so callers are free to modify the returned objects (e.g. the 
+    program of a CompiledProgram) without affecting later hits.
+
+    Attributes:
+        hits : int
+        misses : int
+    """
+
+    def __init__(self, maxsize=4096, cache_dir=None):
+        """
+        Parameters
+        ----------
+            maxsize : int
+                maximum number of entries (compiled + assembled) in the in-memory LRU
+            cache_dir : str
+                if provided, entries are also stored here (one file per entry)
+        """
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def compile_keys(self, circuits, fpga_config, qchip):
+        """
+        Get cache keys for a list of circuits
+        """
+        config_hash = _hash([fpga_config, qchip.qubit_dict])
+        gate_hashes = {}
+        keys = []
+        for circuit in circuits:
+            gatenames = sorted(_get_gatenames(circuit, set()))
+            for gatename in gatenames:
+                if gatename not in gate_hashes:
+                    gate_hashes[gatename] = self._gate_hash(gatename, qchip)
+            keys.append('compile_' + _hash([config_hash, circuit, [gate_hashes[name] for name in gatenames]]))
+        return keys
+
+    def assemble_keys(self, compiled_programs, channel_configs, pack_envs=False):
+        """
+        Get cache keys for a list of CompiledPrograms
+        """
+        config_hash = _hash([channel_configs, pack_envs]) if pack_envs else _hash(channel_configs)
+        return ['asm_' + _hash([config_hash, prog.program, prog.fpga_config]) for prog in compiled_programs]
+
+    def _gate_hash(self, gatename, qchip):
+        """
+        Hash gate definition, including any other gates it references
+        """
+        if gatename not in qchip.gates:
+            return None # let the compiler raise the error
+        gate = qchip.gates[gatename]
+        refs = [self._gate_hash(item['gate'], qchip) for item in gate.contents 
+                if isinstance(item, dict) and 'gate' in item.keys()]
+        return _hash([gatename, gate.cfg_dict, refs])
+
+    def get(self, key):
+        """
+        Returns
+        -------
+            cached object, or None if key is not in the cache
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if data is None and self.cache_dir is not None and os.path.exists(self._path(key)):
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+            self._put_mem(key, data)
+            with self._lock:
+                self.hits += 1
+        if data is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        return pickle.loads(data)
+
+    def put(self, key, value):
+        """
+        Store a copy of value; later changes to value are not reflected in the cache
+        """
+        data = pickle.dumps(value)
+        self._put_mem(key, data)
+        if self.cache_dir is not None:
+            tmp_path = self._path(key) + '.tmp{}'.format(os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+
+    def clear(self):
+        """
+        Clear the in-memory cache (on-disk entries are kept)
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _put_mem(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def get_or_build(self, keys, items, build_fn):
+        """
+        Get the cached values for keys; missing values are computed (in one call) 
+        using build_fn(list of items) and added to the cache
+        """
+        values = [self.get(key) for key in keys]
+        miss_inds = [i for i, value in enumerate(values) if value is None]
+        if miss_inds:
+            built = build_fn([items[i] for i in miss_inds])
+            for i, value in zip(miss_inds, built):
+                self.put(keys[i], value)
+                values[i] = value
+        return values
+
+
+def run_compile_stage(program, fpga_config, qchip, n_workers=1, chunksize=None, cache=None):
     """
     Wrapper around distributed processor compiler stage. Will add more
     options/functionality as QubiC evolves and more platforms are included
 
     Parameters
     ----------
+        program : list
+            single circuit (list of dicts) or batch of circuits (list of lists)
+        fpga_config : hw.FPGAConfig
+        qchip : qc.QChip
+        n_workers : int
+            number of worker processes to use if compiling a batch of circuits. 
+            1 (default) compiles serially in this process; None uses all CPUs
+        chunksize : int
+            number of circuits sent to a worker at a time. Defaults to 
+            len(program)//(4*n_workers)
+        cache : CompileCache
+            if provided, look up circuits in cache and only compile the
+            ones that are missing
 
     Returns
     -------
-	CompiledProgram
-	    Object containing compiled
+	CompiledProgram or list of CompiledProgram
+	    Object containing compiled program (one per circuit if program
+            is a batch, in the same order)
     """
 
     if isinstance(program[0], dict):
+        if cache is not None:
+            return run_compile_stage([program], fpga_config, qchip, cache=cache)[0]
         compiler = cm.Compiler(program, 'by_qubit', fpga_config, qchip)
         return compiler.compile()
     elif isinstance(program[0], list):
-        compiled_progs = []
-        for circuit in program:
-            compiler = cm.Compiler(circuit, 'by_qubit', fpga_config, qchip)
-            compiled_progs.append(compiler.compile())
-        return compiled_progs
+        if cache is not None:
+            return cache.get_or_build(cache.compile_keys(program, fpga_config, qchip), program, 
+                                      lambda circuits: _run_batch(_compile_circuit, circuits, (fpga_config, qchip), 
+                                                                  n_workers, chunksize))
+        return _run_batch(_compile_circuit, program, (fpga_config, qchip), n_workers, chunksize)
     else:
         raise TypeError
 
-def run_assemble_stage(compiled_program, channel_configs, target_platform='rfsoc'):
+def run_assemble_stage(compiled_program, channel_configs, target_platform='rfsoc', n_workers=1, chunksize=None,
+                       cache=None, pack_envs=False):
     """
     Wrapper around distributed processor assembler stage. Will add more
     options/functionality as QubiC evolves and more platforms are included
+
+    Parameters
+    ----------
+        compiled_program : CompiledProgram or list of CompiledProgram
+        channel_configs : dict
+            output of hw.load_channel_configs
+        target_platform : str
+        n_workers : int
+            number of worker processes to use if assembling a list of programs; see
+            run_compile_stage
+        chunksize : int
+            number of programs sent to a worker at a time; see run_compile_stage
+        cache : CompileCache
+            if provided, look up programs in cache and only assemble the
+            ones that are missing
+        pack_envs : bool
+            if True, pack envelope buffers to reuse identical sample runs
+            (see distproc.assembler.SingleCoreAssembler._get_env_buffer)
     """
     if target_platform != 'rfsoc':
         raise Exception('rfsoc is currently the only supported platform!')
 
+    if cache is not None:
+        if isinstance(compiled_program, list):
+            return cache.get_or_build(cache.assemble_keys(compiled_program, channel_configs, pack_envs), 
+                                      compiled_program,
+                                      lambda progs: run_assemble_stage(progs, channel_configs, target_platform, 
+                                                                       n_workers, chunksize, pack_envs=pack_envs))
+        return run_assemble_stage([compiled_program], channel_configs, target_platform, cache=cache, 
+                                  pack_envs=pack_envs)[0]
+
     if isinstance(compiled_program, list):
-        raw_asm_progs = []
-        for prog in compiled_program:
-            asm = am.GlobalAssembler(prog, channel_configs, hw.RFSoCElementCfg)
-            raw_asm_progs.append(asm.get_assembled_program())
-        return raw_asm_progs
+        return _run_batch(_assemble_program, compiled_program, (channel_configs, pack_envs), n_workers, chunksize)
 
     else:
-        asm = am.GlobalAssembler(compiled_program, channel_configs, hw.RFSoCElementCfg)
+        asm = am.GlobalAssembler(compiled_program, channel_configs, hw.RFSoCElementCfg, pack_envs)
         return asm.get_assembled_program()
 
 def build_fromdict(build_dict):
@@ -0,0 +1,152 @@
+import types
+import numpy as np
+import pytest
+import qubic.rfsoc.pl_interface as pl
+
+COMMIT = '81f773e5'
+STATUS_REGS = ['busy', 'lastshotdone', 'shotcnt', 'addr_accbuf_mon0', 'addr_accbuf_mon1',
+               'addr_accbuf_mon2', 'addr_accbuf_mon3']
+
+
+class MockMMIO:
+    """
+    Minimal stand-in for pynq.MMIO: a uint32 array plus
+    byte-addressed read/write methods
+    """
+    def __init__(self, nwords):
+        self.array = np.zeros(nwords, dtype=np.uint32)
+
+    def read(self, offset):
+        return int(self.array[offset//4])
+
+    def write(self, offset, value):
+        self.array[offset//4] = value
+
+
+class MockDSPRegs:
+    """
+    Stand-in for the dspregs MMIO that simulates the run control registers.
+    The simulated run advances by one step per status register read:
+
+        - after a start, the previous run's status stays visible for
+          reset_lag reads
+        - a shot completes every shot_reads reads; each shot writes acc_per_shot
+          values to every accbuf, as (Q, I) = (run index, shot index)
+
+    If reset_lag and shot_reads are both 0, the whole run completes as soon as
+    it is started. If wrap is False, the accbuf write address stops at the end
+    of the buffer instead of wrapping around.
+    """
+    def __init__(self, regs_cfg, bram_mmio, bram_cfgs, reset_lag=0, shot_reads=0, acc_per_shot=1, wrap=True):
+        self.regs_cfg = regs_cfg
+        self.addr_map = {cfg['base_addr']*4: name for name, cfg in regs_cfg.items()}
+        self.values = {name: int(str(cfg['init']), 0) for name, cfg in regs_cfg.items()}
+        self.bram_mmio = bram_mmio
+        self.accbufs = [bram_cfgs[name] for name in sorted(bram_cfgs.keys()) if name.startswith('accbuf')]
+        self.depth = self.accbufs[0].length//2
+        self.reset_lag = reset_lag
+        self.shot_reads = shot_reads
+        self.acc_per_shot = acc_per_shot
+        self.wrap = wrap
+        self.n_runs = 0
+        self.n_status_reads = 0
+        self._lag = None
+        self._reads = 0
+        self._acc_addr = 0
+
+    def write(self, offset, value):
+        name = self.addr_map[offset]
+        self.values[name] = value
+        if name == 'start':
+            self.n_runs += 1
+            self._lag = self.reset_lag
+            if self.reset_lag == 0 and self.shot_reads == 0:
+                self._reset()
+                while self.values['busy']:
+                    self._shot()
+
+    def read(self, offset):
+        name = self.addr_map[offset]
+        if name in STATUS_REGS:
+            self.n_status_reads += 1
+            self._step()
+        return self.values[name]
+
+    def _step(self):
+        if self._lag is None:
+            return
+        elif self._lag > 0:
+            self._lag -= 1
+        elif self._lag == 0:
+            self._lag = -1
+            self._reset()
+        elif self.values['busy']:
+            self._reads += 1
+            if self._reads >= self.shot_reads:
+                self._reads = 0
+                self._shot()
+
+    def _reset(self):
+        self.values.update({'busy': 1, 'lastshotdone': 0, 'shotcnt': 0})
+        self._acc_addr = 0
+        self._set_addr_mon()
+
+    def _shot(self):
+        for i in range(self.acc_per_shot):
+            if not self.wrap and self._acc_addr >= self.depth:
+                break
+            for accbuf in self.accbufs:
+                addr = accbuf.address + 2*(self._acc_addr % self.depth)
+                self.bram_mmio.array[addr : addr + 2] = [self.n_runs, self.values['shotcnt']]
+            self._acc_addr += 1
+        self._set_addr_mon()
+        self.values['shotcnt'] += 1
+        if self.values['shotcnt'] >= self.values['nshot']:
+            self.values.update({'busy': 0, 'lastshotdone': 1})
+
+    def _set_addr_mon(self):
+        addr = self._acc_addr % self.depth if self.wrap else min(self._acc_addr, self.depth)
+        for i in range(4):
+            self.values['addr_accbuf_mon{}'.format(i)] = addr
+
+
+class MockOverlay:
+    """
+    Stand-in for the pynq overlay used by PLInterface
+    """
+    def __init__(self, pl_driver, **gateware_kwargs):
+        nwords = max(cfg.address + cfg.length for cfg in pl_driver.bram_cfgs.values())
+        self.bramctrl = types.SimpleNamespace(mmio=MockMMIO(nwords))
+        self.cfgregs = types.SimpleNamespace(mmio=MockMMIO(max(cfg['base_addr'] for cfg in pl_driver.cfgregs_cfg.values()) + 1))
+        self.dspregs = types.SimpleNamespace(mmio=MockDSPRegs(pl_driver.dspregs_cfg, self.bramctrl.mmio,
+                                                              pl_driver.bram_cfgs, **gateware_kwargs))
+
+
+@pytest.fixture
+def mock_pl():
+    """
+    Factory for PLInterface objects connected to a MockOverlay; keyword
+    args are passed to MockDSPRegs
+    """
+    def make_pl(**gateware_kwargs):
+        pl_driver = pl.PLInterface(COMMIT)
+        pl_driver.overlay = MockOverlay(pl_driver, **gateware_kwargs)
+        return pl_driver
+    return make_pl
+
+
+@pytest.fixture
+def mock_runner(monkeypatch):
+    """
+    Factory for CircuitRunner objects connected to a MockOverlay; keyword
+    args are passed to CircuitRunner
+    """
+    import qubic.run as run
+    monkeypatch.setattr(pl.PLInterface, 'load_overlay', 
+                        lambda self, xsafile=None, download=True: setattr(self, 'overlay', MockOverlay(self)))
+    for method in ['refclks', 'mts', 'dacnyquist', 'adcnyquist']:
+        monkeypatch.setattr(pl.PLInterface, method, lambda self, *args, **kwargs: 0)
+
+    def make_runner(**kwargs):
+        return run.CircuitRunner(commit=COMMIT, **kwargs)
+    return make_runner
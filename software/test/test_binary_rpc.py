@@ -0,0 +1,146 @@
+import socket
+import threading
+import time
+from xmlrpc.client import Binary
+import numpy as np
+import pytest
+import qubic.binary_rpc as brpc
+from qubic.rpc_client import BinaryCircuitRunnerClient
+
+class StubRunner:
+    """
+    Runner that stores the last loaded circuit, and returns
+    IQ data encoding the run arguments
+    """
+    def __init__(self):
+        self.rawasm = None
+        self.n_invalidated = 0
+
+    def load_circuit(self, rawasm, zero=True, load_commands=True, load_freqs=True, load_envs=True):
+        self.rawasm = rawasm
+
+    def get_rawasm(self):
+        return self.rawasm
+
+    def invalidate_bram_shadow(self):
+        self.n_invalidated += 1
+
+    def run_circuit(self, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6):
+        if n_total_shots <= 0:
+            raise ValueError('n_total_shots must be positive')
+        shots = np.arange(n_total_shots*reads_per_shot).reshape((n_total_shots, reads_per_shot))
+        return {'0': shots + 1j*delay_per_shot, '1': -shots + 0j}
+
+    def run_circuit_batch(self, raw_asm_list, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6,
+                          reload_cmd=True, reload_freq=True, reload_env=True, zero_between_reload=True):
+        return {'0': np.stack([self.run_circuit(n_total_shots, reads_per_shot, delay_per_shot)['0']
+                               + len(raw_asm) for raw_asm in raw_asm_list])}
+
+    def iter_circuit_batch(self, raw_asm_list, n_total_shots, reads_per_shot=1, delay_per_shot=500.e-6, **kwargs):
+        for raw_asm in raw_asm_list:
+            yield {'0': self.run_circuit(n_total_shots, reads_per_shot, delay_per_shot)['0'] + len(raw_asm)}
+
+@pytest.fixture
+def server(tmp_path):
+    server = brpc.UnixBinaryRPCServer(str(tmp_path/'rpc.sock'), StubRunner(),
+                                      methods=brpc.RUNNER_METHODS + ('get_rawasm',))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+@pytest.fixture
+def decoded(monkeypatch):
+    """
+    Records the descriptors of all buffers decoded by either end of the connection
+    """
+    descs = []
+    decode_buffer = brpc._decode_buffer
+    def recording_decode_buffer(desc, data):
+        descs.append(desc)
+        return decode_buffer(desc, data)
+    monkeypatch.setattr(brpc, '_decode_buffer', recording_decode_buffer)
+    return descs
+
+def make_rawasm():
+    rng = np.random.default_rng(0)
+    return {'0': {'cmd_buf': rng.bytes(16*brpc.MIN_COMPRESS_SIZE),
+                  'env_buffers': {0: Binary(bytes(brpc.MIN_COMPRESS_SIZE)), 1: Binary(b'\x01\x02')},
+                  'freq_buffers': {0: np.zeros((2, brpc.MIN_COMPRESS_SIZE), dtype=np.int32),
+                                   1: rng.integers(-2**31, 2**31, (100, 3), dtype=np.int32)[:, ::2]}},
+            '1': {'cmd_buf': b'', 'env_buffers': {}, 'freq_buffers': {0: np.arange(5, dtype=np.int32)}}}
+
+def check_rawasm(received, sent):
+    assert received.keys() == sent.keys()
+    for chan in sent.keys():
+        assert received[chan]['cmd_buf'] == sent[chan]['cmd_buf']
+        for ind, buf in sent[chan]['env_buffers'].items():
+            assert received[chan]['env_buffers'][str(ind)] == buf.data
+        for ind, buf in sent[chan]['freq_buffers'].items():
+            received_buf = received[chan]['freq_buffers'][str(ind)]
+            assert received_buf.dtype == np.int32
+            assert np.array_equal(received_buf, buf)
+
+@pytest.mark.parametrize('compress', [0, 6])
+def test_send_recv_message(decoded, compress):
+    obj = {'bytes': bytes(range(256))*64, 'binary': Binary(b'abc'), 'int': np.int32(3), 'float': 1.5,
+           'none': None, 'list': [np.arange(10, dtype=np.int32), (1, 'a')],
+           'complex': np.exp(1j*np.linspace(0, 1, 2*brpc.MIN_COMPRESS_SIZE)).reshape((-1, 2))}
+    sock0, sock1 = socket.socketpair()
+    with sock0, sock1:
+        brpc.send_message(sock0, obj, compress)
+        received = brpc.recv_message(sock1)
+    assert received['bytes'] == obj['bytes']
+    assert received['binary'] == b'abc'
+    assert received['int'] == 3 and received['float'] == 1.5 and received['none'] is None
+    assert np.array_equal(received['list'][0], obj['list'][0]) and received['list'][1] == [1, 'a']
+    assert received['complex'].dtype == np.complex128
+    assert np.array_equal(received['complex'], obj['complex'])
+    assert [desc['zlib'] for desc in decoded] == [bool(compress), False, False, bool(compress)]
+
+@pytest.mark.parametrize('compress', [0, 9])
+def test_client_roundtrip(server, decoded, compress):
+    client = BinaryCircuitRunnerClient(unix_socket=server.server_address, compress=compress)
+    rawasm = make_rawasm()
+    client.load_circuit(rawasm)
+    check_rawasm(server.runner.rawasm, rawasm)
+    check_rawasm(client._call('get_rawasm'), rawasm)
+    assert any(desc['zlib'] for desc in decoded) == bool(compress)
+
+    s11 = client.run_circuit(2*brpc.MIN_COMPRESS_SIZE, 2, 1.e-3)
+    expected = server.runner.run_circuit(2*brpc.MIN_COMPRESS_SIZE, 2, 1.e-3)
+    assert s11.keys() == expected.keys()
+    for chan in expected.keys():
+        assert s11[chan].dtype == np.complex128
+        assert np.array_equal(s11[chan], expected[chan])
+
+    s11 = client.run_circuit_batch([b'\x00', b'\x00\x00'], 10, 3)
+    assert s11['0'].shape == (2, 10, 3)
+    assert np.array_equal(s11['0'].real[:, 0, 0], [1, 2])
+
+    job_id = client.submit([b'\x00']*3, 10, 3)
+    t0 = time.perf_counter()
+    while client.status(job_id)['status'] != 'done':
+        assert time.perf_counter() - t0 < 5
+        time.sleep(1.e-3)
+    assert client.fetch(job_id, 1)['0'].shape == (2, 10, 3)
+    client.cancel(job_id)
+    with pytest.raises(Exception, match='status failed on server: ValueError'):
+        client.status(job_id)
+    client.close()
+
+def test_client_errors(server):
+    client = BinaryCircuitRunnerClient(unix_socket=server.server_address)
+    with pytest.raises(Exception, match='unsupported method: invalidate_bram_shadow'):
+        client._call('invalidate_bram_shadow')
+    assert server.runner.n_invalidated == 0
+    with pytest.raises(Exception, match='run_circuit failed on server: ValueError: n_total_shots must be positive'):
+        client.run_circuit(0)
+    with pytest.raises(Exception, match='TypeError'):
+        client._call('run_circuit', 10, unknown_kwarg=1)
+
+    # connection is still usable after an error
+    assert client.run_circuit(1)['0'].shape == (1, 1)
+    client.close()
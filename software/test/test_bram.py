@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+from qubic.rfsoc.bram import changed_ranges
+
+@pytest.mark.parametrize('changed, ranges', [([], []),
+                                             ([False]*5, []),
+                                             ([True]*5, [[0, 5]]),
+                                             ([True], [[0, 1]]),
+                                             ([True, True, False, False, False], [[0, 2]]),
+                                             ([False, False, False, True, True], [[3, 5]]),
+                                             ([True, False, True, False, True], [[0, 1], [2, 3], [4, 5]]),
+                                             ([False, True, True, False, True, True, True, False], [[1, 3], [4, 7]])])
+def test_changed_ranges(changed, ranges):
+    result = changed_ranges(np.array(changed, dtype=bool))
+    assert result.shape == (len(ranges), 2)
+    assert np.all(result == np.array(ranges, dtype=int).reshape((-1, 2)))
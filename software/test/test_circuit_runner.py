@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+def get_bram(runner, bufname):
+    bram_cfg = runner._pl_driver.bram_cfgs[bufname]
+    return runner._pl_driver.overlay.bramctrl.mmio.array[bram_cfg.address : bram_cfg.address + bram_cfg.length]
+
+def count_writes(runner):
+    """
+    Wrap runner's BRAM writes to count the number of words written
+    """
+    n_written = [0]
+    write_words = runner._pl_driver.write_words
+    def counting_write_words(addr, words):
+        n_written[0] += len(words)
+        write_words(addr, words)
+    runner._pl_driver.write_words = counting_write_words
+    return n_written
+
+def test_diff_load(mock_runner):
+    runners = [mock_runner(diff_load=True), mock_runner(diff_load=False)]
+    n_written = count_writes(runners[0])
+    bufname = 'qdrvenv0'
+    rng = np.random.default_rng(0)
+    buf = rng.integers(0, 2**32, 1000, dtype=np.uint32)
+
+    def write(words, start_addr=0):
+        n_prev = n_written[0]
+        for runner in runners:
+            runner._write_buffer(bufname, *runner._pl_driver.stage_mem_buf(bufname, words, start_addr))
+        assert np.all(get_bram(runners[0], bufname) == get_bram(runners[1], bufname))
+        return n_written[0] - n_prev
+
+    assert write(buf) == 1000
+    assert np.all(get_bram(runners[0], bufname)[:1000] == buf)
+    assert write(buf) == 0 # same hash
+
+    partial = buf[:100].copy()
+    partial[[0, 10, 11, 99]] += 1
+    assert write(partial) == 4
+
+    overlap = rng.integers(0, 2**32, 200, dtype=np.uint32)
+    assert write(overlap, 50) == 200
+    assert write(overlap, 50) == 0
+    assert write(partial) == 50
+    assert write(overlap[:10], 49) == 10 # offset by one, so every word changes
+
+    changed = buf.copy()
+    changed[[0, 500, 999]] = 0
+    for runner in runners:
+        runner.load_env_buf('qdrv', 0, changed.tobytes())
+    assert np.all(get_bram(runners[0], bufname) == get_bram(runners[1], bufname))
+    assert np.all(get_bram(runners[0], bufname)[:1000] == changed)
+
+    # writes that bypass the runner are only picked up after invalidating the shadow
+    for runner in runners:
+        runner._pl_driver.write_mem_buf(bufname, buf)
+    runners[0].invalidate_bram_shadow()
+    assert write(changed) == 1000
+    assert np.all(get_bram(runners[0], bufname)[:1000] == changed)
+
+def test_diff_load_cmd_bufs(mock_runner):
+    runners = [mock_runner(diff_load=True), mock_runner(diff_load=False)]
+    rng = np.random.default_rng(1)
+    cmd_bufs = [rng.integers(0, 2**32, 4*n_cmds, dtype=np.uint32).tobytes() for n_cmds in [20, 5, 20]]
+    for runner in runners:
+        runner.load_command_buf('0', cmd_bufs[0])
+        runner.zero_command_buf()
+        runner.load_command_buf('0', cmd_bufs[1])
+        runner.load_command_buf('1', cmd_bufs[2])
+        runner.zero_command_buf(['0'])
+        runner.load_command_buf('0', cmd_bufs[2])
+    for core in range(runners[0]._pl_driver.nproc):
+        assert np.all(get_bram(runners[0], 'command{}'.format(core)) == get_bram(runners[1], 'command{}'.format(core)))
+    assert runners[0].loaded_channels == runners[1].loaded_channels == ['1', '0']
@@ -0,0 +1,123 @@
+import threading
+import time
+import numpy as np
+import pytest
+from qubic.job_queue import RunnerJobQueue
+
+class StubRunner:
+    """
+    Runner that yields constant results (equal to each raw_asm value), one
+    circuit per call to step() (or immediately if blocking is False)
+    """
+    def __init__(self, blocking=False):
+        self.blocking = blocking
+        self._steps = threading.Semaphore(0)
+
+    def step(self, n=1):
+        for i in range(n):
+            self._steps.release()
+
+    def iter_circuit_batch(self, raw_asm_list, n_total_shots, reads_per_shot=1, **kwargs):
+        for raw_asm in raw_asm_list:
+            if self.blocking:
+                assert self._steps.acquire(timeout=5)
+            if raw_asm == 'error':
+                raise ValueError('invalid circuit')
+            yield {'0': np.full((n_total_shots, reads_per_shot), raw_asm, dtype=np.complex128)}
+
+def wait_for(cond, timeout=5.):
+    t0 = time.perf_counter()
+    while not cond():
+        assert time.perf_counter() - t0 < timeout
+        time.sleep(1.e-3)
+
+def test_submit_fetch():
+    runner = StubRunner(blocking=True)
+    job_queue = RunnerJobQueue(runner)
+    job_id = job_queue.submit([1, 2, 3], 10, 2)
+    runner.step()
+    wait_for(lambda: job_queue.status(job_id)['n_done'] == 1)
+    assert job_queue.status(job_id)['status'] == 'running'
+    assert job_queue.fetch(job_id)['0'].shape == (1, 10, 2)
+
+    runner.step(2)
+    wait_for(lambda: job_queue.status(job_id)['status'] == 'done')
+    status = job_queue.status(job_id)
+    assert status == {'status': 'done', 'n_circuits': 3, 'n_done': 3, 'shot_shape': [10, 2], 'error': None}
+    s11 = job_queue.fetch(job_id)
+    assert s11['0'].shape == (3, 10, 2)
+    assert np.all(s11['0'] == np.array([1, 2, 3])[:, None, None])
+    assert np.all(job_queue.fetch(job_id, 1, 2)['0'] == 2)
+    assert job_queue.fetch(job_id, 3) == {}
+    assert job_queue.fetch(job_id, from_server=True)['0'] == s11['0'].tobytes()
+
+def test_error():
+    job_queue = RunnerJobQueue(StubRunner())
+    job_id = job_queue.submit([1, 'error', 3], 10)
+    wait_for(lambda: job_queue.status(job_id)['status'] == 'error')
+    status = job_queue.status(job_id)
+    assert status['n_done'] == 1
+    assert 'invalid circuit' in status['error']
+    assert job_queue.fetch(job_id)['0'].shape == (1, 10, 1)
+
+def test_cancel():
+    runner = StubRunner(blocking=True)
+    job_queue = RunnerJobQueue(runner)
+    running_id = job_queue.submit([1, 2, 3], 10)
+    queued_id = job_queue.submit([4], 10)
+    wait_for(lambda: job_queue.status(running_id)['status'] == 'running')
+
+    assert job_queue.cancel(queued_id) == 'cancelled'
+    job_queue.cancel(running_id)
+    runner.step()
+    wait_for(lambda: job_queue.status(running_id)['status'] == 'cancelled')
+    assert job_queue.status(running_id)['n_done'] == 1
+    assert np.all(job_queue.fetch(running_id)['0'] == 1)
+    assert job_queue.status(queued_id)['n_done'] == 0
+
+    # cancelling a finished job discards it
+    assert job_queue.cancel(running_id) == 'cancelled'
+    with pytest.raises(ValueError):
+        job_queue.status(running_id)
+    with pytest.raises(ValueError):
+        job_queue.fetch(12345)
+
+def test_queue_full():
+    runner = StubRunner(blocking=True)
+    job_queue = RunnerJobQueue(runner, maxsize=2)
+    running_id = job_queue.submit([0], 10)
+    wait_for(lambda: job_queue.status(running_id)['status'] == 'running')
+    queued_ids = [job_queue.submit([i], 10) for i in range(1, 3)]
+    with pytest.raises(Exception, match='full'):
+        job_queue.submit([3], 10)
+
+    runner.step(3)
+    wait_for(lambda: job_queue.status(queued_ids[-1])['status'] == 'done')
+    job_queue.submit([3], 10)
+
+def test_eviction():
+    job_queue = RunnerJobQueue(StubRunner(), max_finished=2)
+    job_ids = [job_queue.submit([i], 10) for i in range(5)]
+    job_ids.append(job_queue.submit(['error'], 10))
+    wait_for(lambda: job_queue.status(job_ids[-2])['status'] == 'done')
+    wait_for(lambda: job_queue._finished.get(job_ids[-1]) is not None)
+
+    # nothing is discarded until it has been retrieved
+    for job_id in job_ids[:5]:
+        assert job_queue.status(job_id)['status'] == 'done'
+        job_queue.fetch(job_id, 0, 0)
+
+    for job_id in job_ids[:2]:
+        assert np.all(job_queue.fetch(job_id)['0'] == job_id)
+    assert np.all(job_queue.fetch(job_ids[0])['0'] == job_ids[0]) # retrieved jobs can be fetched again
+    job_queue.fetch(job_ids[2])
+    with pytest.raises(ValueError):
+        job_queue.status(job_ids[0])
+    assert job_queue.status(job_ids[1])['status'] == 'done'
+
+    # jobs without results are retrieved by reading their final status
+    assert job_queue.status(job_ids[5])['status'] == 'error'
+    with pytest.raises(ValueError):
+        job_queue.status(job_ids[1])
+    for job_id in job_ids[2:]:
+        job_queue.status(job_id)
@@ -0,0 +1,62 @@
+import time
+import numpy as np
+import pytest
+import qubic.rfsoc.pl_interface as pl
+
+def check_acc(acc_iq, run_ind, nshots):
+    for chan, acc in acc_iq.items():
+        assert np.all(acc.imag == run_ind)
+        assert np.all(acc.real == np.arange(nshots))
+
+def test_run_prog_acc_poll_instant_rerun(mock_pl):
+    pl_driver = mock_pl(reset_lag=0, shot_reads=0)
+    for run_ind in range(1, 4):
+        t0 = time.perf_counter()
+        acc_iq = pl_driver.run_prog_acc([0, 1], 1, poll=True, timeout=0.1)
+        assert time.perf_counter() - t0 < 0.1
+        check_acc(acc_iq, run_ind, 1)
+    assert len(pl_driver.run_times) == 3
+
+def test_run_prog_acc_poll_delayed_reset(mock_pl):
+    pl_driver = mock_pl(reset_lag=5, shot_reads=3)
+    for run_ind in range(1, 4):
+        acc_iq = pl_driver.run_prog_acc([0], 10, poll=True, poll_interval=0)
+        check_acc(acc_iq, run_ind, 10)
+
+    acc_iq = pl_driver.run_prog_acc([0], 10, poll=True, poll_interval=0, done_reg='lastshotdone')
+    check_acc(acc_iq, 4, 10)
+
+def test_run_prog_acc_poll_timeout(mock_pl):
+    pl_driver = mock_pl(reset_lag=0, shot_reads=10**9)
+    with pytest.raises(TimeoutError):
+        pl_driver.run_prog_acc([0], 10, poll=True, poll_interval=0, timeout=0.01)
+
+def test_run_prog_acc_delay(mock_pl):
+    pl_driver = mock_pl(reset_lag=0, shot_reads=0)
+    for run_ind in range(1, 3):
+        check_acc(pl_driver.run_prog_acc([0], 1, delay=0), run_ind, 1)
+    assert pl_driver.overlay.dspregs.mmio.n_status_reads == 0
+
+def run_stream(pl_driver, chanlist, nshots, reads_per_shot=1):
+    chunks = list(pl_driver.run_prog_acc_stream(chanlist, nshots, reads_per_shot, poll_interval=0, timeout=0.1))
+    return {chan: np.concatenate([chunk[chan] for chunk in chunks]) for chan in chanlist}
+
+@pytest.mark.parametrize('reads_per_shot', [1, 3])
+def test_run_prog_acc_stream(mock_pl, reads_per_shot):
+    pl_driver = mock_pl(reset_lag=5, shot_reads=2, acc_per_shot=reads_per_shot)
+    nshots = 3*pl_driver.get_acc_depth(0)
+    for run_ind in range(1, 3):
+        acc_iq = run_stream(pl_driver, [0, 1], nshots, reads_per_shot)
+        for chan in [0, 1]:
+            assert np.all(acc_iq[chan].imag == run_ind)
+            assert np.all(acc_iq[chan].real == np.repeat(np.arange(nshots), reads_per_shot))
+
+def test_run_prog_acc_stream_no_wrap(mock_pl):
+    pl_driver = mock_pl(reset_lag=1, shot_reads=2, wrap=False)
+    with pytest.raises(Exception, match='wraps'):
+        run_stream(pl_driver, [0], 2*pl_driver.get_acc_depth(0))
+
+def test_run_prog_acc_stream_no_addr_mon(mock_pl):
+    pl_driver = mock_pl()
+    with pytest.raises(ValueError):
+        run_stream(pl_driver, [5], 10)
@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import pytest
+import qubic.rfsoc.hwconfig as hw
+import qubic.toolchain as tc
+import qubitconfig.qchip as qc
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../distributed_processor/python/test')
+FPGA_CONFIG = {'alu_instr_clks': 2,
+               'fpga_clk_period': 2.e-9,
+               'jump_cond_clks': 3,
+               'jump_fproc_clks': 4,
+               'pulse_regwrite_clks': 1}
+PROGRAM = [{'name': 'X90', 'qubit': ['Q0']},
+           {'name': 'virtualz', 'qubit': ['Q0'], 'phase': 0.3},
+           {'name': 'X90', 'qubit': ['Q1']},
+           {'name': 'read', 'qubit': ['Q0']}]
+
+@pytest.fixture
+def qchip():
+    return qc.QChip(os.path.join(CONFIG_DIR, 'qubitcfg.json'))
+
+@pytest.fixture
+def fpga_config():
+    return hw.FPGAConfig(**FPGA_CONFIG)
+
+def program_hash(compiled_prog):
+    return tc._hash(compiled_prog.program)
+
+def test_compile_cache_gate_update(qchip, fpga_config):
+    cache = tc.CompileCache()
+    compiled_prog = tc.run_compile_stage(PROGRAM, fpga_config, qchip, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert program_hash(tc.run_compile_stage(PROGRAM, fpga_config, qchip, cache=cache)) == program_hash(compiled_prog)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # unreferenced gate
+    qchip.update(('Gates', 'Q2X90', 0, 'amp'), 0.3)
+    assert program_hash(tc.run_compile_stage(PROGRAM, fpga_config, qchip, cache=cache)) == program_hash(compiled_prog)
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # referenced gate
+    qchip.update(('Gates', 'Q1X90', 0, 'amp'), 0.3)
+    updated_prog = tc.run_compile_stage(PROGRAM, fpga_config, qchip, cache=cache)
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert program_hash(updated_prog) != program_hash(compiled_prog)
+    assert program_hash(updated_prog) == program_hash(tc.run_compile_stage(PROGRAM, fpga_config, qchip))
+
+    qchip.update(('Qubits', 'Q0', 'freq'), 5.e9)
+    tc.run_compile_stage(PROGRAM, fpga_config, qchip, cache=cache)
+    assert (cache.hits, cache.misses) == (2, 3)
+
+def test_compile_cache_copies(qchip, fpga_config, tmp_path):
+    cache = tc.CompileCache(cache_dir=str(tmp_path))
+    compiled_prog = tc.run_compile_stage(PROGRAM, fpga_config, qchip)
+    prog_hash = program_hash(compiled_prog)
+
+    built_prog = tc.run_compile_stage(PROGRAM, fpga_config, qchip, cache=cache)
+    for cached_cache in [cache, tc.CompileCache(cache_dir=str(tmp_path))]:
+        for i in range(2):
+            cached_prog = tc.run_compile_stage(PROGRAM, fpga_config, qchip, cache=cached_cache)
+            assert cached_prog is not built_prog
+            assert program_hash(cached_prog) == prog_hash
+            # modifying a returned program in place doesn't affect the cache
+            for statements in cached_prog.program.values():
+                statements.insert(1, {'op': 'declare_reg', 'name': 'phase', 'dtype': ('phase', 0)})
+        built_prog.program.clear()
+
+    channel_configs = hw.load_channel_configs(os.path.join(CONFIG_DIR, 'channel_config.json'))
+    raw_asm = tc.run_assemble_stage(compiled_prog, channel_configs, cache=cache)
+    for core_asm in raw_asm.values():
+        core_asm['cmd_buf'] = b''
+    assert tc.run_assemble_stage(compiled_prog, channel_configs, cache=cache) == tc.run_assemble_stage(
+            compiled_prog, channel_configs)